@@ -0,0 +1,187 @@
+'''
+Partitioned Parquet store for tardis trades and the bars built from them, written by the bar
+builders (tardis_trades_to_vb.py, tardis_trades_to_mbar.py) next to their CSV files:
+
+    store/trades/symbol=<SYMBOL>/date=<YYYYMMDD>/part-0.parquet
+    store/<kind>/symbol=<SYMBOL>/bar_size=<size>/date=<YYYYMMDD>/part-0.parquet    (kind: vb, mbar)
+
+Timestamps are int64 microseconds since the epoch (UTC), prices and volumes float64, counts
+int64 and trade sides int8 (SIDE_BUY, SIDE_SELL, 0 for unknown). A bar is stored under the
+date of the trades file it closed in (usually, not always, the date of its close timestamp).
+
+load_bars only opens the date partitions of the requested range and pushes the exact
+[start, end) filter on the close timestamp down to the Parquet row groups. It returns the
+columns of the CSV files (with localTimestamp and, for volume bars, timestamp equal to
+closeTimestamp) and the timestamps as datetime64, so pd.to_datetime on them is a no-op.
+
+Load time of a bar CSV file against the store:
+    python bar_store.py --benchmark <store root> <vb|mbar> <symbol> <bar size> <csv file> [start] [end]
+'''
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+TRADE_SCHEMA = pa.schema([('ts', pa.int64()), ('price', pa.float64()), ('size', pa.float64()), ('side', pa.int8())])
+
+BAR_SCHEMA = pa.schema([('open', pa.float64()), ('high', pa.float64()), ('low', pa.float64()),
+                        ('close', pa.float64()), ('volume', pa.float64()), ('buyVolume', pa.float64()),
+                        ('sellVolume', pa.float64()), ('buys', pa.int64()), ('sells', pa.int64()),
+                        ('trades', pa.int64()), ('vwap', pa.float64()), ('openTimestamp', pa.int64()),
+                        ('closeTimestamp', pa.int64())])
+
+# bar dict keys (see compute_volume_bars, compute_time_bars) for the stored columns
+BAR_KEYS = ['open', 'high', 'low', 'close', 'volume', 'buy_volume', 'sell_volume', 'buys', 'sells', 'trades',
+            'vwap', 'open_ts', 'close_ts']
+
+# a day of 1s bars or ~1.5M trades is a handful of row groups, enough for the timestamp
+# filter to skip most of a partial first or last day
+ROW_GROUP_SIZE = 256 * 1024
+
+DAY_US = 86_400_000_000
+
+
+def get_trades_dir(s_root, s_symbol):
+    return os.path.join(s_root, 'trades', f'symbol={s_symbol}')
+
+
+def get_bars_dir(s_root, s_kind, s_symbol, i_bar_size):
+    return os.path.join(s_root, s_kind, f'symbol={s_symbol}', f'bar_size={i_bar_size}')
+
+
+def get_partition_file(s_dir, s_date):
+    return os.path.join(s_dir, f'date={pd.Timestamp(s_date).strftime("%Y%m%d")}', 'part-0.parquet')
+
+
+def write_partition(s_file, o_table):
+    # written aside and renamed, readers never see half a partition
+    os.makedirs(os.path.dirname(s_file), exist_ok=True)
+    pq.write_table(o_table, s_file + '.tmp', row_group_size=ROW_GROUP_SIZE)
+    os.replace(s_file + '.tmp', s_file)
+
+
+def write_trades(s_root, s_symbol, s_date, a_ts, a_price, a_size, a_side):
+    o_table = pa.Table.from_arrays([pa.array(a_ts, pa.int64()), pa.array(a_price, pa.float64()),
+                                    pa.array(a_size, pa.float64()), pa.array(a_side, pa.int8())],
+                                   schema=TRADE_SCHEMA)
+    write_partition(get_partition_file(get_trades_dir(s_root, s_symbol), s_date), o_table)
+
+
+def load_day_trades(s_root, s_symbol, s_date):
+    # (a_ts, a_price, a_size, a_side) of a day, None if it is not in the store
+    s_file = get_partition_file(get_trades_dir(s_root, s_symbol), s_date)
+    if not os.path.exists(s_file):
+        return None
+    o_table = pq.read_table(s_file)
+    return tuple(o_table.column(s_name).to_numpy() for s_name in TRADE_SCHEMA.names)
+
+
+def write_bars(s_root, s_kind, s_symbol, i_bar_size, s_date, d_bars):
+    o_table = pa.Table.from_arrays([pa.array(np.asarray(d_bars[s_key]).astype(o_field.type.to_pandas_dtype()))
+                                    for s_key, o_field in zip(BAR_KEYS, BAR_SCHEMA)], schema=BAR_SCHEMA)
+    write_partition(get_partition_file(get_bars_dir(s_root, s_kind, s_symbol, i_bar_size), s_date), o_table)
+
+
+def get_epoch_us(s_time):
+    o_time = pd.Timestamp(s_time)
+    if o_time.tzinfo is not None:
+        o_time = o_time.tz_convert('UTC').tz_localize(None)
+    return o_time.value // 1000
+
+
+def get_date_int(i_epoch_us):
+    return int(pd.Timestamp(i_epoch_us, unit='us').strftime('%Y%m%d'))
+
+
+def get_bar_files(s_root, s_kind, s_symbol, i_bar_size, s_start=None, s_end=None):
+    # the date partitions that may hold bars closing in [s_start, s_end), in date order
+    s_dir = get_bars_dir(s_root, s_kind, s_symbol, i_bar_size)
+    if not os.path.isdir(s_dir):
+        raise FileNotFoundError(f"no {s_kind} bars of size {i_bar_size} for {s_symbol} in {s_root}")
+
+    # a bar closing on a late or early trade around midnight is in the partition of the
+    # day next to its close timestamp, hence a day of margin
+    i_start_date = 0 if s_start is None else get_date_int(get_epoch_us(s_start) - DAY_US)
+    i_end_date = 99999999 if s_end is None else get_date_int(get_epoch_us(s_end) + DAY_US)
+    ls_files = []
+    for s_partition in sorted(os.listdir(s_dir)):
+        if s_partition.startswith('date=') and i_start_date <= int(s_partition[len('date='):]) <= i_end_date:
+            ls_files.append(os.path.join(s_dir, s_partition, 'part-0.parquet'))
+    return ls_files
+
+
+def load_bars(s_root, s_kind, s_symbol, i_bar_size, s_start=None, s_end=None, ls_columns=None):
+    # bars closing in [s_start, s_end), either bound may be None
+    # (the date partitions prune whole files, the timestamp filter row groups and rows)
+    ls_files = get_bar_files(s_root, s_kind, s_symbol, i_bar_size, s_start, s_end)
+    o_filter = None
+    if s_start is not None:
+        o_filter = ds.field('closeTimestamp') >= get_epoch_us(s_start)
+    if s_end is not None:
+        o_term = ds.field('closeTimestamp') < get_epoch_us(s_end)
+        o_filter = o_term if o_filter is None else o_filter & o_term
+
+    ls_read_columns = None
+    if ls_columns is not None:
+        ls_read_columns = [s_name for s_name in BAR_SCHEMA.names if s_name in ls_columns]
+        if 'localTimestamp' in ls_columns or 'timestamp' in ls_columns:
+            ls_read_columns.append('closeTimestamp')
+        ls_read_columns = list(dict.fromkeys(ls_read_columns))
+
+    o_dataset = ds.dataset(ls_files, schema=BAR_SCHEMA, format='parquet')
+    df_bars = o_dataset.to_table(columns=ls_read_columns, filter=o_filter).to_pandas()
+
+    for s_name in ['openTimestamp', 'closeTimestamp']:
+        if s_name in df_bars:
+            df_bars[s_name] = pd.to_datetime(df_bars[s_name].to_numpy(), unit='us')
+    if 'closeTimestamp' in df_bars:
+        ls_aliases = ['timestamp', 'localTimestamp'] if s_kind == 'vb' else ['localTimestamp']
+        for s_name in ls_aliases:
+            if ls_columns is None or s_name in ls_columns:
+                df_bars[s_name] = df_bars['closeTimestamp']
+    if ls_columns is not None:
+        df_bars = df_bars[[s_name for s_name in ls_columns if s_name in df_bars]]
+    return df_bars
+
+
+def load_bar_csv(s_file, s_start=None, s_end=None):
+    # the path the research scripts take without the store, for the benchmark
+    df_bars = pd.read_csv(s_file)
+    df_bars['ts_local'] = pd.to_datetime(df_bars['localTimestamp'])
+    if s_start is not None:
+        df_bars = df_bars[df_bars['ts_local'] >= pd.to_datetime(s_start)]
+    if s_end is not None:
+        df_bars = df_bars[df_bars['ts_local'] < pd.to_datetime(s_end)]
+    df_bars['ts_close'] = pd.to_datetime(df_bars['closeTimestamp'])
+    df_bars['ts_open'] = pd.to_datetime(df_bars['openTimestamp'])
+    return df_bars
+
+
+def load_bar_store(s_root, s_kind, s_symbol, i_bar_size, s_start=None, s_end=None):
+    df_bars = load_bars(s_root, s_kind, s_symbol, i_bar_size, s_start, s_end)
+    df_bars['ts_local'] = pd.to_datetime(df_bars['localTimestamp'])
+    df_bars['ts_close'] = pd.to_datetime(df_bars['closeTimestamp'])
+    df_bars['ts_open'] = pd.to_datetime(df_bars['openTimestamp'])
+    return df_bars
+
+
+def benchmark_load(s_root, s_kind, s_symbol, i_bar_size, s_csv_file, s_start=None, s_end=None, i_repeat=3):
+    for s_name, f_load in (('csv', lambda: load_bar_csv(s_csv_file, s_start, s_end)),
+                           ('parquet', lambda: load_bar_store(s_root, s_kind, s_symbol, i_bar_size, s_start, s_end))):
+        ls_times = []
+        for _ in range(i_repeat):
+            f_time = time.perf_counter()
+            df_bars = f_load()
+            ls_times.append(time.perf_counter() - f_time)
+        print(f"{s_name}: {len(df_bars)} bars in {min(ls_times):.3f}s (best of {i_repeat})")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        benchmark_load(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]), sys.argv[6],
+                       *(sys.argv[7:9]))
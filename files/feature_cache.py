@@ -0,0 +1,73 @@
+'''
+On-disk cache of the bar features derived by the VB research scripts (vb_expectancy.py,
+src/vb_v8_short_term_reverse_logic_basic.py) in load_data.
+
+A frame is stored as <cache dir>/<key>.arrow, an uncompressed Arrow IPC file that is
+memory-mapped when read. The key is a sha256 over the contents of the source files (the bar
+CSV file or the store partitions), the code of the functions that read and derive the bars and
+a dict of everything else they depend on (date range, split, duration, consecutive, rolling
+windows), so a change to any of them derives the features again. Frames with old keys are
+never read again; delete the directory to get the space back.
+'''
+
+import hashlib
+import inspect
+import json
+import os
+
+import pyarrow as pa
+
+HASH_CHUNK = 1 << 20
+
+# (file, size, mtime) -> content digest, a file is hashed once per process
+file_digests = {}
+
+
+def get_file_digest(s_file):
+    o_stat = os.stat(s_file)
+    t_stat_key = (os.path.abspath(s_file), o_stat.st_size, o_stat.st_mtime_ns)
+    if t_stat_key not in file_digests:
+        o_hash = hashlib.sha256()
+        with open(s_file, 'rb') as o_file:
+            for by_chunk in iter(lambda: o_file.read(HASH_CHUNK), b''):
+                o_hash.update(by_chunk)
+        file_digests[t_stat_key] = o_hash.hexdigest()
+    return file_digests[t_stat_key]
+
+
+def get_feature_key(ls_source_files, ls_functions, d_params):
+    o_hash = hashlib.sha256()
+    for s_file in ls_source_files:
+        o_hash.update(get_file_digest(s_file).encode())
+    for f_function in ls_functions:
+        o_hash.update(inspect.getsource(f_function).encode())
+    o_hash.update(json.dumps(d_params, sort_keys=True, default=str).encode())
+    return o_hash.hexdigest()
+
+
+def write_frame(s_file, df):
+    os.makedirs(os.path.dirname(s_file) or '.', exist_ok=True)
+    o_table = pa.Table.from_pandas(df)
+    with pa.OSFile(s_file + '.tmp', 'wb') as o_sink:
+        with pa.ipc.new_file(o_sink, o_table.schema) as o_writer:
+            o_writer.write_table(o_table)
+    os.replace(s_file + '.tmp', s_file)
+
+
+def read_frame(s_file):
+    with pa.memory_map(s_file) as o_source:
+        return pa.ipc.open_file(o_source).read_all().to_pandas()
+
+
+def load_features(s_cache_dir, ls_source_files, ls_functions, d_params, f_derive):
+    '''
+    The frame f_derive() returns, from the cache when ls_source_files, the code of ls_functions
+    (what f_derive runs) and d_params are those of a previous call.
+    '''
+    s_file = os.path.join(s_cache_dir, get_feature_key(ls_source_files, ls_functions, d_params) + '.arrow')
+    if os.path.exists(s_file):
+        print(f"Using cached features {s_file}")
+        return read_frame(s_file)
+    df = f_derive()
+    write_frame(s_file, df)
+    return df
@@ -0,0 +1,126 @@
+'''
+Moving averages of techind.py in O(n) per series and O(period) per new value.
+
+ema is the recursion of pandas ewm(span=period, adjust=False).mean(), step for step, so it gives
+the same floats (NaN included). wma and sma are correlations with the window weights, equal to
+the rolling().apply/rolling().mean() of techind up to rounding. hma is techind's: the wma of
+half and full period combined, then smoothed by an sma of sqrt(period) values.
+
+IndicatorState keeps what the next value needs, so the indicators of a new daily bar are
+computed from the last values only, with the same floats as over the whole series.
+'''
+
+from collections import deque
+
+import numba
+import numpy as np
+
+
+def get_alpha(period):
+    # pandas' alpha for span=period
+    return 1. / (1. + (period - 1) / 2.)
+
+
+@numba.njit(cache=True)
+def ema_step(f_ema, f_old_weight, f_value, f_alpha):
+    # (ema, old weight) after f_value, starting from (nan, 1.)
+    if f_ema == f_ema:
+        f_old_weight *= 1. - f_alpha
+        if f_value == f_value:
+            # (pandas keeps a constant series as is)
+            if f_ema != f_value:
+                f_ema = ((f_old_weight * f_ema) + (f_alpha * f_value)) / (f_old_weight + f_alpha)
+            f_old_weight = 1.
+    elif f_value == f_value:
+        f_ema = f_value
+    return f_ema, f_old_weight
+
+
+@numba.njit(cache=True)
+def ema_kernel(a_values, f_alpha):
+    a_ema = np.empty(len(a_values))
+    f_ema = np.nan
+    f_old_weight = 1.
+    for i in range(len(a_values)):
+        f_ema, f_old_weight = ema_step(f_ema, f_old_weight, a_values[i], f_alpha)
+        a_ema[i] = f_ema
+    return a_ema
+
+
+def ema(a_values, period):
+    return ema_kernel(np.asarray(a_values, dtype=np.float64), get_alpha(period))
+
+
+def dema(a_values, period):
+    a_ema = ema(a_values, period)
+    return a_ema * 2 - ema(a_ema, period)
+
+
+def get_weighted_means(a_values, a_weights):
+    # sum(window * a_weights) / sum(a_weights) of every window, nan before the first full window
+    a_values = np.asarray(a_values, dtype=np.float64)
+    a_means = np.full(len(a_values), np.nan)
+    if len(a_values) >= len(a_weights):
+        a_means[len(a_weights) - 1:] = np.correlate(a_values, a_weights, 'valid') / a_weights.sum()
+    return a_means
+
+
+def get_wma_weights(period):
+    return np.arange(1, period + 1, dtype=np.float64)
+
+
+def get_hma_smoothing(period):
+    return int(np.sqrt(period))
+
+
+def wma(a_values, period):
+    return get_weighted_means(a_values, get_wma_weights(period))
+
+
+def sma(a_values, period):
+    return get_weighted_means(a_values, np.ones(period))
+
+
+def hma(a_values, period):
+    a_diff = 2 * wma(a_values, period // 2) - wma(a_values, period)
+    return sma(a_diff, get_hma_smoothing(period))
+
+
+class IndicatorState:
+    '''
+    ema, dema and hma of a period, updated one value at a time. After update() of every value of
+    a series the values are those of ema/dema/hma at its last element.
+    '''
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = get_alpha(period)
+        self.ema = np.nan
+        self.ema_old_weight = 1.
+        self.ema_of_ema = np.nan
+        self.ema_of_ema_old_weight = 1.
+        self.dema = np.nan
+        self.hma = np.nan
+        self.a_half_weights = get_wma_weights(period // 2)
+        self.a_full_weights = get_wma_weights(period)
+        self.values = deque(maxlen=period)
+        self.diffs = deque(maxlen=get_hma_smoothing(period))
+
+    def update(self, f_value):
+        self.ema, self.ema_old_weight = ema_step(self.ema, self.ema_old_weight, float(f_value), self.alpha)
+        self.ema_of_ema, self.ema_of_ema_old_weight = ema_step(self.ema_of_ema, self.ema_of_ema_old_weight,
+                                                               self.ema, self.alpha)
+        self.dema = self.ema * 2 - self.ema_of_ema
+
+        self.values.append(float(f_value))
+        a_values = np.array(self.values)
+        f_diff = 2 * get_weighted_means(a_values[-len(self.a_half_weights):], self.a_half_weights)[-1] - \
+            get_weighted_means(a_values, self.a_full_weights)[-1]
+        self.diffs.append(f_diff)
+        self.hma = get_weighted_means(np.array(self.diffs), np.ones(self.diffs.maxlen))[-1]
+        return self
+
+    def update_all(self, a_values):
+        for f_value in a_values:
+            self.update(f_value)
+        return self
@@ -0,0 +1,138 @@
+'''
+NumPy helpers shared by the tardis bar builders (tardis_trades_to_vb.py, tardis_trades_to_mbar.py).
+
+TradeBarComputable accumulates volume, buy/sell volume and vwap one trade at a time. Pairwise
+sums (np.sum, np.add.reduceat) round differently, so the per-bar accumulations here keep the
+per-trade order: either one cumsum per bar, or one step per trade position across all bars at
+once (bar j's k-th trade is added at step k), whichever needs fewer NumPy calls. Both give the
+exact floats of the per-trade code.
+'''
+
+import numpy as np
+import pandas as pd
+
+SIDE_BUY = 1
+SIDE_SELL = -1
+
+# only what the bar builders use, parsed straight to its final type (side as a category,
+# so a chunk holds a few codes instead of a python string per trade)
+TRADE_CSV_DTYPES = {'local_timestamp': np.int64, 'side': 'category', 'price': np.float64, 'amount': np.float64}
+
+# trades per chunk of iter_trade_file_arrays, ~25 bytes each once converted
+CHUNK_ROWS = 1_000_000
+
+# rough cost of a python loop iteration over a trade against a NumPy call, used to pick the
+# vwap strategy
+LOOP_CALLS_PER_TRADE = 1 / 80
+
+
+def get_trade_arrays(df_trade_data):
+    a_ts = df_trade_data['ts_event'].to_numpy(dtype=np.int64)
+    a_price = df_trade_data['price'].to_numpy(dtype=np.float64)
+    a_size = df_trade_data['size'].to_numpy(dtype=np.float64)
+    a_side_str = df_trade_data['side'].to_numpy()
+    a_side = np.where(a_side_str == 'buy', SIDE_BUY, np.where(a_side_str == 'sell', SIDE_SELL, 0)).astype(np.int8)
+    return a_ts, a_price, a_size, a_side
+
+
+def iter_trade_file_arrays(s_file, i_chunk_rows=CHUNK_ROWS):
+    '''
+    Streams a tardis trades file as (a_ts, a_price, a_size, a_side) chunks of at most
+    i_chunk_rows trades, the same arrays as get_trade_arrays on the whole file. Only a chunk
+    is in memory at a time.
+    '''
+    o_reader = pd.read_csv(s_file, usecols=list(TRADE_CSV_DTYPES), dtype=TRADE_CSV_DTYPES, chunksize=i_chunk_rows)
+    with o_reader:
+        for df_chunk in o_reader:
+            o_side = df_chunk['side'].cat
+            # a missing side has code -1, the last entry
+            a_side_map = np.array([SIDE_BUY if s_side == 'buy' else SIDE_SELL if s_side == 'sell' else 0
+                                   for s_side in o_side.categories] + [0], dtype=np.int8)
+            yield (df_chunk['local_timestamp'].to_numpy(), df_chunk['price'].to_numpy(),
+                   df_chunk['amount'].to_numpy(), a_side_map[o_side.codes.to_numpy()])
+
+
+def get_trade_file_arrays(s_file, i_chunk_rows=CHUNK_ROWS):
+    # a whole file as arrays, without ever holding it as a DataFrame
+    ls_chunks = list(iter_trade_file_arrays(s_file, i_chunk_rows))
+    if not ls_chunks:
+        return np.empty(0, np.int64), np.empty(0), np.empty(0), np.empty(0, np.int8)
+    return tuple(np.concatenate(la_values) for la_values in zip(*ls_chunks))
+
+
+def convert_epoch_to_str_time_array(a_epoch_time):
+    # same strings as TradeBarComputable.convert_epoch_to_str_time, for whole arrays
+    a_str = np.datetime_as_string(np.asarray(a_epoch_time, dtype=np.int64).astype('datetime64[us]'), unit='us')
+    return np.char.replace(a_str, 'T', ' ')
+
+
+def get_sequential_sum(f_start, a_values):
+    if len(a_values) == 0:
+        return f_start
+    return float(np.cumsum(np.concatenate(([f_start], a_values)))[-1])
+
+
+def get_lockstep_order(a_start, a_end):
+    # segments longest first, so the segments still active at step k are a prefix
+    a_length = a_end - a_start + 1
+    a_order = np.argsort(-a_length, kind='stable')
+    a_length_sorted = a_length[a_order]
+    i_max_length = int(a_length_sorted[0]) if len(a_length_sorted) else 0
+    # number of segments longer than k, for every step k
+    a_active = len(a_length) - np.cumsum(np.bincount(a_length_sorted, minlength=i_max_length + 1))
+    return a_order, a_start[a_order], a_active, i_max_length
+
+
+def get_segment_sums(a_values, a_start, a_end, a_initial=None):
+    # sum of a_values[a_start[j]:a_end[j] + 1] added one value at a time onto a_initial[j]
+    i_count = len(a_start)
+    a_sum = np.zeros(i_count) if a_initial is None else np.array(a_initial, dtype=np.float64)
+    if i_count == 0:
+        return a_sum
+
+    a_order, a_start_sorted, a_active, i_max_length = get_lockstep_order(a_start, a_end)
+    if i_max_length <= i_count:
+        a_sorted_sum = a_sum[a_order]
+        for k in range(i_max_length):
+            i_active = a_active[k]
+            a_sorted_sum[:i_active] += a_values[a_start_sorted[:i_active] + k]
+        a_sum[a_order] = a_sorted_sum
+    else:
+        for j in range(i_count):
+            a_sum[j] = get_sequential_sum(a_sum[j], a_values[a_start[j]:a_end[j] + 1])
+    return a_sum
+
+
+def get_segment_vwaps(a_price, a_size, a_start, a_end, a_vwap=None, a_volume=None):
+    # TradeBarComputable's running vwap, vwap = (vwap * volume + price * size) / (volume + size)
+    # per trade, for every segment
+    i_count = len(a_start)
+    a_vwap = np.zeros(i_count) if a_vwap is None else np.array(a_vwap, dtype=np.float64)
+    a_volume = np.zeros(i_count) if a_volume is None else np.array(a_volume, dtype=np.float64)
+    if i_count == 0:
+        return a_vwap
+
+    a_order, a_start_sorted, a_active, i_max_length = get_lockstep_order(a_start, a_end)
+    i_trades = int(np.sum(a_end - a_start + 1))
+    if i_max_length <= i_trades * LOOP_CALLS_PER_TRADE:
+        a_sorted_vwap = a_vwap[a_order]
+        a_sorted_volume = a_volume[a_order]
+        for k in range(i_max_length):
+            i_active = a_active[k]
+            a_index = a_start_sorted[:i_active] + k
+            a_step_price = a_price[a_index]
+            a_step_size = a_size[a_index]
+            a_step_volume = a_sorted_volume[:i_active]
+            a_sorted_vwap[:i_active] = (a_sorted_vwap[:i_active] * a_step_volume + a_step_price * a_step_size) /\
+                                       (a_step_volume + a_step_size)
+            a_step_volume += a_step_size
+        a_vwap[a_order] = a_sorted_vwap
+    else:
+        for j in range(i_count):
+            f_vwap, f_volume = float(a_vwap[j]), float(a_volume[j])
+            for f_price, f_size in zip(a_price[a_start[j]:a_end[j] + 1].tolist(),
+                                       a_size[a_start[j]:a_end[j] + 1].tolist()):
+                f_vwap = (f_vwap * f_volume + f_price * f_size) / (f_volume + f_size)
+                f_volume += f_size
+            a_vwap[j] = f_vwap
+    return a_vwap
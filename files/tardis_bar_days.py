@@ -0,0 +1,158 @@
+'''
+Per-day parallel driver shared by the tardis bar builders (tardis_trades_to_vb.py, tardis_trades_to_mbar.py).
+
+Every day is turned into a fragment in a worker process: per bar size, the bars built from a
+fresh start plus the in progress bar left at the end of the day. Fragments are cached as
+fragments/<symbol>_<YYYYMMDD>.npz next to the output files, so a rerun only loads trades for
+new days (or new bar sizes). A fragment records what it was built from (FRAGMENT_VERSION, the
+size and mtime of the day's trade file and the code of the bar function) and is built again
+when any of them changed, e.g. after the trade file was downloaded again.
+
+Bars carry across days, so a day's fresh bars are only right if the previous day ended on a
+bar boundary. Otherwise the stitch replays the start of the day from the carried bar until a
+bar ends on the same trade as one of the fresh bars; from there on both are the same (the
+state is reset at a bar end), so the rest of the fresh bars are used as is.
+'''
+
+import hashlib
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# trades replayed before the first look for a common bar end, growing 4x per retry
+STITCH_WINDOW = 4096
+
+# every worker holds a day of trades as arrays (read in chunks, ~25 bytes a trade)
+MAX_WORKERS = min(os.cpu_count() or 1, 8)
+
+# bumped when the fragment layout or what goes into the bars changes outside the bar function
+FRAGMENT_VERSION = 2
+
+
+def get_fragment_file(s_fragment_dir, s_symbol, s_date):
+    return os.path.join(s_fragment_dir, f"{s_symbol.lower()}_{s_date}.npz")
+
+
+def get_fragment_source(s_trade_file, f_compute_bars):
+    if os.path.exists(s_trade_file):
+        o_stat = os.stat(s_trade_file)
+        s_file = f"{os.path.basename(s_trade_file)}:{o_stat.st_size}:{o_stat.st_mtime_ns}"
+    else:
+        s_file = f"{os.path.basename(s_trade_file)}:missing"
+    s_code = hashlib.sha256(inspect.getsource(f_compute_bars).encode()).hexdigest()
+    return f"v{FRAGMENT_VERSION}|{s_file}|{s_code}"
+
+
+def load_fragment(s_fragment_file, s_source=None):
+    # {'source': ..., 'bars': {size: bars}, 'tails': {size: in progress bar or None}}, empty when
+    # s_source is given and the fragment was built from something else
+    d_fragment = {'source': s_source, 'bars': {}, 'tails': {}}
+    if not os.path.exists(s_fragment_file):
+        return d_fragment
+    with np.load(s_fragment_file) as o_npz:
+        s_fragment_source = o_npz['source'].item() if 'source' in o_npz.files else None
+        if s_source is not None and s_fragment_source != s_source:
+            print(f"rebuilding stale fragment {s_fragment_file}")
+            return d_fragment
+        d_fragment['source'] = s_fragment_source
+        for s_name in o_npz.files:
+            # (older fragments also held the day's trades)
+            if not s_name.startswith(('bar_', 'tail_')):
+                continue
+            s_kind, s_size, s_key = s_name.split('_', 2)
+            if s_kind == 'bar':
+                d_fragment['bars'].setdefault(int(s_size), {})[s_key] = o_npz[s_name]
+                d_fragment['tails'].setdefault(int(s_size), None)
+            elif s_kind == 'tail':
+                d_tail = d_fragment['tails'].get(int(s_size)) or {}
+                d_tail[s_key] = o_npz[s_name].item()
+                d_fragment['tails'][int(s_size)] = d_tail
+    return d_fragment
+
+
+def save_fragment(s_fragment_file, d_fragment):
+    d_arrays = {'source': np.array(d_fragment['source'])}
+    for i_size, d_bars in d_fragment['bars'].items():
+        d_arrays.update({f"bar_{i_size}_{s_key}": a_values for s_key, a_values in d_bars.items()})
+        for s_key, value in (d_fragment['tails'][i_size] or {}).items():
+            d_arrays[f"tail_{i_size}_{s_key}"] = np.array(value)
+    os.makedirs(os.path.dirname(s_fragment_file) or '.', exist_ok=True)
+    s_tmp_file = s_fragment_file + '.tmp.npz'
+    np.savez(s_tmp_file, **d_arrays)
+    os.replace(s_tmp_file, s_fragment_file)
+
+
+def build_day_fragment(s_fragment_file, s_date, ls_sizes, f_load_trade_arrays, f_compute_bars, f_get_trade_file):
+    # worker side: the fresh bars of every size not cached yet, f_get_trade_file(date) is the
+    # file the day's trades come from
+    d_fragment = load_fragment(s_fragment_file, get_fragment_source(f_get_trade_file(s_date), f_compute_bars))
+    ls_missing = [i_size for i_size in ls_sizes if i_size not in d_fragment['bars']]
+    if not ls_missing:
+        return s_fragment_file
+
+    ta_trades = f_load_trade_arrays(s_date)
+    for i_size in ls_missing:
+        d_fragment['bars'][i_size], d_fragment['tails'][i_size] = f_compute_bars(*ta_trades, i_size, None)
+    save_fragment(s_fragment_file, d_fragment)
+    return s_fragment_file
+
+
+def slice_bars(d_bars, i_start, i_end=None):
+    return {s_key: a_values[i_start:i_end] for s_key, a_values in d_bars.items()}
+
+
+def stitch_bars(f_trades, d_fresh_bars, d_fresh_tail, d_carry, f_compute_bars, i_size):
+    # the day's bars and in progress bar when it starts with d_carry in progress,
+    # f_trades() returns the day's trade arrays
+    if d_carry is None:
+        return d_fresh_bars, d_fresh_tail
+
+    ta_trades = f_trades()
+    a_fresh_end = np.cumsum(d_fresh_bars['trades']) - 1
+    n = len(ta_trades[0])
+    i_window = STITCH_WINDOW
+    while True:
+        i_window = min(i_window, n)
+        d_bars, d_tail = f_compute_bars(*[a_values[:i_window] for a_values in ta_trades], i_size, d_carry)
+        # the replayed bar ends as indexes into the day
+        a_end = np.cumsum(d_bars['trades']) - 1 - d_carry['trades']
+        a_common = np.flatnonzero(np.isin(a_end, a_fresh_end))
+        if len(a_common):
+            i_bar = a_common[0]
+            i_fresh_bar = int(np.searchsorted(a_fresh_end, a_end[i_bar]))
+            d_head = slice_bars(d_bars, 0, i_bar + 1)
+            d_rest = slice_bars(d_fresh_bars, i_fresh_bar + 1)
+            return {s_key: np.concatenate((d_head[s_key], d_rest[s_key])) for s_key in d_head}, d_fresh_tail
+        if i_window == n:
+            return d_bars, d_tail
+        i_window *= 4
+
+
+def build_bar_days(ls_dates, ls_sizes, s_fragment_dir, s_symbol, f_worker, f_load_trade_arrays, f_compute_bars,
+                   d_carries, i_workers=MAX_WORKERS):
+    '''
+    Yields (date, {size: bars}) in date order. Fragments are built in i_workers processes by
+    f_worker((fragment file, date, sizes)), which returns the fragment file; the stitch runs
+    here and only loads the day's trades, f_load_trade_arrays(date), when a bar is carried
+    into it. d_carries (size -> in progress bar) is the state before the first day and is updated
+    in place, so the caller has the bars still in progress after the last day.
+    '''
+    ls_args = [(get_fragment_file(s_fragment_dir, s_symbol, s_date), s_date, ls_sizes) for s_date in ls_dates]
+    with ProcessPoolExecutor(max_workers=i_workers) as executor:
+        for s_date, s_fragment_file in zip(ls_dates, executor.map(f_worker, ls_args)):
+            d_fragment = load_fragment(s_fragment_file)
+            ls_trades = []
+
+            def f_trades():
+                if not ls_trades:
+                    ls_trades.append(f_load_trade_arrays(s_date))
+                return ls_trades[0]
+
+            d_day_bars = {}
+            for i_size in ls_sizes:
+                d_day_bars[i_size], d_carries[i_size] = stitch_bars(f_trades, d_fragment['bars'][i_size],
+                                                                    d_fragment['tails'][i_size], d_carries.get(i_size),
+                                                                    f_compute_bars, i_size)
+            yield s_date, d_day_bars
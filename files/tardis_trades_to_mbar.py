@@ -5,6 +5,14 @@ generated files are in hist_data/mbar/.
 Usage: 
     cd ~/baus_backtesting/hist_data/
     python ../src/tardis_trades_to_mbar.py
+
+Days are built in parallel and cached as fragments in hist_data/mbar/fragments/, so a rerun
+(also for a longer date range) only reads the trades of new days.
+
+Parity check of the vectorized builder against TradeBarComputable, and throughput on a day of
+trades, on the given day if it exists, otherwise on synthetic trades:
+    python ../src/tardis_trades_to_mbar.py --check [YYYYMMDD]
+    python ../src/tardis_trades_to_mbar.py --benchmark [YYYYMMDD]
 '''
 
 s_start = '20230701'
@@ -12,13 +20,24 @@ s_end =   '20230731'
 ls_bar_intervals_seconds = [60] 
 SYMBOL = "BTCUSDT"
 EXCHANGE = "binance-futures"
+# partitioned Parquet copies of the trades and bars, see bar_store.py
+STORE_ROOT = "store"
 
 import copy
 import os
+import sys
+import time
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import pytz
 
+from tardis_bar_arrays import (SIDE_BUY, SIDE_SELL, get_trade_arrays, iter_trade_file_arrays,
+                               get_trade_file_arrays, convert_epoch_to_str_time_array, get_segment_sums,
+                               get_segment_vwaps)
+from tardis_bar_days import build_day_fragment, build_bar_days, stitch_bars, MAX_WORKERS
+from bar_store import load_day_trades, write_trades, write_bars
+
 
 class TradeBar:
     def __init__(self, duration):
@@ -225,18 +244,20 @@ class TradeBarComputable:
 
 #     return catalog
 
-def get_trade_data(s_start, s_end):
-    df_trade_return = pd.DataFrame()
+def get_trade_file(date):
+    return f"../hist_data/datasets/binance-futures_trades_{pd.Timestamp(date).strftime('%Y%m%d')}_{SYMBOL}.csv.gz"
 
+
+def get_trade_data(s_start, s_end):
     ls_dates = pd.date_range(s_start, s_end).strftime("%Y%m%d").tolist()
     
     #catalog = data_catalog()
 
-    df = None
+    ls_df = []
     for date in ls_dates:
-        srcfile=f"../hist_data/datasets/binance-futures_trades_{date}_BTCUSDT.csv.gz"
-        df_new_row = pd.read_csv(srcfile)
-        df_trade_return = pd.concat([df_trade_return, df_new_row])
+        srcfile=get_trade_file(date)
+        ls_df.append(pd.read_csv(srcfile))
+    df_trade_return = pd.concat(ls_df, ignore_index=True)
 
     df_trade_return['type'] = 'trade'
     df_trade_return['ts_event'] = df_trade_return['local_timestamp']
@@ -246,21 +267,154 @@ def get_trade_data(s_start, s_end):
     return df_trade_return
 
 
-def build_volume_bars(s_start, s_end, ls_bar_intervals_seconds):
-    print("building minute bars for: ", s_start, s_end, ls_bar_intervals_seconds)
-    df_min_bars = {}
+MBAR_COLUMNS = ['type', 'symbol', 'exchange', 'name', 'interval', 'kind', 'open', 'high', 'low', 'close',
+                'volume', 'buyVolume', 'sellVolume', 'trades', 'vwap', 'openTimestamp', 'closeTimestamp',
+                'localTimestamp']
+
+
+def compute_time_bars(a_ts, a_price, a_size, a_side, ls_intervals_seconds, d_carries=None):
+    '''
+    Vectorized equivalent of feeding trades one by one to TradeBarComputable.compute, for several
+    intervals in one pass over the trade arrays.
+
+    A bar covers the trades up to the end of the interval its first trade falls in, so a trade
+    opens a new bar when its interval index, ceil(ts / interval), is past the highest one seen
+    so far. The last bar is only complete once a later trade arrives, so it is returned as the
+    carry for the next call (or for compute_last_time_bars).
+    d_carries maps interval -> in progress bar (None to start fresh); returns
+    ({interval: completed bars as a dict of arrays}, new d_carries).
+    '''
+    d_carries = dict(d_carries or {})
+    d_bars = {}
+    n = len(a_ts)
+    a_buy_size = np.where(a_side == SIDE_BUY, a_size, 0.0)
+    a_sell_size = np.where(a_side == SIDE_SELL, a_size, 0.0)
+    a_is_buy = (a_side == SIDE_BUY).astype(np.int64)
+    a_is_sell = (a_side == SIDE_SELL).astype(np.int64)
+
+    for i_interval_seconds in ls_intervals_seconds:
+        d_carry = d_carries.get(i_interval_seconds)
+        if n == 0:
+            d_bars[i_interval_seconds] = get_time_bars_from_carry(None)
+            continue
 
-    # Create a new instance of the TradeBarComputable
+        i_interval = i_interval_seconds * 1_000_000
+        a_bucket = (a_ts + i_interval - 1) // i_interval
+        i_carry_bucket = d_carry['bucket'] if d_carry is not None else a_bucket[0] - 1
+        a_highest = np.maximum.accumulate(np.concatenate(([i_carry_bucket], a_bucket)))
+        a_start = np.flatnonzero(a_bucket > a_highest[:-1])
+        # without a new bar at 0 the first trades continue the carried bar
+        b_continues = len(a_start) == 0 or a_start[0] != 0
+        if b_continues:
+            a_start = np.concatenate(([0], a_start))
+        a_end = np.concatenate((a_start[1:] - 1, [n - 1]))
+        i_count = len(a_start)
+
+        a_initial_volume = np.zeros(i_count)
+        a_initial_buy_volume = np.zeros(i_count)
+        a_initial_sell_volume = np.zeros(i_count)
+        a_initial_vwap = np.zeros(i_count)
+        if b_continues:
+            a_initial_volume[0] = d_carry['volume']
+            a_initial_buy_volume[0] = d_carry['buy_volume']
+            a_initial_sell_volume[0] = d_carry['sell_volume']
+            a_initial_vwap[0] = d_carry['vwap']
+
+        a_volume = get_segment_sums(a_size, a_start, a_end, a_initial_volume)
+        a_buy_volume = get_segment_sums(a_buy_size, a_start, a_end, a_initial_buy_volume)
+        a_sell_volume = get_segment_sums(a_sell_size, a_start, a_end, a_initial_sell_volume)
+        a_vwap = get_segment_vwaps(a_price, a_size, a_start, a_end, a_initial_vwap, a_initial_volume)
+        a_high = np.maximum.reduceat(a_price, a_start)
+        a_low = np.minimum.reduceat(a_price, a_start)
+        a_buys = np.add.reduceat(a_is_buy, a_start)
+        a_sells = np.add.reduceat(a_is_sell, a_start)
+        a_open = a_price[a_start].copy()
+        a_open_ts = a_ts[a_start].copy()
+        a_open_bucket = a_bucket[a_start].copy()
+        a_trades = a_end - a_start + 1
+
+        if b_continues:
+            a_open[0], a_open_ts[0], a_open_bucket[0] = d_carry['open'], d_carry['open_ts'], d_carry['bucket']
+            a_high[0] = max(a_high[0], d_carry['high'])
+            a_low[0] = min(a_low[0], d_carry['low'])
+            a_buys[0] += d_carry['buys']
+            a_sells[0] += d_carry['sells']
+            a_trades[0] += d_carry['trades']
+
+        d_carries[i_interval_seconds] = {
+            'bucket': int(a_open_bucket[-1]), 'trades': int(a_trades[-1]), 'open': float(a_open[-1]),
+            'open_ts': int(a_open_ts[-1]), 'close': float(a_price[-1]), 'close_ts': int(a_ts[-1]),
+            'high': float(a_high[-1]), 'low': float(a_low[-1]), 'volume': float(a_volume[-1]),
+            'buy_volume': float(a_buy_volume[-1]), 'sell_volume': float(a_sell_volume[-1]),
+            'buys': int(a_buys[-1]), 'sells': int(a_sells[-1]), 'vwap': float(a_vwap[-1])
+        }
+        d_interval_bars = {
+            'open': a_open[:-1], 'high': a_high[:-1], 'low': a_low[:-1], 'close': a_price[a_end[:-1]],
+            'volume': a_volume[:-1], 'buy_volume': a_buy_volume[:-1], 'sell_volume': a_sell_volume[:-1],
+            'buys': a_buys[:-1], 'sells': a_sells[:-1], 'trades': a_trades[:-1], 'vwap': a_vwap[:-1],
+            'open_ts': a_open_ts[:-1], 'close_ts': a_ts[a_end[:-1]]
+        }
+        if d_carry is not None and not b_continues:
+            # the first trade closed the carried bar
+            d_carry_bar = get_time_bars_from_carry(d_carry)
+            d_interval_bars = {s_key: np.concatenate((d_carry_bar[s_key], a_values))
+                               for s_key, a_values in d_interval_bars.items()}
+        d_bars[i_interval_seconds] = d_interval_bars
+
+    return d_bars, d_carries
+
+
+def get_time_bars_from_carry(d_carry):
+    # the in progress bar as a one bar (or, without one, empty) dict of arrays
+    ls_keys = ['open', 'high', 'low', 'close', 'volume', 'buy_volume', 'sell_volume', 'buys', 'sells',
+               'trades', 'vwap', 'open_ts', 'close_ts']
+    if d_carry is None:
+        return {s_key: np.empty(0) for s_key in ls_keys}
+    return {s_key: np.array([d_carry[s_key]]) for s_key in ls_keys}
+
+
+def compute_last_time_bars(d_carries):
+    # same as TradeBarComputable.compute_last, at the end of the date range
+    return {i_interval_seconds: get_time_bars_from_carry(d_carry) for i_interval_seconds, d_carry in d_carries.items()}
+
+
+def get_time_bar_frame(d_bars, i_interval_seconds):
+    # object columns of python scalars, like the one row frames built from
+    # TradeBar.to_dict, so to_csv writes the same text (e.g. an int 0 buyVolume for
+    # a bar without buys)
+    i_count = len(d_bars['trades'])
+    a_close_ts = convert_epoch_to_str_time_array(d_bars['close_ts']).tolist()
+    d_columns = {
+        'type': ['trade_bar'] * i_count,
+        'symbol': [SYMBOL] * i_count,
+        'exchange': [EXCHANGE] * i_count,
+        'name': [f'trade_bar_{i_interval_seconds}_sec'] * i_count,
+        'interval': [i_interval_seconds] * i_count,
+        'kind': ['time'] * i_count,
+        'open': d_bars['open'].tolist(),
+        'high': d_bars['high'].tolist(),
+        'low': d_bars['low'].tolist(),
+        'close': d_bars['close'].tolist(),
+        'volume': d_bars['volume'].tolist(),
+        'buyVolume': [f if i else 0 for f, i in zip(d_bars['buy_volume'].tolist(), d_bars['buys'].tolist())],
+        'sellVolume': [f if i else 0 for f, i in zip(d_bars['sell_volume'].tolist(), d_bars['sells'].tolist())],
+        'trades': [int(i) for i in d_bars['trades'].tolist()],
+        'vwap': d_bars['vwap'].tolist(),
+        'openTimestamp': convert_epoch_to_str_time_array(d_bars['open_ts']).tolist(),
+        'closeTimestamp': a_close_ts,
+        'localTimestamp': a_close_ts
+    }
+    return pd.DataFrame(d_columns, columns=MBAR_COLUMNS, dtype=object)
+
+
+def build_time_bars(s_start, s_end, ls_bar_intervals_seconds):
+    print("building minute bars for: ", s_start, s_end, ls_bar_intervals_seconds)
 
     fast_start_date = pd.to_datetime(s_end, utc=True).date()
 
-    ls_trade_bar_computable=[]
+    d_out_files = {}
+    d_existing_local_timestamps = {}
     for i_bar_intervals_seconds in ls_bar_intervals_seconds:
-        config = dict(
-            name=None,
-            interval=i_bar_intervals_seconds,
-            bar_kind="time"
-        )
         out_file = "mbar/mbar_"+SYMBOL.lower()+"_" + s_start + "_" + s_end + "_" + str(i_bar_intervals_seconds) + "_sec" + ".csv"
         if os.path.exists(out_file):
             df=pd.read_csv(out_file)
@@ -270,65 +424,221 @@ def build_volume_bars(s_start, s_end, ls_bar_intervals_seconds):
         else:
             existing_local_timestamp = 0
             fast_start_date = pd.to_datetime(s_start, utc=True).date()    
-            
-        ls_trade_bar_computable.append((TradeBarComputable(config), [], out_file, existing_local_timestamp))
+
+        d_out_files[i_bar_intervals_seconds] = out_file
+        d_existing_local_timestamps[i_bar_intervals_seconds] = existing_local_timestamp
 
     print("fast_start_date=", fast_start_date)
 
+    d_carries = {}
     for date in pd.date_range(s_start, s_end):
         print(f"Processing date {date}...")
         if date.date() < fast_start_date:
             print(f"Skip fully processed date {date}")
             continue
-        # populate df_trades global by pulling trade data from cache
-        df_trade_data = get_trade_data(date, date)
 
-        #test_cnt = 10000
+        # chunk by chunk, the in progress bars carry over
+        for a_ts, a_price, a_size, a_side in iter_trade_file_arrays(get_trade_file(date)):
+            # intervals resuming from an existing file skip what it already has, the
+            # others share one pass
+            d_bars = {}
+            ls_shared_intervals = []
+            for i_bar_intervals_seconds in ls_bar_intervals_seconds:
+                a_keep = a_ts > d_existing_local_timestamps[i_bar_intervals_seconds]
+                if not a_keep.all():
+                    d_interval_bars, d_carries = compute_time_bars(a_ts[a_keep], a_price[a_keep], a_size[a_keep],
+                                                                   a_side[a_keep], [i_bar_intervals_seconds], d_carries)
+                    d_bars.update(d_interval_bars)
+                else:
+                    ls_shared_intervals.append(i_bar_intervals_seconds)
+            d_shared_bars, d_carries = compute_time_bars(a_ts, a_price, a_size, a_side, ls_shared_intervals, d_carries)
+            d_bars.update(d_shared_bars)
+
+            write_time_bars(d_bars, d_out_files)
+
+    write_time_bars(compute_last_time_bars(d_carries), d_out_files)
+
+
+def write_time_bars(d_bars, d_out_files):
+    for i_bar_intervals_seconds, d_interval_bars in d_bars.items():
+        if len(d_interval_bars['trades']) > 0:
+            out_file = d_out_files[i_bar_intervals_seconds]
+            df_merged = get_time_bar_frame(d_interval_bars, i_bar_intervals_seconds)
+            df_merged.to_csv(out_file, mode='a', header=not os.path.exists(out_file), index=False)
+
+
+def compute_time_bars_reference(df_trade_data, ls_bar_intervals_seconds):
+    # the original per-trade builder, kept as the reference for check_time_bars
+    d_bars = {}
+    for i_bar_intervals_seconds in ls_bar_intervals_seconds:
+        o_trade_bar_computable = TradeBarComputable(dict(name=None, interval=i_bar_intervals_seconds, bar_kind="time"))
+        ls_rows = []
         for tick in df_trade_data.itertuples():
-            for o_trade_bar_computable,df_min_bars, out_file, existing_local_timestamp in ls_trade_bar_computable:
-
-                if tick.ts_event <= existing_local_timestamp:
-                    continue
-
-                result = o_trade_bar_computable.compute(tick)
-
-                # if result is None, the trade tick does not result in a new bar
-                if result is not None:
-                    result = result.to_dict()
-                    df_new_row = pd.DataFrame.from_dict(result, orient='index').transpose()
-                    df_min_bars.append(df_new_row) 
-                    #print("one bar computed: ", result)
-            #test_cnt -= 1
-            #if test_cnt == 0: break    
-
-        for o_trade_bar_computable, df_min_bars, out_file, existing_local_timestamp in ls_trade_bar_computable:
-            if len(df_min_bars) > 0:
-                df_merged = pd.concat(df_min_bars, ignore_index=True)
-                df_merged.reset_index(drop=True, inplace=True)
-                df_merged.to_csv(out_file, mode='a', header=not os.path.exists(out_file), index=False)
-                df_min_bars.clear()
-
-    for o_trade_bar_computable, df_min_bars, out_file, existing_local_timestamp in ls_trade_bar_computable:
+            result = o_trade_bar_computable.compute(tick)
+            if result is not None:
+                ls_rows.append(pd.DataFrame.from_dict(result.to_dict(), orient='index').transpose())
         result = o_trade_bar_computable.compute_last()
         if result is not None:
-            result = result.to_dict()
-            df_new_row = pd.DataFrame.from_dict(result, orient='index').transpose()
-            df_min_bars.append(df_new_row) 
-            #print("last bar bar computed: ", result)
-
-        if len(df_min_bars) > 0:
-            df_merged = pd.concat(df_min_bars, ignore_index=True)
-            df_merged.reset_index(drop=True, inplace=True)
-            df_merged.to_csv(out_file, mode='a', header=not os.path.exists(out_file), index=False)
-            df_min_bars.clear()
+            ls_rows.append(pd.DataFrame.from_dict(result.to_dict(), orient='index').transpose())
+        d_bars[i_bar_intervals_seconds] = pd.concat(ls_rows, ignore_index=True) if ls_rows else None
+    return d_bars
+
+
+def get_benchmark_trade_data(s_date, i_count):
+    if s_date is not None and os.path.exists(f"../hist_data/datasets/binance-futures_trades_{s_date}_{SYMBOL}.csv.gz"):
+        return get_trade_data(s_date, s_date)
+
+    # a synthetic day: sizes on a 0.001 grid like BTCUSDT
+    print("using synthetic trades")
+    o_random = np.random.default_rng(0)
+    a_ts = 1688169600000000 + np.sort(o_random.integers(0, 86_400_000_000, i_count))
+    # local timestamps are not always in order
+    a_late = o_random.random(i_count) < 0.05
+    a_ts[a_late] -= o_random.integers(0, 300_000, int(a_late.sum()))
+    a_price = np.round(30000 + np.cumsum(o_random.normal(0, 0.5, i_count)), 1)
+    a_size = np.round(o_random.exponential(0.15, i_count), 3) + 0.001
+    a_side = o_random.choice(['buy', 'sell', 'unknown'], i_count, p=[0.5, 0.49, 0.01])
+    df_trade_data = pd.DataFrame({'exchange': EXCHANGE, 'symbol': SYMBOL, 'timestamp': a_ts, 'local_timestamp': a_ts,
+                                  'id': np.arange(i_count), 'side': a_side, 'price': a_price, 'amount': a_size})
+    df_trade_data['type'] = 'trade'
+    df_trade_data['ts_event'] = df_trade_data['local_timestamp']
+    df_trade_data['size'] = df_trade_data['amount']
+    return df_trade_data
+
+
+def check_time_bars(s_date=None, ls_bar_intervals_seconds=(1, 5, 60, 300, 3600)):
+    # the vectorized bars, fed in two halves to exercise the carried bar, must
+    # write the same CSV text as TradeBarComputable
+    df_trade_data = get_benchmark_trade_data(s_date, 200_000)
+    d_reference = compute_time_bars_reference(df_trade_data, ls_bar_intervals_seconds)
+
+    a_ts, a_price, a_size, a_side = get_trade_arrays(df_trade_data)
+    i_split = len(a_ts) // 2
+    d_first, d_carries = compute_time_bars(a_ts[:i_split], a_price[:i_split], a_size[:i_split], a_side[:i_split],
+                                           ls_bar_intervals_seconds)
+    d_second, d_carries = compute_time_bars(a_ts[i_split:], a_price[i_split:], a_size[i_split:], a_side[i_split:],
+                                            ls_bar_intervals_seconds, d_carries)
+    d_last = compute_last_time_bars(d_carries)
+
+    # the same trades as separate "days" built from a fresh start and stitched, like
+    # build_time_bars_parallel
+    ls_days = np.array_split(np.arange(len(a_ts)), 5)
+
+    b_ok = True
+    for i_interval_seconds in ls_bar_intervals_seconds:
+        df_vectorized = pd.concat([get_time_bar_frame(d_bars[i_interval_seconds], i_interval_seconds)
+                                   for d_bars in (d_first, d_second, d_last)], ignore_index=True)
+
+        ls_frames = []
+        d_carry = None
+        for a_day in ls_days:
+            ta_day = (a_ts[a_day], a_price[a_day], a_size[a_day], a_side[a_day])
+            d_fresh_bars, d_fresh_tail = compute_interval_time_bars(*ta_day, i_interval_seconds)
+            d_bars, d_carry = stitch_bars(lambda: ta_day, d_fresh_bars, d_fresh_tail, d_carry, compute_interval_time_bars,
+                                          i_interval_seconds)
+            ls_frames.append(get_time_bar_frame(d_bars, i_interval_seconds))
+        ls_frames.append(get_time_bar_frame(get_time_bars_from_carry(d_carry), i_interval_seconds))
+        df_stitched = pd.concat(ls_frames, ignore_index=True)
+
+        s_reference = d_reference[i_interval_seconds].to_csv(index=False) if d_reference[i_interval_seconds] is not None else ''
+        s_vectorized = df_vectorized.to_csv(index=False) if len(df_vectorized) else ''
+        s_stitched = df_stitched.to_csv(index=False) if len(df_stitched) else ''
+        b_same = s_reference == s_vectorized
+        b_stitched_same = s_reference == s_stitched
+        b_ok = b_ok and b_same and b_stitched_same
+        print(f"interval {i_interval_seconds}s: {len(df_vectorized)} bars, {'identical' if b_same else 'DIFFERENT'}, "
+              f"stitched {'identical' if b_stitched_same else 'DIFFERENT'}")
+    return b_ok
+
+
+def benchmark_time_bars(s_date=None, ls_bar_intervals_seconds=(1, 5, 15, 60, 300, 900, 3600)):
+    df_trade_data = get_benchmark_trade_data(s_date, 2_000_000)
+    i_trades = len(df_trade_data)
+
+    f_time = time.perf_counter()
+    a_ts, a_price, a_size, a_side = get_trade_arrays(df_trade_data)
+    d_bars, d_carries = compute_time_bars(a_ts, a_price, a_size, a_side, ls_bar_intervals_seconds)
+    for i_interval_seconds in ls_bar_intervals_seconds:
+        get_time_bar_frame(d_bars[i_interval_seconds], i_interval_seconds)
+    f_vectorized_time = time.perf_counter() - f_time
+    print(f"vectorized: {i_trades} trades x {len(ls_bar_intervals_seconds)} intervals in {f_vectorized_time:.2f}s "
+          f"({i_trades * len(ls_bar_intervals_seconds) / f_vectorized_time:,.0f} trades/s per interval)")
+
+    # the per-trade builder on a slice, one interval
+    i_reference_trades = min(i_trades, 50_000)
+    f_time = time.perf_counter()
+    compute_time_bars_reference(df_trade_data.iloc[:i_reference_trades], [60])
+    f_reference_time = time.perf_counter() - f_time
+    print(f"reference: {i_reference_trades} trades x 1 interval in {f_reference_time:.2f}s "
+          f"({i_reference_trades / f_reference_time:,.0f} trades/s per interval)")
+
+
+def compute_interval_time_bars(a_ts, a_price, a_size, a_side, i_interval_seconds, d_carry=None):
+    # compute_time_bars for a single interval, in the form tardis_bar_days builds and stitches
+    d_bars, d_carries = compute_time_bars(a_ts, a_price, a_size, a_side, [i_interval_seconds],
+                                          {i_interval_seconds: d_carry})
+    return d_bars[i_interval_seconds], d_carries.get(i_interval_seconds)
+
+
+def get_day_trade_arrays(s_date):
+    # the trade store is filled from the tardis file on first use
+    ta_trades = load_day_trades(STORE_ROOT, SYMBOL, s_date)
+    if ta_trades is None:
+        ta_trades = get_trade_file_arrays(get_trade_file(s_date))
+        write_trades(STORE_ROOT, SYMBOL, s_date, *ta_trades)
+    return ta_trades
+
 
 def multiprocess_wrapper(ls_args):
-    print("build_volume_bars ", ls_args[0], ls_args[1], ls_args[2])
-    return build_volume_bars(ls_args[0], ls_args[1], ls_args[2])
+    print("build_day_fragment ", ls_args[0], ls_args[1], ls_args[2])
+    return build_day_fragment(ls_args[0], ls_args[1], ls_args[2], get_day_trade_arrays, compute_interval_time_bars,
+                              get_trade_file)
+
+
+def build_time_bars_parallel(s_start, s_end, ls_bar_intervals_seconds, i_workers=MAX_WORKERS):
+    # days are built in parallel from cached fragments (see tardis_bar_days), the
+    # output files are rewritten as a whole and the days written to the store
+    print("building minute bars in parallel for: ", s_start, s_end, ls_bar_intervals_seconds)
+
+    d_out_files = {}
+    for i_bar_intervals_seconds in ls_bar_intervals_seconds:
+        out_file = "mbar/mbar_"+SYMBOL.lower()+"_" + s_start + "_" + s_end + "_" + str(i_bar_intervals_seconds) + "_sec" + ".csv"
+        d_out_files[i_bar_intervals_seconds] = out_file + ".tmp"
+        if os.path.exists(out_file + ".tmp"):
+            os.remove(out_file + ".tmp")
+
+    ls_dates = pd.date_range(s_start, s_end).strftime("%Y%m%d").tolist()
+    d_carries = {}
+    s_date, d_bars = None, None
+    for s_date, d_bars in build_bar_days(ls_dates, ls_bar_intervals_seconds, "mbar/fragments", SYMBOL,
+                                         multiprocess_wrapper, get_day_trade_arrays, compute_interval_time_bars,
+                                         d_carries, i_workers):
+        print(f"Stitched date {s_date}")
+        write_time_bars(d_bars, d_out_files)
+        for i_bar_intervals_seconds, d_interval_bars in d_bars.items():
+            write_bars(STORE_ROOT, "mbar", SYMBOL, i_bar_intervals_seconds, s_date, d_interval_bars)
+
+    d_last_bars = compute_last_time_bars(d_carries)
+    write_time_bars(d_last_bars, d_out_files)
+    # the last bars belong to the last day
+    for i_bar_intervals_seconds, d_interval_bars in d_last_bars.items():
+        if len(d_interval_bars['trades']) > 0:
+            d_day_bars = {s_key: np.concatenate((d_bars[i_bar_intervals_seconds][s_key], a_values))
+                          for s_key, a_values in d_interval_bars.items()}
+            write_bars(STORE_ROOT, "mbar", SYMBOL, i_bar_intervals_seconds, s_date, d_day_bars)
+
+    for tmp_file in d_out_files.values():
+        if os.path.exists(tmp_file):
+            os.replace(tmp_file, tmp_file[:-len(".tmp")])
 
 def main():
 
-    build_volume_bars(s_start, s_end, ls_bar_intervals_seconds)
+    build_time_bars_parallel(s_start, s_end, ls_bar_intervals_seconds)
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--check':
+        sys.exit(0 if check_time_bars(sys.argv[2] if len(sys.argv) > 2 else None) else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        benchmark_time_bars(sys.argv[2] if len(sys.argv) > 2 else None)
+        sys.exit(0)
     main()
@@ -5,18 +5,36 @@ generated files are in hist_data/vb/.
 Usage: 
     cd ~/baus_backtesting/hist_data/
     python ../src/tardis_trades_to_vb.py
+
+Days are built in parallel and cached as fragments in hist_data/vb/fragments/, so a rerun
+(also for a longer date range) only reads the trades of new days.
+
+Regression check of the vectorized builder and of the day stitching against TradeBarComputable,
+on a day of trades if one is given (and exists), otherwise on synthetic trades:
+    python ../src/tardis_trades_to_vb.py --check [YYYYMMDD]
 '''
 
 import copy
 import os
+import sys
+import time
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import pytz
 
+from tardis_bar_arrays import (SIDE_BUY, SIDE_SELL, get_trade_arrays, iter_trade_file_arrays,
+                               get_trade_file_arrays, convert_epoch_to_str_time_array, get_segment_sums,
+                               get_segment_vwaps)
+from tardis_bar_days import build_day_fragment, build_bar_days, stitch_bars, MAX_WORKERS
+from bar_store import load_day_trades, write_trades, write_bars
+
 s_start = '20230701'
 s_end =   '20230731'
 SYMBOL = "BTCUSDT"
 EXCHANGE = "binance-futures"
+# partitioned Parquet copies of the trades and bars, see bar_store.py
+STORE_ROOT = "store"
 
 class TradeBar:
     def __init__(self, d_trade_bar):
@@ -239,18 +257,20 @@ class TradeBarComputable:
 #     return ls_ticks
 
 
-def get_trade_data(s_start, s_end):
-    df_trade_return = pd.DataFrame()
+def get_trade_file(date):
+    return f"../hist_data/datasets/binance-futures_trades_{pd.Timestamp(date).strftime('%Y%m%d')}_{SYMBOL}.csv.gz"
+
 
+def get_trade_data(s_start, s_end):
     ls_dates = pd.date_range(s_start, s_end).strftime("%Y%m%d").tolist()
     
     #catalog = data_catalog()
 
-    df = None
+    ls_df = []
     for date in ls_dates:
-        srcfile=f"../hist_data/datasets/binance-futures_trades_{date}_{SYMBOL}.csv.gz"
-        df_new_row = pd.read_csv(srcfile)
-        df_trade_return = pd.concat([df_trade_return, df_new_row])
+        srcfile=get_trade_file(date)
+        ls_df.append(pd.read_csv(srcfile))
+    df_trade_return = pd.concat(ls_df, ignore_index=True)
 
     df_trade_return['type'] = 'trade'
     df_trade_return['ts_event'] = df_trade_return['local_timestamp']
@@ -260,21 +280,145 @@ def get_trade_data(s_start, s_end):
     return df_trade_return
 
 
+# how far past the estimated end of a bar the exact volume is accumulated before
+# growing the window
+SEARCH_MARGIN = 256
+
+VB_COLUMNS = ['type', 'symbol', 'exchange', 'name', 'interval', 'kind', 'open', 'high', 'low', 'close',
+              'volume', 'buyVolume', 'sellVolume', 'trades', 'vwap', 'openTimestamp', 'closeTimestamp',
+              'timestamp', 'localTimestamp']
+
+
+def compute_volume_bars(a_ts, a_price, a_size, a_side, i_interval, d_carry=None):
+    '''
+    Vectorized equivalent of feeding trades one by one to TradeBarComputable.compute.
+
+    Bar ends come from searchsorted on the running bar volume, high/low and counts from
+    reduceat, volume, buy/sell volume and vwap are accumulated in per-trade order (see
+    tardis_bar_arrays), so the bars are bit for bit the same.
+    d_carry is the in progress bar left by the previous call (None to start fresh);
+    returns the completed bars as a dict of arrays and the new in progress bar.
+    '''
+    n = len(a_size)
+    if d_carry is None:
+        d_carry = {'trades': 0, 'open': 0.0, 'open_ts': 0, 'high': float('-inf'), 'low': float('inf'),
+                   'volume': 0.0, 'buy_volume': 0.0, 'sell_volume': 0.0, 'buys': 0, 'sells': 0, 'vwap': 0.0}
+
+    a_cumulative_volume = np.cumsum(a_size)
+
+    ls_start, ls_end, ls_volume = [], [], []
+    i_start = 0
+    f_volume = d_carry['volume']
+    b_complete = False
+    while i_start < n:
+        # the day's cumulative volume only estimates the end, the bar's own running
+        # volume decides it
+        f_base = a_cumulative_volume[i_start - 1] if i_start > 0 else 0.0
+        i_stop = min(n, int(np.searchsorted(a_cumulative_volume, f_base + i_interval - f_volume)) + SEARCH_MARGIN)
+        while True:
+            a_volume = np.cumsum(np.concatenate(([f_volume], a_size[i_start:i_stop])))[1:]
+            i_found = int(np.searchsorted(a_volume, i_interval))
+            if i_found < len(a_volume) or i_stop == n:
+                break
+            i_stop = min(n, i_stop + max(i_stop - i_start, SEARCH_MARGIN))
+
+        b_complete = i_found < len(a_volume)
+        i_end = i_start + i_found if b_complete else n - 1
+        ls_start.append(i_start)
+        ls_end.append(i_end)
+        ls_volume.append(float(a_volume[i_end - i_start]))
+        i_start = i_end + 1
+        f_volume = 0.0
+
+    a_start = np.array(ls_start, dtype=np.int64)
+    a_end = np.array(ls_end, dtype=np.int64)
+    i_count = len(a_start)
+    if i_count == 0:
+        return {s_key: np.empty(0) for s_key in ['open', 'high', 'low', 'close', 'volume', 'buy_volume',
+                                                 'sell_volume', 'buys', 'sells', 'trades', 'vwap',
+                                                 'open_ts', 'close_ts']}, d_carry if d_carry['trades'] else None
+
+    # the first bar continues the carried in progress bar
+    a_initial = np.zeros(i_count)
+    a_initial[0] = d_carry['buy_volume']
+    a_buy_volume = get_segment_sums(np.where(a_side == SIDE_BUY, a_size, 0.0), a_start, a_end, a_initial)
+    a_initial[0] = d_carry['sell_volume']
+    a_sell_volume = get_segment_sums(np.where(a_side == SIDE_SELL, a_size, 0.0), a_start, a_end, a_initial)
+    a_initial[0] = d_carry['vwap']
+    a_initial_volume = np.zeros(i_count)
+    a_initial_volume[0] = d_carry['volume']
+    a_vwap = get_segment_vwaps(a_price, a_size, a_start, a_end, a_initial, a_initial_volume)
+
+    a_high = np.maximum.reduceat(a_price, a_start)
+    a_low = np.minimum.reduceat(a_price, a_start)
+    a_buys = np.add.reduceat((a_side == SIDE_BUY).astype(np.int64), a_start)
+    a_sells = np.add.reduceat((a_side == SIDE_SELL).astype(np.int64), a_start)
+    a_open = a_price[a_start].copy()
+    a_open_ts = a_ts[a_start].copy()
+    a_trades = a_end - a_start + 1
+
+    if d_carry['trades']:
+        a_open[0], a_open_ts[0] = d_carry['open'], d_carry['open_ts']
+        a_high[0] = max(a_high[0], d_carry['high'])
+        a_low[0] = min(a_low[0], d_carry['low'])
+        a_buys[0] += d_carry['buys']
+        a_sells[0] += d_carry['sells']
+        a_trades[0] += d_carry['trades']
+
+    d_bars = {
+        'open': a_open, 'high': a_high, 'low': a_low, 'close': a_price[a_end],
+        'volume': np.array(ls_volume), 'buy_volume': a_buy_volume, 'sell_volume': a_sell_volume,
+        'buys': a_buys, 'sells': a_sells, 'trades': a_trades, 'vwap': a_vwap,
+        'open_ts': a_open_ts, 'close_ts': a_ts[a_end]
+    }
+
+    if b_complete:
+        return d_bars, None
+
+    d_carry = {'trades': int(a_trades[-1]), 'open': float(a_open[-1]), 'open_ts': int(a_open_ts[-1]),
+               'high': float(a_high[-1]), 'low': float(a_low[-1]), 'volume': ls_volume[-1],
+               'buy_volume': float(a_buy_volume[-1]), 'sell_volume': float(a_sell_volume[-1]),
+               'buys': int(a_buys[-1]), 'sells': int(a_sells[-1]), 'vwap': float(a_vwap[-1])}
+    return {s_key: a_values[:-1] for s_key, a_values in d_bars.items()}, d_carry
+
+
+def get_volume_bar_frame(d_bars, i_interval):
+    # object columns of python scalars, like the one row frames built from
+    # TradeBar.to_dict, so to_csv writes the same text (e.g. an int 0 buyVolume for
+    # a bar without buys)
+    i_count = len(d_bars['trades'])
+    a_close_ts = convert_epoch_to_str_time_array(d_bars['close_ts']).tolist()
+    d_columns = {
+        'type': ['trade_bar'] * i_count,
+        'symbol': [SYMBOL] * i_count,
+        'exchange': [EXCHANGE] * i_count,
+        'name': [f'trade_bar_{i_interval}_vol'] * i_count,
+        'interval': [i_interval] * i_count,
+        'kind': ['volume'] * i_count,
+        'open': d_bars['open'].tolist(),
+        'high': d_bars['high'].tolist(),
+        'low': d_bars['low'].tolist(),
+        'close': d_bars['close'].tolist(),
+        'volume': d_bars['volume'].tolist(),
+        'buyVolume': [f if i else 0 for f, i in zip(d_bars['buy_volume'].tolist(), d_bars['buys'].tolist())],
+        'sellVolume': [f if i else 0 for f, i in zip(d_bars['sell_volume'].tolist(), d_bars['sells'].tolist())],
+        'trades': d_bars['trades'].tolist(),
+        'vwap': d_bars['vwap'].tolist(),
+        'openTimestamp': convert_epoch_to_str_time_array(d_bars['open_ts']).tolist(),
+        'closeTimestamp': a_close_ts,
+        'timestamp': a_close_ts,
+        'localTimestamp': a_close_ts
+    }
+    return pd.DataFrame(d_columns, columns=VB_COLUMNS, dtype=object)
+
+
 def build_volume_bars(s_start, s_end, ls_btc_bar_sizes):
     print("building volume bars for: ", s_start, s_end, ls_btc_bar_sizes)
-    df_dollar_volume_bars = {}
-
-    # Create a new instance of the TradeBarComputable
 
     fast_start_date = pd.to_datetime(s_end, utc=True).date()
 
-    ls_trade_bar_computable=[]
+    ls_bar_states = []
     for i_bar_size_btc in ls_btc_bar_sizes:
-        config = dict(
-            name=None,
-            interval=i_bar_size_btc,
-            bar_kind="volume"
-        )
         out_file = "vb/volume_bar_"+SYMBOL.lower()+"_" + s_start + "_" + s_end + "_" + str(i_bar_size_btc) + ".csv"
         if os.path.exists(out_file):
             df=pd.read_csv(out_file)
@@ -284,8 +428,9 @@ def build_volume_bars(s_start, s_end, ls_btc_bar_sizes):
         else:
             existing_local_timestamp = 0
             fast_start_date = pd.to_datetime(s_start, utc=True).date()    
-            
-        ls_trade_bar_computable.append((TradeBarComputable(config), [], out_file, existing_local_timestamp))
+
+        # [bar size, out file, already written up to, in progress bar]
+        ls_bar_states.append([i_bar_size_btc, out_file, existing_local_timestamp, None])
     
     print("fast_start_date=", fast_start_date)
     
@@ -296,36 +441,154 @@ def build_volume_bars(s_start, s_end, ls_btc_bar_sizes):
             print(f"Skip fully processed date {date}")
             continue
 
-        # populate df_trades global by pulling trade data from cache
-        df_trade_data = get_trade_data(date, date)
-
-        #test_cnt = 1000000
+        # chunk by chunk, the in progress bars carry over
+        for a_ts, a_price, a_size, a_side in iter_trade_file_arrays(get_trade_file(date)):
+            for ls_bar_state in ls_bar_states:
+                i_bar_size_btc, out_file, existing_local_timestamp, d_carry = ls_bar_state
+                if existing_local_timestamp > 0 and len(a_ts) and a_ts[0] <= existing_local_timestamp:
+                    a_keep = a_ts > existing_local_timestamp
+                    d_bars, ls_bar_state[3] = compute_volume_bars(a_ts[a_keep], a_price[a_keep], a_size[a_keep],
+                                                                  a_side[a_keep], i_bar_size_btc, d_carry)
+                else:
+                    d_bars, ls_bar_state[3] = compute_volume_bars(a_ts, a_price, a_size, a_side, i_bar_size_btc, d_carry)
+
+                if len(d_bars['trades']) > 0:
+                    df_merged = get_volume_bar_frame(d_bars, i_bar_size_btc)
+                    df_merged.to_csv(out_file, mode='a', header=not os.path.exists(out_file), index=False)
+
+
+def compute_volume_bars_reference(df_trade_data, ls_btc_bar_sizes):
+    # the original per-trade builder, kept as the reference for check_volume_bars
+    d_bars = {}
+    for i_bar_size_btc in ls_btc_bar_sizes:
+        o_trade_bar_computable = TradeBarComputable(dict(name=None, interval=i_bar_size_btc, bar_kind="volume"))
+        ls_rows = []
         for tick in df_trade_data.itertuples():
-            for o_trade_bar_computable,df_dollar_volume_bars, out_file, existing_local_timestamp in ls_trade_bar_computable:
-                if tick.ts_event <= existing_local_timestamp:
-                    continue
-
-                result = o_trade_bar_computable.compute(tick)
-
-                # if result is None, the trade tick does not result in a new bar
-                if result is not None:
-                    result = result.to_dict()
-                    df_new_row = pd.DataFrame.from_dict(result, orient='index').transpose()
-                    df_dollar_volume_bars.append(df_new_row) 
-                    #print("volume bar computed: ", result)
-            #test_cnt -= 1
-            #if test_cnt == 0: break    
-
-        for o_trade_bar_computable, df_dollar_volume_bars, out_file, existing_local_timestamp in ls_trade_bar_computable:
-            if len(df_dollar_volume_bars) > 0:
-                df_merged = pd.concat(df_dollar_volume_bars, ignore_index=True)
-                df_merged.reset_index(drop=True, inplace=True)
-                df_merged.to_csv(out_file, mode='a', header=not os.path.exists(out_file), index=False)
-                df_dollar_volume_bars.clear()
+            result = o_trade_bar_computable.compute(tick)
+            if result is not None:
+                ls_rows.append(pd.DataFrame.from_dict(result.to_dict(), orient='index').transpose())
+        d_bars[i_bar_size_btc] = pd.concat(ls_rows, ignore_index=True) if ls_rows else None
+    return d_bars
+
+
+def get_synthetic_trade_data(i_count=200_000, i_seed=0):
+    # sizes on a 0.001 grid like BTCUSDT, so running volumes often land within
+    # rounding of the bar size
+    o_random = np.random.default_rng(i_seed)
+    a_ts = 1688169600000000 + np.cumsum(o_random.integers(0, 20_000, i_count))
+    a_price = np.round(30000 + np.cumsum(o_random.normal(0, 0.5, i_count)), 1)
+    a_size = np.round(o_random.exponential(0.15, i_count), 3) + 0.001
+    a_size[o_random.random(i_count) < 0.01] *= 300
+    a_size = np.round(a_size, 3)
+    a_side = o_random.choice(['buy', 'sell', 'unknown'], i_count, p=[0.5, 0.49, 0.01])
+    df_trade_data = pd.DataFrame({'exchange': EXCHANGE, 'symbol': SYMBOL, 'timestamp': a_ts, 'local_timestamp': a_ts,
+                                  'id': np.arange(i_count), 'side': a_side, 'price': a_price, 'amount': a_size})
+    df_trade_data['type'] = 'trade'
+    df_trade_data['ts_event'] = df_trade_data['local_timestamp']
+    df_trade_data['size'] = df_trade_data['amount']
+    return df_trade_data
+
+
+def check_volume_bars(s_date=None, ls_btc_bar_sizes=None):
+    # the vectorized bars, fed in two halves to exercise the carried bar, must
+    # write the same CSV text as TradeBarComputable
+    if ls_btc_bar_sizes is None:
+        ls_btc_bar_sizes = [int(388 * i) for i in [1, 2, 3, 5, 10, 15, 20]]
+    if s_date is not None and os.path.exists(f"../hist_data/datasets/binance-futures_trades_{s_date}_{SYMBOL}.csv.gz"):
+        df_trade_data = get_trade_data(s_date, s_date)
+    else:
+        print("check_volume_bars: using synthetic trades")
+        df_trade_data = get_synthetic_trade_data()
+        ls_btc_bar_sizes = [max(1, i_bar_size // 100) for i_bar_size in ls_btc_bar_sizes]
+
+    f_time = time.perf_counter()
+    d_reference = compute_volume_bars_reference(df_trade_data, ls_btc_bar_sizes)
+    f_reference_time = time.perf_counter() - f_time
+
+    f_time = time.perf_counter()
+    a_ts, a_price, a_size, a_side = get_trade_arrays(df_trade_data)
+    i_split = len(a_ts) // 2
+    d_vectorized = {}
+    for i_bar_size_btc in ls_btc_bar_sizes:
+        d_first, d_carry = compute_volume_bars(a_ts[:i_split], a_price[:i_split], a_size[:i_split],
+                                               a_side[:i_split], i_bar_size_btc)
+        d_second, d_carry = compute_volume_bars(a_ts[i_split:], a_price[i_split:], a_size[i_split:],
+                                                a_side[i_split:], i_bar_size_btc, d_carry)
+        d_vectorized[i_bar_size_btc] = pd.concat([get_volume_bar_frame(d_first, i_bar_size_btc),
+                                                  get_volume_bar_frame(d_second, i_bar_size_btc)], ignore_index=True)
+    f_vectorized_time = time.perf_counter() - f_time
+
+    # the same trades as separate "days" built from a fresh start and stitched, like
+    # build_volume_bars_parallel
+    ls_days = np.array_split(np.arange(len(a_ts)), 5)
+    d_stitched = {}
+    for i_bar_size_btc in ls_btc_bar_sizes:
+        ls_frames = []
+        d_carry = None
+        for a_day in ls_days:
+            ta_day = (a_ts[a_day], a_price[a_day], a_size[a_day], a_side[a_day])
+            d_fresh_bars, d_fresh_tail = compute_volume_bars(*ta_day, i_bar_size_btc)
+            d_bars, d_carry = stitch_bars(lambda: ta_day, d_fresh_bars, d_fresh_tail, d_carry, compute_volume_bars,
+                                          i_bar_size_btc)
+            ls_frames.append(get_volume_bar_frame(d_bars, i_bar_size_btc))
+        d_stitched[i_bar_size_btc] = pd.concat(ls_frames, ignore_index=True)
+
+    b_ok = True
+    for i_bar_size_btc in ls_btc_bar_sizes:
+        s_reference = d_reference[i_bar_size_btc].to_csv(index=False) if d_reference[i_bar_size_btc] is not None else ''
+        s_vectorized = d_vectorized[i_bar_size_btc].to_csv(index=False) if len(d_vectorized[i_bar_size_btc]) else ''
+        s_stitched = d_stitched[i_bar_size_btc].to_csv(index=False) if len(d_stitched[i_bar_size_btc]) else ''
+        b_same = s_reference == s_vectorized
+        b_stitched_same = s_reference == s_stitched
+        b_ok = b_ok and b_same and b_stitched_same
+        print(f"bar size {i_bar_size_btc}: {len(d_vectorized[i_bar_size_btc])} bars, "
+              f"{'identical' if b_same else 'DIFFERENT'}, stitched {'identical' if b_stitched_same else 'DIFFERENT'}")
+    print(f"{len(df_trade_data)} trades: reference {f_reference_time:.2f}s, vectorized {f_vectorized_time:.2f}s "
+          f"({f_reference_time / f_vectorized_time:.0f}x)")
+    return b_ok
+
+
+def get_day_trade_arrays(s_date):
+    # the trade store is filled from the tardis file on first use
+    ta_trades = load_day_trades(STORE_ROOT, SYMBOL, s_date)
+    if ta_trades is None:
+        ta_trades = get_trade_file_arrays(get_trade_file(s_date))
+        write_trades(STORE_ROOT, SYMBOL, s_date, *ta_trades)
+    return ta_trades
+
 
 def multiprocess_wrapper(ls_args):
-    print("build_volume_bars ", ls_args[0], ls_args[1], ls_args[2])
-    return build_volume_bars(ls_args[0], ls_args[1], ls_args[2])
+    print("build_day_fragment ", ls_args[0], ls_args[1], ls_args[2])
+    return build_day_fragment(ls_args[0], ls_args[1], ls_args[2], get_day_trade_arrays, compute_volume_bars,
+                              get_trade_file)
+
+
+def build_volume_bars_parallel(s_start, s_end, ls_btc_bar_sizes, i_workers=MAX_WORKERS):
+    # days are built in parallel from cached fragments (see tardis_bar_days), the
+    # output files are rewritten as a whole and the days written to the store
+    print("building volume bars in parallel for: ", s_start, s_end, ls_btc_bar_sizes)
+
+    d_out_files = {}
+    for i_bar_size_btc in ls_btc_bar_sizes:
+        out_file = "vb/volume_bar_"+SYMBOL.lower()+"_" + s_start + "_" + s_end + "_" + str(i_bar_size_btc) + ".csv"
+        d_out_files[i_bar_size_btc] = out_file
+        if os.path.exists(out_file + ".tmp"):
+            os.remove(out_file + ".tmp")
+
+    ls_dates = pd.date_range(s_start, s_end).strftime("%Y%m%d").tolist()
+    for s_date, d_bars in build_bar_days(ls_dates, ls_btc_bar_sizes, "vb/fragments", SYMBOL, multiprocess_wrapper,
+                                         get_day_trade_arrays, compute_volume_bars, {}, i_workers):
+        print(f"Stitched date {s_date}")
+        for i_bar_size_btc, d_size_bars in d_bars.items():
+            write_bars(STORE_ROOT, "vb", SYMBOL, i_bar_size_btc, s_date, d_size_bars)
+            if len(d_size_bars['trades']) > 0:
+                tmp_file = d_out_files[i_bar_size_btc] + ".tmp"
+                df_merged = get_volume_bar_frame(d_size_bars, i_bar_size_btc)
+                df_merged.to_csv(tmp_file, mode='a', header=not os.path.exists(tmp_file), index=False)
+
+    for out_file in d_out_files.values():
+        if os.path.exists(out_file + ".tmp"):
+            os.replace(out_file + ".tmp", out_file)
 
 def main():
     #s_end_eod = datetime.strptime(s_end, '%Y%m%d') + pd.Timedelta(hours=24)
@@ -336,7 +599,9 @@ def main():
 
     ls_btc_bar_sizes = [int(f_minute_volume * i) for i in ls_bar_sizes]
 
-    build_volume_bars(s_start, s_end, ls_btc_bar_sizes)
+    build_volume_bars_parallel(s_start, s_end, ls_btc_bar_sizes)
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--check':
+        sys.exit(0 if check_volume_bars(sys.argv[2] if len(sys.argv) > 2 else None) else 1)
     main()
@@ -3,13 +3,22 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import datetime
 
+import indicators
+
 mbar_files = ['../hist_data/mbar/mbar_btcusdt_20210101_20211231_60_sec.csv',
               '../hist_data/mbar/mbar_btcusdt_20220101_20221231_60_sec.csv',
               '../hist_data/mbar/mbar_btcusdt_20230101_20230630_60_sec.csv']
 
-df_vb = pd.DataFrame()
-for datafile in mbar_files:
-    df_vb = pd.concat([df_vb, pd.read_csv(datafile)], ignore_index=True)
+# load the bars from the Parquet store of the bar builders instead of mbar_files (see bar_store.py)
+mbar_store = None
+#mbar_store = {"root": '../hist_data/store', "symbol": "BTCUSDT", "bar_size": 60, "start": "2021-01-01", "end": "2023-07-01"}
+
+if mbar_store is not None:
+    from bar_store import load_bars
+    df_vb = load_bars(mbar_store['root'], 'mbar', mbar_store['symbol'], mbar_store['bar_size'],
+                      mbar_store['start'], mbar_store['end'])
+else:
+    df_vb = pd.concat([pd.read_csv(datafile) for datafile in mbar_files], ignore_index=True)
 
 df_vb['ts_close']=pd.to_datetime(df_vb['closeTimestamp'])
 df_vb['ts_open']=pd.to_datetime(df_vb['openTimestamp'])
@@ -21,29 +30,56 @@ df_day = df_day.groupby(['date']).last()
 df_day = df_day.reset_index()
 
 def hma(df, period):
-     wma_1 = df['close'].rolling(period//2).apply(lambda x: \
-         np.sum(x * np.arange(1, period//2+1)) / np.sum(np.arange(1, period//2+1)), raw=True)
-     wma_2 = df['close'].rolling(period).apply(lambda x: \
-         np.sum(x * np.arange(1, period+1)) / np.sum(np.arange(1, period+1)), raw=True)
-     diff = 2 * wma_1 - wma_2
-     df[f'hma{period}'] = diff.rolling(int(np.sqrt(period))).mean()
-     return hma
-
-for period in (6, 30, 45, 60):
-    df_day[f'ema{period}'] = df_day['close'].ewm(span=period, adjust=False).mean()
-    df_day[f'dema{period}'] = df_day[f'ema{period}']*2 - df_day[f'ema{period}'].ewm(span=period, adjust=False).mean()
+    df[f'hma{period}'] = indicators.hma(df['close'].to_numpy(), period)
+    return df[f'hma{period}']
+
+PERIODS = (6, 30, 45, 60)
+
+for period in PERIODS:
+    df_day[f'ema{period}'] = indicators.ema(df_day['close'].to_numpy(), period)
+    df_day[f'dema{period}'] = indicators.dema(df_day['close'].to_numpy(), period)
     hma(df_day,period)
-  
+
+# the indicator state after the last day, for add_day
+indicator_states = {period: indicators.IndicatorState(period).update_all(df_day['close'].to_numpy()) for period in PERIODS}
+
+# sorted day midnights of df_day for the lookups
+day_index = pd.to_datetime(df_day['date']).to_numpy()
+
+def get_day_row(timestamp):
+    # the first day at or after timestamp
+    i_day = np.searchsorted(day_index, pd.to_datetime(timestamp).to_datetime64())
+    if i_day == len(day_index):
+        raise IndexError(f"no day at or after {timestamp}")
+    return i_day
+
 def get_hma30(timestamp):
-    return df_day[df_day['date'] >= pd.to_datetime(timestamp)].head(1)['ema30'].values[0]
+    # (the ema30, as it always returned)
+    return df_day['ema30'].to_numpy()[get_day_row(timestamp)]
 
 def get_dema30(timestamp):
-    return df_day[df_day['date'] >= pd.to_datetime(timestamp)].head(1)['dema30'].values[0]
+    return df_day['dema30'].to_numpy()[get_day_row(timestamp)]
+
+def get_day_ind(df_day):
+    df_day_ind = df_day[['date', 'ema6', 'hma30', 'dema30', 'hma45', 'dema45', 'hma60', 'dema60']].copy()    
+
+    # a date is mapped to its previous date's indicators for practical use
+    df_day_ind['date'] = df_day_ind['date'] + datetime.timedelta(days=1)
+    return df_day_ind
 
-df_day_ind = df_day[['date', 'ema6', 'hma30', 'dema30', 'hma45', 'dema45', 'hma60', 'dema60']].copy()    
+df_day_ind = get_day_ind(df_day)
 
-# a date is mapped to its previous date's indicators for practical use
-df_day_ind['date'] = df_day_ind['date'] + datetime.timedelta(days=1)
+def add_day(date, ts_close, close):
+    # appends the close of a new day after the last one, its indicators only take the last values
+    global df_day, df_day_ind, day_index
+    d_row = {'date': date, 'ts_close': ts_close, 'close': close}
+    for period, o_state in indicator_states.items():
+        o_state.update(close)
+        d_row.update({f'ema{period}': o_state.ema, f'dema{period}': o_state.dema, f'hma{period}': o_state.hma})
+    df_row = pd.DataFrame([d_row], columns=df_day.columns)
+    df_day = pd.concat([df_day, df_row], ignore_index=True)
+    df_day_ind = pd.concat([df_day_ind, get_day_ind(df_row)], ignore_index=True)
+    day_index = np.append(day_index, pd.to_datetime(date).to_datetime64())
 
 
 if __name__ == "__main__":
@@ -14,6 +14,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
 
 # In[ ]:
@@ -21,6 +22,8 @@ import pandas as pd
 
 filter_dup = True
 split_cnt = 1
+# bars after a signal of an expectancy curve
+EXPECTANCY_BARS = 50
 
 config = {
     "common": {
@@ -45,6 +48,14 @@ config = {
     "data": {
         "vbar_file": '../hist_data/vb/volume_bar_btcusdt_20220101_20230630_3880.csv',
         #"vbar_file": '../hist_data/vb/volume_bar_btcusdt_20210101_20211231_3880.csv',
+        # load the bars from the Parquet store of the bar builders instead of vbar_file,
+        # only the dates in range are read (see bar_store.py)
+        "vbar_store": None,
+        #"vbar_store": {"root": '../hist_data/store', "symbol": "BTCUSDT", "bar_size": 3880},
+        # the derived bar columns of derive_data are cached here and reused while the bars, the
+        # range, the split, duration/consecutive and the code of derive_data stay the same
+        # (see feature_cache.py), None to derive them on every run
+        "feature_cache": '../hist_data/features',
         "split_cnt": split_cnt,  # 1 means no split
         "use_range_filter": True,
         "start_date": "2022-01-01", 
@@ -83,14 +94,20 @@ def get_model_str(model):
     s= "".join(["_" + short_key_map[key] + "_" + str(model[key]) if short_key_map[key] is not None else "" for key in model])
     return s.replace("(","").replace(")","").replace(",","_").replace(" ","")
 
-def load_data(split_idx, model):
-    global df_vb
-   
+def derive_data(split_idx, model):
     duration = model['duration_multiple']
     consecutive= model['consecutive']
     trend_period= model['trend_period']
     
-    df_vb = pd.read_csv(config['data']['vbar_file'])
+    d_store = config['data'].get('vbar_store')
+    if d_store is not None:
+        from bar_store import load_bars
+        b_range = config['data']['use_range_filter']
+        df_vb = load_bars(d_store['root'], 'vb', d_store['symbol'], d_store['bar_size'],
+                          config['data']['start_date'] if b_range else None,
+                          config['data']['end_date'] if b_range else None)
+    else:
+        df_vb = pd.read_csv(config['data']['vbar_file'])
 
     # Set the timestamp to be the index for the data
     df_vb['ts_local'] = pd.to_datetime(df_vb['localTimestamp'])
@@ -136,7 +153,34 @@ def load_data(split_idx, model):
         pd.set_option('display.max_rows', 20)
         print(df_vb)
         len(df_vb)
-        
+    return df_vb
+
+def get_source_files():
+    d_store = config['data'].get('vbar_store')
+    if d_store is None:
+        return [config['data']['vbar_file']]
+    from bar_store import get_bar_files
+    b_range = config['data']['use_range_filter']
+    return get_bar_files(d_store['root'], 'vb', d_store['symbol'], d_store['bar_size'],
+                         config['data']['start_date'] if b_range else None,
+                         config['data']['end_date'] if b_range else None)
+
+def load_data(split_idx, model):
+    # derive_data, from the feature cache if it is there (the features only depend on
+    # duration_multiple and consecutive, the dispersions of a duration share them)
+    global df_vb
+
+    s_cache_dir = config['data'].get('feature_cache')
+    if s_cache_dir is None:
+        df_vb = derive_data(split_idx, model)
+        return
+    from feature_cache import load_features
+    d_params = {key: config['data'].get(key) for key in ['vbar_file', 'vbar_store', 'split_cnt', 'use_range_filter',
+                                                         'start_date', 'end_date']}
+    d_params.update(split_idx=split_idx, duration_multiple=model['duration_multiple'],
+                    consecutive=model['consecutive'])
+    df_vb = load_features(s_cache_dir, get_source_files(), [derive_data], d_params,
+                          lambda: derive_data(split_idx, model))
         
         
 
@@ -146,37 +190,24 @@ def load_data(split_idx, model):
 # In[ ]:
 
 
-#@numba.njit
 def process_orders(b, ts_close, model):
-    n = len(b)
-    #b = np.full(n, 0, dtype=np.int32)
-    #print(b)
-    
-    #prev_buy_distance = expectancy
-    #prev_sell_distance = expectancy
-    
-
-    dps = []
-    
-    prev_candidate_signal_index = -1
-    for i in range(30, n-50):
-        
-        current_price = b[i][1]
-        
-        #book entry order
-        side = signal = b[i][0]
-        entry_price = b[i][1]
-        
-        if signal != 0:
-            if not filter_dup or i - prev_candidate_signal_index > 1:
-                ret={"bar_seq":[], "expectancy": []}
-                for j in range(0,51):
-                    bps = side * (b[i+j][1] - current_price)/current_price * 10000
-                    ret["bar_seq"].append(j)
-                    ret["expectancy"].append(bps)
-                dps.append((ret, ts_close[i]))
-            prev_candidate_signal_index = i    
-    return dps
+    # the returns (bps) of the closes of the signal bar (bar_seq 0) and the EXPECTANCY_BARS bars after
+    # it, one row per signal bar, and the ts_close of the signal bars; with filter_dup a signal right
+    # after another is skipped
+    a_signal = np.asarray(b[:, 0], dtype=np.float64)
+    a_close = np.asarray(b[:, 1], dtype=np.float64)
+    n = len(a_close)
+    if n - EXPECTANCY_BARS <= 30:
+        return np.empty((0, EXPECTANCY_BARS + 1)), np.asarray(ts_close)[:0]
+
+    a_index = np.flatnonzero(a_signal[30:n - EXPECTANCY_BARS]) + 30
+    if filter_dup:
+        a_index = a_index[np.diff(a_index, prepend=-1) > 1]
+
+    a_price = a_close[a_index, None]
+    a_forward = sliding_window_view(a_close, EXPECTANCY_BARS + 1)[a_index]
+    a_expectancy = a_signal[a_index, None] * (a_forward - a_price) / a_price * 10000
+    return a_expectancy, np.asarray(ts_close)[a_index]
 
 def calculate_signal(model):
     global df_vb
@@ -190,8 +221,7 @@ def calculate_signal(model):
     df_vb['signal'] = np.where((df_vb.consecutive >= consecutive) & (- dispersion[1] < (df_vb.close - df_vb.bwd30_open)/df_vb.bwd30_open) & ((df_vb.close - df_vb.bwd30_open)/df_vb.bwd30_open <= - dispersion[0]) ,  1, df_vb.signal)
     df_vb['signal'] = np.where((df_vb.consecutive >= consecutive) & (  dispersion[1] > (df_vb.close - df_vb.bwd30_open)/df_vb.bwd30_open) & ((df_vb.close - df_vb.bwd30_open)/df_vb.bwd30_open >=   dispersion[0]) , -1, df_vb.signal)
     
-    dps = process_orders(df_vb[['signal', 'close']].to_numpy(), df_vb['ts_close'].to_numpy(), model)
-    return dps
+    return process_orders(df_vb[['signal', 'close']].to_numpy(), df_vb['ts_close'].to_numpy(), model)
 
 
 # In[ ]:
@@ -203,7 +233,8 @@ def calculate_signal(model):
 # In[ ]:
 
 
-def plot_cumulative_return(model, dps, split_index, use_average):
+def plot_cumulative_return(model, expectancy, split_index, use_average):
+    a_expectancy, a_ts_close = expectancy
     
     plt.figure(figsize=(10, 7))
     
@@ -215,33 +246,28 @@ def plot_cumulative_return(model, dps, split_index, use_average):
     filename = 'expectancy_cureve_vb_3880_%s.png'%title    
     csv_file = 'expectancy_cureve_vb_3880_%s.csv'%title    
 
-    print(f"{filename} has {len(dps)} data points")
+    print(f"{filename} has {len(a_expectancy)} data points")
     
     if not use_average:
-        print(f"{filename} #datapoints = {len(dps)}")
+        print(f"{filename} #datapoints = {len(a_expectancy)}")
 
-        for dp in dps:
-            df_expe = pd.DataFrame(dp[0])  
-            plt.plot(df_expe.bar_seq, df_expe.expectancy)
-            #plt.plot(x, np.sin(x), label = "curve 1")
-            #plt.legend()
+        if len(a_expectancy):
+            # a line per signal
+            plt.plot(np.arange(EXPECTANCY_BARS + 1), a_expectancy.T)
             plt.xlabel('Bar sequence')
             plt.ylabel('Expectancy (bps)')
             
 
-        #generate csv file for the expectancy data
-        df_expe = pd.DataFrame()    
-        for dp in dps:
-            row = pd.DataFrame(dp[0])[['expectancy']].T
-            row['ts_close'] = dp[1]
-            df_expe = pd.concat([df_expe, row], ignore_index=True)
+        #generate csv file for the expectancy data, columns 0 to EXPECTANCY_BARS
+        df_expe = pd.DataFrame(a_expectancy)
+        df_expe['ts_close'] = a_ts_close
         
         df_expe = pd.merge(left=df_expe, right=df_vb, how='left', left_on='ts_close', right_on='ts_close')
         
         print ("columns=", df_expe.columns)
         
         
-        cols=[i for i in range(1,51)]
+        cols=[i for i in range(1,EXPECTANCY_BARS+1)]
         cols=['ts_close', 'open', 'high', 'low', 'close', 'volume', 'buyVolume', 'sellVolume', 'trades', 'vwap', 'ts_open', 'ts_close', 'duration', 'duration_sma100', 'duration_ratio', 'consecutive', 'vol_imb', 'tp6_aggr', 'tp6', 'tp30', 'signal'] + cols
         
         #print("cols=", cols)
@@ -253,15 +279,14 @@ def plot_cumulative_return(model, dps, split_index, use_average):
         df_expe.to_csv(csv_file, index=False)
             
     else:
-        if len(dps) == 0:
+        if len(a_expectancy) == 0:
             print(f"{filename} ignored, no data points available")
+            plt.close()
             return
 
-        df_expe = pd.concat([pd.DataFrame(dp[0]) for dp in dps], ignore_index=True)
-        
-        df_expe = df_expe.groupby('bar_seq')[['expectancy']].mean()
+        df_expe = pd.DataFrame({'expectancy': a_expectancy.mean(axis=0), 'median': np.median(a_expectancy, axis=0)},
+                               index=pd.Index(np.arange(EXPECTANCY_BARS + 1), name='bar_seq'))
         #print("df_expe=\n", df_expe)
-        #plt.plot(df_expe.bar_seq, df_expe.expectancy)
         df_expe.plot()
         #plt.plot(x, np.sin(x), label = "curve 1")
         #plt.legend()
@@ -271,6 +296,8 @@ def plot_cumulative_return(model, dps, split_index, use_average):
     plt.title(title)
     plt.savefig(filename)    
     #plt.show()
+    # a sweep would keep every figure open
+    plt.close('all')
 
 
 # In[ ]:
@@ -302,8 +329,8 @@ for model in models:
 
         for split_idx in range(config['data']['split_cnt']):
             load_data(split_idx, model)
-            dps=calculate_signal(model)
-            plot_cumulative_return(model, dps, split_idx, True)
-            plot_cumulative_return(model, dps, split_idx, False)
+            expectancy=calculate_signal(model)
+            plot_cumulative_return(model, expectancy, split_idx, True)
+            plot_cumulative_return(model, expectancy, split_idx, False)
 
 
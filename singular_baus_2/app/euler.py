@@ -1,4 +1,5 @@
 import sys
+import signal
 import asyncio
 import threading
 import logging
@@ -7,6 +8,7 @@ import datetime as dt
 # Singular
 import singular
 import singular.config
+from singular.utilities.time import tracer
 
 # Euler
 import euler.system
@@ -16,12 +18,23 @@ def main(path):
     logging.basicConfig(filename="euler.log", level=logging.INFO)
 
     config = singular.config.Config(path)
+
+    if config.get_json().get("tracing", {}).get("enabled", False):
+        # before the gateway processes fork so they trace as well; kill -USR1
+        # dumps the stage histograms of a process
+        tracer.enable()
+        signal.signal(signal.SIGUSR1, lambda signum, frame: tracer.report())
         
     dispatcher = euler.system.Dispatcher(None, config.get_json())
     dispatcher.run()
 
     strategy_manager = euler.strategy.StrategyManager(config.get_json(), dispatcher)
 
+    if config.get_json().get("scheduler", {}).get("mode") == "event":
+        # blocks on gateway readiness instead of spinning
+        scheduler = euler.system.Scheduler(config.get_json(), dispatcher, strategy_manager)
+        scheduler.run()
+
     counter = 0
     while True:
         # drains gateway queues and puts events on strategy queues
@@ -1,23 +1,60 @@
 import queue
 
+# Singular
+from singular.event import (PlaceAck, PlaceReject, CancelAck, CancelReject, ModifyAck, Fill,
+                            TopOfBookUpdate, OrderbookSnapshot, OrderbookLevelUpdate, Trade,
+                            GatewayDisconnect)
+from singular.utilities.dispatch import HandlerTable
+from singular.utilities.time import tracer
+
+ORDERBOOK_EVENT_TYPES = [TopOfBookUpdate, OrderbookSnapshot, OrderbookLevelUpdate]
+
 class AbstractStrategy:
     def __init__(self, strategy_id, dispatcher, event_queue, config):
         self.strategy_id = strategy_id
         self.dispatcher = dispatcher
         self.event_queue = event_queue
 
+        # handle_event routes to the typed on_* methods below, unless a
+        # strategy overrides handle_event itself
+        self.event_handlers = HandlerTable(self.on_event)
+        self.event_handlers.register(PlaceAck, self.on_place_ack)
+        self.event_handlers.register(PlaceReject, self.on_place_reject)
+        self.event_handlers.register(CancelAck, self.on_cancel_ack)
+        self.event_handlers.register(CancelReject, self.on_cancel_reject)
+        self.event_handlers.register(ModifyAck, self.on_modify_ack)
+        self.event_handlers.register(Fill, self.on_fill)
+        self.event_handlers.register(Trade, self.on_trade)
+        self.event_handlers.register(GatewayDisconnect, self.on_gateway_disconnect)
+        self.event_handlers.register(TopOfBookUpdate, self.on_top_of_book)
+        self.event_handlers.register(OrderbookSnapshot, self.on_orderbook_snapshot)
+        self.event_handlers.register(OrderbookLevelUpdate, self.on_orderbook_level_update)
+
+        # book events only reach strategies that implement a book handler
+        if type(self).on_top_of_book is not AbstractStrategy.on_top_of_book or\
+                type(self).on_orderbook_snapshot is not AbstractStrategy.on_orderbook_snapshot or\
+                type(self).on_orderbook_level_update is not AbstractStrategy.on_orderbook_level_update:
+            self.dispatcher.forward_orderbook_events(self.strategy_id)
+
     ### Strategy Manager Interface ###
 
     def update(self):
-        while True:
-            try:
-                event = self.event_queue.get_nowait()
-            except queue.Empty:
-                break
-            else:
-                self.handle_event(event)
-        
-        self.update_state()
+        if tracer.enabled:
+            tracer.mark_handle(self.dispatcher.pop_strategy_trace(self.strategy_id))
+
+        try:
+            while True:
+                try:
+                    event = self.event_queue.get_nowait()
+                except queue.Empty:
+                    break
+                else:
+                    self.handle_event(event)
+
+            self.update_state()
+        finally:
+            if tracer.enabled:
+                tracer.end_handle()
 
     ### Strategy Inbound Interface ###
 
@@ -45,16 +82,64 @@ class AbstractStrategy:
         print("AbstractStrategy: subscribe_fills")
         self.dispatcher.subscribe_fills(self.strategy_id, account)
 
+    def add_timer(self, interval):
+        # in event scheduling mode update() is only called when events arrive
+        # or a registered timer fires; interval is in seconds
+        self.dispatcher.add_timer(self.strategy_id, interval)
+
     def get_orderbook(self, instrument):
         return self.dispatcher.get_orderbook(instrument)
 
     def get_funding(self, account, instrument):
         return self.dispatcher.get_funding(account, instrument)
 
+    def register_handler(self, event_type, handler):
+        self.event_handlers.register(event_type, handler)
+        if event_type in ORDERBOOK_EVENT_TYPES:
+            self.dispatcher.forward_orderbook_events(self.strategy_id)
+
     ### Virtual Strategy Methods ###
 
     def update_state(self):
         pass
 
     def handle_event(self, event):
+        self.event_handlers.dispatch(event)
+
+    ### Virtual Event Handlers ###
+
+    def on_place_ack(self, event):
+        pass
+
+    def on_place_reject(self, event):
+        pass
+
+    def on_cancel_ack(self, event):
+        pass
+
+    def on_cancel_reject(self, event):
+        pass
+
+    def on_modify_ack(self, event):
+        pass
+
+    def on_fill(self, event):
+        pass
+
+    def on_trade(self, event):
+        pass
+
+    def on_gateway_disconnect(self, event):
+        pass
+
+    def on_top_of_book(self, event):
+        pass
+
+    def on_orderbook_snapshot(self, event):
+        pass
+
+    def on_orderbook_level_update(self, event):
+        pass
+
+    def on_event(self, event):
         pass
\ No newline at end of file
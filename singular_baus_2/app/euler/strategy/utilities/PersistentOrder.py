@@ -1,5 +1,6 @@
 from singular.core import Order, Side
 from singular.event import  PlaceAck, ModifyAck, CancelAck, Fill, PlaceReject, CancelReject
+from singular.utilities.dispatch import HandlerTable
 
 EPS = 0.0000001
 
@@ -19,6 +20,12 @@ class PersistentOrder:
         self.pending = False
         self.active = False
 
+        self.update_handlers = HandlerTable()
+        self.update_handlers.register(PlaceAck, self.handle_place_ack)
+        self.update_handlers.register_all([CancelAck, PlaceReject], self.handle_close)
+        self.update_handlers.register(CancelReject, self.handle_cancel_reject)
+        self.update_handlers.register(Fill, self.handle_fill)
+
     def get_order_id(self):
         return self.order_id
 
@@ -26,31 +33,34 @@ class PersistentOrder:
         return self.order_ids
 
     def handle_update(self, update):
-        if type(update) == PlaceAck:
-            self.pending = False
-            self.active = True
-            self.order.set_price(update.price)
-            self.order.set_quantity(update.quantity)
-        elif type(update) == CancelAck or type(update) == PlaceReject:
-            self.pending = False
+        self.update_handlers.dispatch(update)
+
+    def handle_place_ack(self, update):
+        self.pending = False
+        self.active = True
+        self.order.set_price(update.price)
+        self.order.set_quantity(update.quantity)
+
+    def handle_close(self, update):
+        self.pending = False
+        self.active = False
+        self.order.set_price(None)
+        self.order.set_quantity(None)
+        self.order_id = None
+
+    def handle_cancel_reject(self, update):
+        self.pending = False
+
+    def handle_fill(self, update):
+        remaining_quantity = self.order.get_quantity() - update.quantity
+        self.order.set_quantity(remaining_quantity)
+        if (remaining_quantity < EPS):  # order fully filled, close it
+            # print("Closing ", self.order_id)
             self.active = False
+            self.pending = False
             self.order.set_price(None)
             self.order.set_quantity(None)
             self.order_id = None
-        elif type(update) == CancelReject:
-            self.pending = False
-        elif type(update) == Fill:
-            remaining_quantity = self.order.get_quantity() - update.quantity
-            self.order.set_quantity(remaining_quantity)
-            if (remaining_quantity < EPS):  # order fully filled, close it
-                # print("Closing ", self.order_id)
-                self.active = False
-                self.pending = False
-                self.order.set_price(None)
-                self.order.set_quantity(None)
-                self.order_id = None
-        else:
-            pass
 
     def update(self, active, price, quantity):
         if active:
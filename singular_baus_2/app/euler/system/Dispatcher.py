@@ -1,10 +1,14 @@
 from datetime import datetime
+import time
+import heapq
 import queue
 import logging
 
 # Singular
 from singular.gateway.GatewayCallbacks import GatewayCallbacks
-from singular.event import TopOfBookUpdate, Trade
+from singular.event import TopOfBookUpdate, OrderbookSnapshot, OrderbookLevelUpdate, Trade
+from singular.utilities.dispatch import HandlerTable
+from singular.utilities.time import tracer
 
 # Euler
 from euler.system.GatewayManagementSystem import GatewayManagementSystem
@@ -33,9 +37,28 @@ class Dispatcher:
         ### Messaging ###
         self.strategy_event_queues = {}
 
+        ### Scheduling ###
+        self.ready_strategies = set()
+        self.timers = []
+        # replaced by the replay clock when replaying
+        self.clock = time.monotonic
+
         ### Marketdata ###
         self.orderbook_subscriptions = {}
+        self.orderbook_strategies = {}
+        self.orderbook_event_strategies = set()
         self.trade_subscriptions = {}
+        # instrument key -> (mapped orderbook, version last seen); mapped books
+        # change without events, so the scheduler polls them
+        self.mapped_orderbooks = {}
+        # strategy_id -> trace of the last traced tick sent to or waking the
+        # strategy, taken by its next update
+        self.strategy_traces = {}
+
+        self.marketdata_handlers = HandlerTable()
+        self.marketdata_handlers.register(Trade, self.handle_trade)
+        self.marketdata_handlers.register_all([TopOfBookUpdate, OrderbookSnapshot, OrderbookLevelUpdate],
+                                              self.handle_orderbook_event)
 
     ### Main Interface ###
 
@@ -80,10 +103,20 @@ class Dispatcher:
         else:
             self.orderbook_subscriptions[key] = [strategy_id]
 
+        instrument_key = (instrument.get_exchange(), instrument.get_external_symbol())
+        if instrument_key in self.orderbook_strategies.keys():
+            self.orderbook_strategies[instrument_key].add(strategy_id)
+        else:
+            self.orderbook_strategies[instrument_key] = {strategy_id}
+
         not_mapped = self.orderbook_management_system.subscribe_orderbook(instrument)
 
         if not_mapped:
             self.gateway_management_system.subscribe_orderbook(account, instrument)
+        else:
+            orderbook = self.orderbook_management_system.get_mapped_orderbook(instrument)
+            if orderbook is not None and instrument_key not in self.mapped_orderbooks:
+                self.mapped_orderbooks[instrument_key] = (orderbook, orderbook.get_version())
 
     def subscribe_trades(self, strategy_id, account, instrument):
         # add strategy_id to trades_subscription list for given 
@@ -97,6 +130,14 @@ class Dispatcher:
 
         self.gateway_management_system.subscribe_trades(account, instrument)
 
+    def forward_orderbook_events(self, strategy_id):
+        # book events normally only update the book and wake the strategy,
+        # strategies with book handlers also get the events themselves
+        self.orderbook_event_strategies.add(strategy_id)
+
+    def add_timer(self, strategy_id, interval):
+        heapq.heappush(self.timers, (self.clock() + interval, strategy_id, interval))
+
     def get_orderbook(self, instrument):
         return self.orderbook_management_system.get_orderbook(instrument)
 
@@ -107,6 +148,41 @@ class Dispatcher:
 
     def send_event(self, strategy_id, event):
         self.strategy_event_queues[strategy_id].put(event)
+        self.ready_strategies.add(strategy_id)
+
+    ### Scheduler Interface ###
+
+    def get_next_timer_deadline(self):
+        if self.timers:
+            return self.timers[0][0]
+        else:
+            return None
+
+    def poll_mapped_orderbooks(self):
+        # wakes the strategies of mapped books written since the last poll
+        for instrument_key, (orderbook, version) in self.mapped_orderbooks.items():
+            current_version = orderbook.get_version()
+            if current_version != version:
+                self.mapped_orderbooks[instrument_key] = (orderbook, current_version)
+                self.ready_strategies.update(self.orderbook_strategies.get(instrument_key, ()))
+
+    def pop_ready_strategies(self):
+        if self.mapped_orderbooks:
+            self.poll_mapped_orderbooks()
+
+        now = self.clock()
+        while self.timers and self.timers[0][0] <= now:
+            deadline, strategy_id, interval = heapq.heappop(self.timers)
+            self.ready_strategies.add(strategy_id)
+            # skip missed periods rather than firing a burst
+            heapq.heappush(self.timers, (max(deadline + interval, now), strategy_id, interval))
+
+        ready_strategies = self.ready_strategies
+        self.ready_strategies = set()
+        return ready_strategies
+
+    def pop_strategy_trace(self, strategy_id):
+        return self.strategy_traces.pop(strategy_id, None)
 
     ### Gateway Inbound Interface ###
 
@@ -119,12 +195,29 @@ class Dispatcher:
             self.send_event(strategy_id, event)
 
     def handle_marketdata_event(self, event):
-        if type(event) == Trade:
-            key = (event.instrument.exchange, event.instrument.external_symbol)
-            for strategy_id in self.trade_subscriptions[key]:
-                self.send_event(strategy_id, event)
-        elif type(event) == TopOfBookUpdate:
-            self.orderbook_management_system.handle_event(event)
+        self.marketdata_handlers.dispatch(event)
+
+    def set_strategy_traces(self, event, strategy_ids):
+        if tracer.enabled and event.trace is not None:
+            for strategy_id in strategy_ids:
+                self.strategy_traces[strategy_id] = event.trace
+
+    def handle_trade(self, event):
+        key = (event.instrument.exchange, event.instrument.external_symbol)
+        for strategy_id in self.trade_subscriptions[key]:
+            self.send_event(strategy_id, event)
+        self.set_strategy_traces(event, self.trade_subscriptions[key])
+
+    def handle_orderbook_event(self, event):
+        self.orderbook_management_system.handle_event(event)
+        key = (event.instrument.get_exchange(), event.instrument.get_external_symbol())
+        if self.orderbook_event_strategies:
+            for strategy_id in self.orderbook_strategies.get(key, ()):
+                if strategy_id in self.orderbook_event_strategies:
+                    self.send_event(strategy_id, event)
+                else:
+                    self.ready_strategies.add(strategy_id)
         else:
-            pass
+            self.ready_strategies.update(self.orderbook_strategies.get(key, ()))
+        self.set_strategy_traces(event, self.orderbook_strategies.get(key, ()))
     
\ No newline at end of file
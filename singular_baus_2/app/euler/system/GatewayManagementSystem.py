@@ -1,5 +1,5 @@
 # Singular
-from singular.gateway import MultiprocessingGateway
+from singular.gateway import MultiprocessingGateway, ReplayGateway
 
 from singular.config import exchange_str_to_exchange
 from singular.core import Exchange
@@ -17,7 +17,11 @@ class GatewayManagementSystem:
     def register_gateway(self, config):
         exchange = exchange_str_to_exchange(config["account"]["exchange"])
         key = (exchange, config["account"]["name"])
-        self.gateway_map[key] = MultiprocessingGateway(self.callbacks, config)
+        if "replay" in self.config:
+            # driven by euler.system.ReplayEngine from recorded market data
+            self.gateway_map[key] = ReplayGateway(self.callbacks, config, self.config["replay"])
+        else:
+            self.gateway_map[key] = MultiprocessingGateway(self.callbacks, config)
 
     def run(self):
         for gateway in self.gateway_map.values():
@@ -1,15 +1,43 @@
 import mmap
-import struct
+import datetime as dt
 
 from singular.core import Orderbook, OrderbookLevel, Side
 from singular.config import exchange_str_to_exchange
 
 ### TODO: maybe lift this from this file at some point
 
+# One slot of data_size bytes per symbol, made of 8 byte words:
+#   version     seqlock counter, odd while the writer is mid-update
+#   timestamp   ns since epoch of the last update
+#   sequence    exchange sequence of the last update
+#   depth       number of levels per side that follow the top of book
+#   best bid price, best bid quantity, best ask price, best ask quantity
+#   depth bid (price, quantity) pairs, then depth ask (price, quantity) pairs
+# An empty side has NaN prices.
+
+VERSION = 0
+TIMESTAMP = 1
+SEQUENCE = 2
+DEPTH = 3
+BID_PRICE = 4
+BID_QUANTITY = 5
+ASK_PRICE = 6
+ASK_QUANTITY = 7
+LEVELS = 8
+WORD_SIZE = 8
+
+# reads of a slot the writer holds (odd version) or changes under us before
+# the last consistent values are returned as stale; a writer that died
+# mid-update leaves the version odd for good
+MAX_READ_RETRIES = 100000
+
+def get_max_depth(data_size):
+    return max((data_size // WORD_SIZE - LEVELS) // 4, 0)
+
 class MappedMemoryClient:
     def __init__(self, path):
         self.path = path
-        self.file = open(path, mode="r", encoding="utf8")
+        self.file = open(path, mode="rb")
         self.shared_memory = mmap.mmap(
             self.file.fileno(), length=0, access=mmap.ACCESS_READ
         )
@@ -18,22 +46,121 @@ class MappedMemoryClient:
         self.shared_memory.seek(offset)
         return self.shared_memory.read(length)
 
-# This has the same interface as Orderbook
+    def get_view(self, offset, length):
+        return memoryview(self.shared_memory)[offset:offset + length]
+
+# This has the same interface as Orderbook. Reads go straight to the mapping
+# through memoryview casts and are retried until the version is even and
+# unchanged across the read. The returned levels are owned by the orderbook
+# and updated in place on the next read that sees a new version, read
+# both sides with get_top_of_book to get a consistent pair. After
+# MAX_READ_RETRIES failed reads the last consistent values are kept and
+# stale is set until a read succeeds again.
 
 class MappedOrderbook:
     def __init__(self, mapped_memory_client, offset, data_size):
         self.mapped_memory_client = mapped_memory_client
         self.offset = offset
         self.data_size = data_size
-    
+        view = mapped_memory_client.get_view(offset, data_size - data_size % WORD_SIZE)
+        self.integers = view.cast("q")
+        self.floats = view.cast("d")
+
+        self.version = -1
+        self.timestamp = 0
+        self.sequence = 0
+        self.bid_level = OrderbookLevel(None, Side.BUY, None, None)
+        self.ask_level = OrderbookLevel(None, Side.SELL, None, None)
+        self.best_bid_level = None
+        self.best_ask_level = None
+        self.top_of_book = (None, None)
+        self.levels = {Side.BUY: [], Side.SELL: []}
+        self.stale = False
+        self.stale_version = None
+
+    def set_stale(self):
+        # the version a stale read gave up on, reads of the same version
+        # return the last values without retrying
+        version = self.integers[VERSION]
+        if not self.stale:
+            print("MappedOrderbook: stale book at offset", self.offset,
+                  "version", version, "after", MAX_READ_RETRIES, "reads")
+        self.stale = True
+        self.stale_version = version
+
+    def is_stuck(self):
+        return self.stale and self.integers[VERSION] == self.stale_version
+
+    def refresh(self):
+        integers = self.integers
+        floats = self.floats
+        if self.is_stuck():
+            return
+        for _ in range(MAX_READ_RETRIES):
+            version = integers[VERSION]
+            if version == self.version:
+                self.stale = False
+                return
+            if version & 1:
+                continue
+            bid_price = floats[BID_PRICE]
+            bid_quantity = floats[BID_QUANTITY]
+            ask_price = floats[ASK_PRICE]
+            ask_quantity = floats[ASK_QUANTITY]
+            timestamp = integers[TIMESTAMP]
+            sequence = integers[SEQUENCE]
+            if integers[VERSION] == version:
+                break
+        else:
+            self.set_stale()
+            return
+
+        self.stale = False
+        self.version = version
+        self.timestamp = timestamp
+        self.sequence = sequence
+
+        # NaN marks an empty side
+        if bid_price == bid_price:
+            self.bid_level.price = bid_price
+            self.bid_level.quantity = bid_quantity
+            self.best_bid_level = self.bid_level
+        else:
+            self.best_bid_level = None
+
+        if ask_price == ask_price:
+            self.ask_level.price = ask_price
+            self.ask_level.quantity = ask_quantity
+            self.best_ask_level = self.ask_level
+        else:
+            self.best_ask_level = None
+
+        self.top_of_book = (self.best_bid_level, self.best_ask_level)
+
     def get_data(self):
-        return struct.unpack("dd", self.client.read(self.offset, self.data_size))
+        self.refresh()
+        return (self.bid_level.price if self.best_bid_level else None,
+                self.ask_level.price if self.best_ask_level else None)
 
     def get_instrument(self):
         return None
 
     def get_last_update_dt(self):
-        return None
+        self.refresh()
+        if self.timestamp == 0:
+            return None
+        return dt.datetime.fromtimestamp(self.timestamp / 1e9)
+
+    def get_sequence(self):
+        self.refresh()
+        return self.sequence
+
+    def is_stale(self):
+        return self.stale
+
+    def get_version(self):
+        # changes with every write, no event announces them
+        return self.integers[VERSION]
 
     def get_bids(self):
         return None
@@ -42,20 +169,51 @@ class MappedOrderbook:
         return None
 
     def get_best_bid_level(self):
-        return OrderbookLevel(
-            None,
-            Side.BUY,
-            struct.unpack("dd", self.mapped_memory_client.read(self.offset, self.data_size))[0],
-            None
-        )
+        self.refresh()
+        return self.best_bid_level
 
     def get_best_ask_level(self):
-        return OrderbookLevel(
-            None,
-            Side.SELL,
-            struct.unpack("dd", self.mapped_memory_client.read(self.offset, self.data_size))[1],
-            None
-        )
+        self.refresh()
+        return self.best_ask_level
+
+    def get_top_of_book(self):
+        self.refresh()
+        return self.top_of_book
+
+    def get_levels(self, side, depth=None):
+        # consistent copy of up to depth (price, quantity) levels, best first
+        integers = self.integers
+        floats = self.floats
+        max_depth = get_max_depth(self.data_size)
+        if self.is_stuck():
+            return self.levels[side][:depth]
+        for _ in range(MAX_READ_RETRIES):
+            version = integers[VERSION]
+            if version & 1:
+                continue
+            available = min(integers[DEPTH], max_depth)
+            count = available if depth is None else min(depth, available)
+            start = LEVELS if side == Side.BUY else LEVELS + 2 * available
+            values = floats[start:start + 2 * count].tolist()
+            if integers[VERSION] == version:
+                break
+        else:
+            self.set_stale()
+            # (as deep as the last consistent read)
+            return self.levels[side][:depth]
+
+        self.stale = False
+        # the shorter side is padded with NaN levels
+        while values and values[-2] != values[-2]:
+            del values[-2:]
+        self.levels[side] = list(zip(values[0::2], values[1::2]))
+        return list(self.levels[side])
+
+    def get_bid_levels(self, depth=None):
+        return self.get_levels(Side.BUY, depth)
+
+    def get_ask_levels(self, depth=None):
+        return self.get_levels(Side.SELL, depth)
 
 class OrderbookManagementSystem:
     def __init__(self, config):
@@ -76,12 +234,16 @@ class OrderbookManagementSystem:
                     service["data_size"]
                 )
 
-                offset += 1
+                offset += service["data_size"]
 
     def get_orderbook(self, instrument):
         key = (instrument.get_exchange(), instrument.get_external_symbol())
         return self.orderbook_map[key]
 
+    def get_mapped_orderbook(self, instrument):
+        orderbook = self.get_orderbook(instrument)
+        return orderbook if isinstance(orderbook, MappedOrderbook) else None
+
     def subscribe_orderbook(self, instrument):
         key = (instrument.get_exchange(), instrument.get_external_symbol())
         if (key in self.orderbook_map.keys()):
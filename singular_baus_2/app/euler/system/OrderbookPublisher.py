@@ -0,0 +1,219 @@
+import os
+import mmap
+import time
+import logging
+import selectors
+
+# Singular
+from singular.gateway.GatewayCallbacks import GatewayCallbacks
+from singular.event import TopOfBookUpdate, OrderbookSnapshot, OrderbookLevelUpdate, GatewayDisconnect
+from singular.core import Account, Instrument, Orderbook
+from singular.config import exchange_str_to_exchange
+
+# Euler
+from euler.system.GatewayManagementSystem import GatewayManagementSystem
+from euler.system.OrderbookManagementSystem import (
+    VERSION, TIMESTAMP, SEQUENCE, DEPTH, BID_PRICE, BID_QUANTITY, ASK_PRICE, ASK_QUANTITY,
+    LEVELS, WORD_SIZE, get_max_depth
+)
+
+NAN = float("nan")
+
+def get_timestamp(update_dt):
+    if update_dt is None:
+        return time.time_ns()
+    else:
+        return int(update_dt.timestamp() * 1e9)
+
+# Writes one slot in the layout MappedOrderbook reads. There must be a single
+# writer per slot; the version is bumped to odd before and back to even after
+# every write.
+
+class MappedOrderbookWriter:
+    def __init__(self, view, data_size):
+        self.integers = view.cast("q")
+        self.floats = view.cast("d")
+        self.max_depth = get_max_depth(data_size)
+        # keep counting from a previous publisher so readers never see an
+        # old version again
+        self.version = self.integers[VERSION] + (self.integers[VERSION] & 1)
+        self.sequence = 0
+        self.clear()
+
+    def get_max_depth(self):
+        return self.max_depth
+
+    def write(self, timestamp, best_bid, best_ask, bid_levels=(), ask_levels=(), sequence=None):
+        # best levels are (price, quantity) or None, levels are lists of
+        # (price, quantity) best first
+        integers = self.integers
+        floats = self.floats
+        self.sequence = self.sequence + 1 if sequence is None else sequence
+        depth = min(max(len(bid_levels), len(ask_levels)), self.max_depth)
+
+        integers[VERSION] = self.version + 1
+        integers[TIMESTAMP] = timestamp
+        integers[SEQUENCE] = self.sequence
+        integers[DEPTH] = depth
+        floats[BID_PRICE], floats[BID_QUANTITY] = best_bid if best_bid else (NAN, NAN)
+        floats[ASK_PRICE], floats[ASK_QUANTITY] = best_ask if best_ask else (NAN, NAN)
+
+        index = LEVELS
+        for levels in (bid_levels, ask_levels):
+            for level in range(depth):
+                if level < len(levels):
+                    floats[index], floats[index + 1] = levels[level]
+                else:
+                    floats[index] = floats[index + 1] = NAN
+                index += 2
+
+        self.version += 2
+        integers[VERSION] = self.version
+
+    def clear(self):
+        self.write(0, None, None, sequence=self.sequence)
+
+class OrderbookPublisher:
+    def __init__(self, config):
+        self.config = config
+        self.publisher_config = config.get("orderbook_publisher", {})
+        self.max_wait = self.publisher_config.get("max_wait", 0.05)
+        # gateways drop subscriptions sent before their websocket connects
+        self.subscribe_delay = self.publisher_config.get("subscribe_delay", 5)
+
+        callbacks =\
+            GatewayCallbacks((lambda event: self.handle_order_event(event)),
+                             (lambda event: self.handle_marketdata_event(event)),
+                             (lambda event: self.handle_gateway_event(event)))
+
+        self.gateway_management_system =\
+            GatewayManagementSystem(config, None, callbacks)
+
+        self.mappings = []
+        self.writers = {}
+        self.orderbooks = {}
+        self.subscriptions = []
+        self.pending_subscriptions = []
+
+        for service in self.config["orderbook_services"]:
+            exchange = exchange_str_to_exchange(service["exchange"])
+            account = self.get_account(exchange, service.get("account"))
+            data_size = service["data_size"]
+            shared_memory = self.create_mapping(service["path"], len(service["symbols"]) * data_size)
+
+            offset = 0
+            for symbol in service["symbols"]:
+                view = memoryview(shared_memory)[offset:offset + data_size - data_size % WORD_SIZE]
+                self.writers[(exchange, symbol)] = MappedOrderbookWriter(view, data_size)
+                instrument = Instrument(exchange, symbol, symbol, None, None, None,
+                                        None, None, None, None)
+                self.subscriptions.append((account, instrument))
+                offset += data_size
+
+    def create_mapping(self, path, size):
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(descriptor).st_size < size:
+            os.ftruncate(descriptor, size)
+        shared_memory = mmap.mmap(descriptor, size)
+        os.close(descriptor)
+        self.mappings.append(shared_memory)
+        return shared_memory
+
+    def get_account(self, exchange, name):
+        for gateway_exchange, gateway_name in self.gateway_management_system.gateway_map.keys():
+            if gateway_exchange == exchange and (name is None or name == gateway_name):
+                return Account(gateway_exchange, gateway_name)
+        raise ValueError(f"OrderbookPublisher: no gateway for {exchange} {name}")
+
+    ### Main Interface ###
+
+    def run(self):
+        print("OrderbookPublisher: starting gateways")
+        self.gateway_management_system.run()
+        self.schedule_subscriptions(self.subscriptions)
+
+        gateways = list(self.gateway_management_system.gateway_map.values())
+        selector = selectors.DefaultSelector()
+        for gateway in gateways:
+            selector.register(gateway, selectors.EVENT_READ)
+
+        while True:
+            self.subscribe_pending()
+
+            ready_gateways = [gateway for gateway in gateways if gateway.prepare_wait()]
+            timeout = 0 if ready_gateways else self.max_wait
+            for key, _ in selector.select(timeout):
+                key.fileobj.clear_wakeup()
+                if key.fileobj not in ready_gateways:
+                    ready_gateways.append(key.fileobj)
+
+            for gateway in ready_gateways:
+                gateway.consume_all()
+
+    def schedule_subscriptions(self, subscriptions):
+        subscribe_ts = time.monotonic() + self.subscribe_delay
+        for account, instrument in subscriptions:
+            self.pending_subscriptions.append((subscribe_ts, account, instrument))
+
+    def subscribe_pending(self):
+        if not self.pending_subscriptions:
+            return
+
+        now = time.monotonic()
+        pending_subscriptions = []
+        for subscribe_ts, account, instrument in self.pending_subscriptions:
+            if subscribe_ts <= now:
+                logging.info(f" | OrderbookPublisher | subscribe {account.get_name()} "
+                             f"{instrument.get_external_symbol()}")
+                self.gateway_management_system.subscribe_orderbook(account, instrument)
+            else:
+                pending_subscriptions.append((subscribe_ts, account, instrument))
+        self.pending_subscriptions = pending_subscriptions
+
+    ### Gateway Inbound Interface ###
+
+    def handle_order_event(self, event):
+        pass
+
+    def handle_gateway_event(self, event):
+        if type(event) == GatewayDisconnect:
+            # readers must not trade on a book that stopped updating
+            logging.info(f" | OrderbookPublisher | {event.account.get_name()} disconnected, "
+                         f"clearing books and resubscribing")
+            subscriptions = []
+            for account, instrument in self.subscriptions:
+                if (account.get_exchange(), account.get_name()) ==\
+                        (event.account.get_exchange(), event.account.get_name()):
+                    key = (instrument.get_exchange(), instrument.get_external_symbol())
+                    self.writers[key].clear()
+                    self.orderbooks.pop(key, None)
+                    subscriptions.append((account, instrument))
+            self.schedule_subscriptions(subscriptions)
+
+    def handle_marketdata_event(self, event):
+        key = (event.instrument.get_exchange(), event.instrument.get_external_symbol())
+        writer = self.writers.get(key)
+        if writer is None:
+            return
+
+        if type(event) == TopOfBookUpdate:
+            writer.write(get_timestamp(event.update_dt),
+                         (event.best_bid.price, event.best_bid.quantity) if event.best_bid else None,
+                         (event.best_ask.price, event.best_ask.quantity) if event.best_ask else None)
+        elif type(event) in [OrderbookSnapshot, OrderbookLevelUpdate]:
+            if key not in self.orderbooks:
+                self.orderbooks[key] = Orderbook(event.instrument)
+            orderbook = self.orderbooks[key]
+            orderbook.handle_event(event)
+
+            if orderbook.is_synchronized():
+                bid_levels = orderbook.get_bid_levels(writer.get_max_depth())
+                ask_levels = orderbook.get_ask_levels(writer.get_max_depth())
+                writer.write(get_timestamp(event.update_dt),
+                             bid_levels[0] if bid_levels else None,
+                             ask_levels[0] if ask_levels else None,
+                             bid_levels,
+                             ask_levels,
+                             orderbook.get_sequence())
+            else:
+                writer.clear()
@@ -0,0 +1,139 @@
+import time
+import heapq
+import logging
+
+# Singular
+from singular.recording import MarketdataReader
+from singular.utilities.time import LatencyHistogram
+
+# Drives a Dispatcher whose gateways are ReplayGateways (config has a
+# "replay" section) and the strategies of a StrategyManager from recordings.
+#
+# Every entry of replay.paths is a time ordered stream (a recording file or a
+# recorder directory); the streams are merged on the recorded wall clock,
+# which is also the Dispatcher clock, so timers fire on replay time and a run
+# is reproducible as long as strategies do not read the system clock
+# themselves. A recorded event is matched on every gateway of its exchange
+# and delivered through the gateway named by its source (or the first
+# gateway of the exchange).
+#
+#   fast    as fast as possible, for research and update_state benchmarks
+#   paced   sleeps to follow the recorded timing scaled by replay.speed, for
+#           soak testing
+
+class ReplayEngine:
+    def __init__(self, config, dispatcher, strategy_manager):
+        self.config = config["replay"]
+        self.dispatcher = dispatcher
+        self.strategy_manager = strategy_manager
+        self.mode = self.config.get("mode", "fast")
+        self.speed = self.config.get("speed", 1.0)
+        # strategies are otherwise only updated when they have events or
+        # timers, as with the event Scheduler
+        self.update_all = self.config.get("update_all", False)
+        self.report_interval = self.config.get("report_interval", 1000000)
+
+        if config.get("orderbook_services"):
+            print("ReplayEngine: orderbook_services are live mapped books, "
+                  "subscriptions to them will not be replayed")
+
+        # timers added so far (e.g. in strategy constructors) are on the
+        # dispatcher's previous clock, they are rebased onto replay time, which
+        # starts at 0 here and jumps to the first record in run
+        self.now_ns = 0
+        self.rebase_timers(-dispatcher.clock())
+        dispatcher.clock = self.get_time
+
+        self.gateways = list(dispatcher.gateway_management_system.gateway_map.values())
+        self.source_gateways = {}
+        self.exchange_gateways = {}
+        for gateway in self.gateways:
+            account = gateway.get_account()
+            self.source_gateways[account.get_name()] = gateway
+            self.exchange_gateways.setdefault(account.get_exchange(), []).append(gateway)
+
+        ### Statistics ###
+        self.record_count = 0
+        self.update_count = 0
+        self.update_histogram = LatencyHistogram("strategy_update_us")
+
+    def get_time(self):
+        return self.now_ns / 1e9
+
+    def rebase_timers(self, offset):
+        # the same shift for every deadline keeps the heap order
+        self.dispatcher.timers = [(deadline + offset, strategy_id, interval)
+                                  for deadline, strategy_id, interval in self.dispatcher.timers]
+
+    ### Main Interface ###
+
+    def run(self):
+        print("ReplayEngine: replaying", self.config["paths"], "in", self.mode, "mode")
+        readers = [MarketdataReader(path, frames=False) for path in self.config["paths"]]
+        records = heapq.merge(*readers, key=lambda record: record[1])
+
+        start = time.perf_counter()
+        first_ns = None
+        for _, wall_ns, _, source, event in records:
+            if first_ns is None:
+                first_ns = wall_ns
+                self.now_ns = wall_ns
+                self.rebase_timers(self.get_time())
+                # strategies subscribe from update_state, so everyone runs once
+                self.update_strategies(self.strategy_manager.strategy_map.keys())
+
+            if self.mode == "paced":
+                delay = (wall_ns - first_ns) / 1e9 / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            self.step(wall_ns, source, event)
+            if self.record_count % self.report_interval == 0:
+                self.report(time.perf_counter() - start)
+
+        self.report(time.perf_counter() - start)
+
+    def step(self, now_ns, source, event):
+        self.now_ns = max(self.now_ns, now_ns)
+        self.record_count += 1
+
+        gateways = self.exchange_gateways.get(event.instrument.get_exchange(), ())
+        if gateways:
+            publisher = self.source_gateways.get(source)
+            if publisher not in gateways:
+                publisher = gateways[0]
+            for gateway in gateways:
+                gateway.handle_marketdata_event(self.now_ns, event, gateway is publisher)
+
+        # orders placed in response are acked and filled within the step when
+        # the simulated latency is zero
+        for _ in range(self.config.get("max_rounds", 16)):
+            for gateway in self.gateways:
+                gateway.advance(self.now_ns)
+            delivered = 0
+            for gateway in self.gateways:
+                delivered += gateway.consume_all()
+
+            if self.update_all:
+                strategy_ids = self.strategy_manager.strategy_map.keys() if delivered else ()
+            else:
+                strategy_ids = self.dispatcher.pop_ready_strategies()
+            if not strategy_ids:
+                break
+            self.update_strategies(strategy_ids)
+
+    def update_strategies(self, strategy_ids):
+        strategy_map = self.strategy_manager.strategy_map
+        for strategy_id in sorted(strategy_ids):
+            start_ns = time.perf_counter_ns()
+            strategy_map[strategy_id].update()
+            self.update_histogram.record(time.perf_counter_ns() - start_ns)
+            self.update_count += 1
+
+    def report(self, elapsed):
+        message = (f"records={self.record_count} updates={self.update_count} "
+                   f"elapsed={elapsed:.3f}s records/s={self.record_count / max(elapsed, 1e-9):.0f}")
+        print("ReplayEngine:", message)
+        print("ReplayEngine:", self.update_histogram.get_summary())
+        logging.info(f" | ReplayEngine | {message}")
+        logging.info(f" | ReplayEngine | {self.update_histogram.get_summary()}")
@@ -0,0 +1,85 @@
+import time
+import logging
+import selectors
+
+# Singular
+from singular.utilities.time import LatencyHistogram, tracer
+
+class Scheduler:
+    def __init__(self, config, dispatcher, strategy_manager):
+        self.config = config.get("scheduler", {})
+        self.dispatcher = dispatcher
+        self.strategy_manager = strategy_manager
+        # upper bound on a single block, guards against a lost doorbell; also
+        # the longest a write to a mapped book waits before its strategies
+        # run, they are polled on every pass (see Dispatcher.poll_mapped_orderbooks)
+        self.max_wait = self.config.get("max_wait", 0.05)
+        self.report_interval = self.config.get("report_interval", 60)
+
+        self.gateways = list(dispatcher.gateway_management_system.gateway_map.values())
+        self.selector = selectors.DefaultSelector()
+        for gateway in self.gateways:
+            self.selector.register(gateway, selectors.EVENT_READ)
+
+        ### Statistics ###
+        self.queue_drain_histogram = LatencyHistogram("queue_drain_us")
+        self.strategy_update_histogram = LatencyHistogram("strategy_update_us")
+        self.last_report_ts = time.monotonic()
+
+    ### Main Interface ###
+
+    def run(self):
+        print("Scheduler: starting event loop")
+
+        # strategies subscribe from update_state, so everyone runs once
+        for strategy in self.strategy_manager.strategy_map.values():
+            strategy.update()
+
+        while True:
+            self.run_once()
+
+    def run_once(self):
+        ready_gateways = [gateway for gateway in self.gateways if gateway.prepare_wait()]
+        timeout = 0 if ready_gateways else self.get_timeout()
+
+        for key, _ in self.selector.select(timeout):
+            key.fileobj.clear_wakeup()
+            if key.fileobj not in ready_gateways:
+                ready_gateways.append(key.fileobj)
+
+        # drains gateway queues and puts events on strategy queues
+        pre_consume_all_exch_ts = time.perf_counter_ns()
+        for gateway in ready_gateways:
+            gateway.consume_all()
+        post_consume_all_exch_ts = time.perf_counter_ns()
+
+        strategy_map = self.strategy_manager.strategy_map
+        ready_strategies = self.dispatcher.pop_ready_strategies()
+        for strategy_id in ready_strategies:
+            strategy_map[strategy_id].update()
+        post_strategy_update_ts = time.perf_counter_ns()
+
+        if ready_gateways:
+            self.queue_drain_histogram.record(post_consume_all_exch_ts - pre_consume_all_exch_ts)
+        if ready_strategies:
+            self.strategy_update_histogram.record(post_strategy_update_ts - post_consume_all_exch_ts)
+
+        if time.monotonic() - self.last_report_ts > self.report_interval:
+            self.report()
+
+    def get_timeout(self):
+        deadline = self.dispatcher.get_next_timer_deadline()
+        if deadline is None:
+            return self.max_wait
+        else:
+            return min(max(deadline - time.monotonic(), 0), self.max_wait)
+
+    def report(self):
+        for histogram in (self.queue_drain_histogram, self.strategy_update_histogram):
+            logging.info(f" | Scheduler | {histogram.get_summary()}")
+            histogram.reset()
+        if tracer.enabled:
+            for summary in tracer.get_summary():
+                logging.info(f" | Tracer | {summary}")
+            tracer.reset()
+        self.last_report_ts = time.monotonic()
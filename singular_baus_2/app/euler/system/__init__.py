@@ -1,4 +1,7 @@
 from .Dispatcher import Dispatcher
 from .GatewayManagementSystem import GatewayManagementSystem
 from .OrderbookManagementSystem import OrderbookManagementSystem
-from .OrderManagementSystem import OrderManagementSystem
\ No newline at end of file
+from .OrderManagementSystem import OrderManagementSystem
+from .Scheduler import Scheduler
+from .OrderbookPublisher import OrderbookPublisher
+from .ReplayEngine import ReplayEngine
\ No newline at end of file
@@ -0,0 +1,24 @@
+import sys
+import logging
+
+# Singular
+import singular
+import singular.config
+
+# Euler
+import euler.system
+
+def main(path):
+    logging.basicConfig(filename="publisher.log", level=logging.INFO)
+
+    config = singular.config.Config(path)
+
+    # writes the books listed under orderbook_services for euler processes
+    # to map instead of subscribing themselves
+    publisher = euler.system.OrderbookPublisher(config.get_json())
+    publisher.run()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    path = args[0]
+    main(path)
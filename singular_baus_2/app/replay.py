@@ -0,0 +1,30 @@
+import sys
+import logging
+
+# Singular
+import singular
+import singular.config
+
+# Euler
+import euler.system
+import euler.strategy
+
+def main(path):
+    logging.basicConfig(filename="replay.log", level=logging.INFO)
+
+    config = singular.config.Config(path)
+
+    # the "replay" section swaps the gateways for ReplayGateways fed from
+    # recordings, strategies run unchanged
+    dispatcher = euler.system.Dispatcher(None, config.get_json())
+    dispatcher.run()
+
+    strategy_manager = euler.strategy.StrategyManager(config.get_json(), dispatcher)
+
+    replay_engine = euler.system.ReplayEngine(config.get_json(), dispatcher, strategy_manager)
+    replay_engine.run()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    path = args[0]
+    main(path)
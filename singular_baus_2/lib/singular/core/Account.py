@@ -1,5 +1,7 @@
 
 class Account:
+    __slots__ = ("exchange", "name")
+
     def __init__(self, exchange, name):
         self.exchange = exchange
         self.name = name
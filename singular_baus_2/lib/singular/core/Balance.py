@@ -1,5 +1,7 @@
 
 class Balance:
+    __slots__ = ("account", "currency")
+
     def __init__(self, account, currency):
         self.account = account
         self.currency = currency
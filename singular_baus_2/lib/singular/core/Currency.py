@@ -1,5 +1,8 @@
 
 class Currency:
+    __slots__ = ("exchange", "internal_symbol", "external_symbol", "min_price_precision",
+                 "min_quantity_precision")
+
     def __init__(self, exchange, internal_symbol, external_symbol, 
                  min_price_precision, min_quantity_precision):
         self.exchange = exchange
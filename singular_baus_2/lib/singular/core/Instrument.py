@@ -1,5 +1,9 @@
 
 class Instrument:
+    __slots__ = ("exchange", "internal_symbol", "external_symbol", "base_currency", "quote_currency",
+                 "min_price_precision", "min_quantity_precision", "min_order_quantity",
+                 "min_order_notional_quantity", "type", "contract_value", "expiry")
+
     def __init__(self, exchange, internal_symbol, external_symbol, 
                  base_currency, quote_currency, min_price_precision,
                  min_quantity_precision, min_order_quantity, 
@@ -1,5 +1,7 @@
 
 class Order:
+    __slots__ = ("instrument", "account", "side", "price", "quantity", "type")
+
     def __init__(self, instrument, account, side, price, quantity, type):
         self.instrument = instrument
         self.account = account
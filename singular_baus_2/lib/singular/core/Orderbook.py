@@ -1,4 +1,16 @@
+import bisect
+
+from .OrderbookLevel import OrderbookLevel
+from .Side import Side
 from ..event.TopOfBookUpdate import TopOfBookUpdate
+from ..event.OrderbookSnapshot import OrderbookSnapshot
+from ..event.OrderbookLevelUpdate import OrderbookLevelUpdate
+from ..utilities.dispatch import HandlerTable
+
+# Each side is a price -> quantity dict plus a sorted list of keys. Bid keys
+# are prices and ask keys are negated prices, so the best level of both sides
+# is the last key, which is where most updates land and where list inserts
+# and deletes are cheapest.
 
 class Orderbook:
     def __init__(self, instrument):
@@ -6,8 +18,18 @@ class Orderbook:
         self.last_update_dt = None
         self.bids = {}
         self.asks = {}
+        self.bid_keys = []
+        self.ask_keys = []
         self.best_bid_level = None
         self.best_ask_level = None
+        self.sequence = None
+        self.synchronized = False
+        self.gap_count = 0
+
+        self.event_handlers = HandlerTable()
+        self.event_handlers.register(TopOfBookUpdate, self.handle_top_of_book)
+        self.event_handlers.register(OrderbookLevelUpdate, self.handle_level_update)
+        self.event_handlers.register(OrderbookSnapshot, self.handle_snapshot)
 
     ### Interface ###
 
@@ -29,10 +51,247 @@ class Orderbook:
     def get_best_ask_level(self):
         return self.best_ask_level
 
+    def get_sequence(self):
+        return self.sequence
+
+    def is_synchronized(self):
+        return self.synchronized
+
+    def get_gap_count(self):
+        return self.gap_count
+
+    ### Depth Interface ###
+
+    # levels are (price, quantity) tuples, best first
+
+    def get_bid_levels(self, depth=None):
+        keys = self.bid_keys if depth is None else self.bid_keys[max(len(self.bid_keys) - depth, 0):]
+        return [(key, self.bids[key]) for key in reversed(keys)]
+
+    def get_ask_levels(self, depth=None):
+        keys = self.ask_keys if depth is None else self.ask_keys[max(len(self.ask_keys) - depth, 0):]
+        return [(-key, self.asks[-key]) for key in reversed(keys)]
+
+    def get_levels(self, side, depth=None):
+        if side == Side.BUY:
+            return self.get_bid_levels(depth)
+        else:
+            return self.get_ask_levels(depth)
+
+    def get_quantity_at_price(self, side, price):
+        if side == Side.BUY:
+            return self.bids.get(price, 0.0)
+        else:
+            return self.asks.get(price, 0.0)
+
+    def get_cumulative_quantity(self, side, price):
+        # total quantity at price and every better price
+        if side == Side.BUY:
+            index = bisect.bisect_left(self.bid_keys, price)
+            bids = self.bids
+            return sum([bids[key] for key in self.bid_keys[index:]])
+        else:
+            index = bisect.bisect_left(self.ask_keys, -price)
+            asks = self.asks
+            return sum([asks[-key] for key in self.ask_keys[index:]])
+
+    def get_price_for_quantity(self, side, quantity):
+        # worst price touched when taking quantity from this side, None if
+        # the book is not deep enough
+        if side == Side.BUY:
+            levels, keys, sign = self.bids, self.bid_keys, 1
+        else:
+            levels, keys, sign = self.asks, self.ask_keys, -1
+
+        remaining = quantity
+        for index in range(len(keys) - 1, -1, -1):
+            price = keys[index] * sign
+            remaining -= levels[price]
+            if remaining <= 0:
+                return price
+        return None
+
     ### Handlers ###
 
     def handle_event(self, event):
-        if type(event) == TopOfBookUpdate:
+        self.event_handlers.dispatch(event)
+
+    def handle_top_of_book(self, event):
+        self.last_update_dt = event.update_dt
+        self.best_bid_level = event.best_bid
+        self.best_ask_level = event.best_ask
+
+    def handle_snapshot(self, event):
+        self.bids = {}
+        self.asks = {}
+        for level in event.levels:
+            if level.quantity > 0:
+                if level.side == Side.BUY:
+                    self.bids[level.price] = level.quantity
+                else:
+                    self.asks[level.price] = level.quantity
+        self.bid_keys = sorted(self.bids)
+        self.ask_keys = sorted([-price for price in self.asks])
+
+        self.sequence = event.sequence
+        self.synchronized = True
+        self.last_update_dt = event.update_dt
+        self.update_best_levels()
+
+    def handle_level_update(self, event):
+        # updates are dropped until a snapshot (re)synchronizes the book
+        if not self.synchronized:
+            return
+
+        if event.sequence is not None and self.sequence is not None:
+            if event.sequence <= self.sequence:
+                # already part of the snapshot
+                return
+
+            if event.previous_sequence is not None:
+                previous_sequence = event.previous_sequence
+            else:
+                previous_sequence = event.sequence - 1
+
+            # levels carry absolute quantities, so an update overlapping the
+            # snapshot is harmless but a hole is not
+            if previous_sequence > self.sequence:
+                print("Orderbook: handle_level_update: sequence gap for",
+                      self.instrument.get_external_symbol() if self.instrument else None,
+                      self.sequence, "->", previous_sequence)
+                self.synchronized = False
+                self.gap_count += 1
+                return
+
+        for level in event.levels:
+            if level.side == Side.BUY:
+                self.set_level(self.bids, self.bid_keys, level.price, level.price, level.quantity)
+            else:
+                self.set_level(self.asks, self.ask_keys, level.price, -level.price, level.quantity)
+
+        if event.sequence is not None:
+            self.sequence = event.sequence
+        if event.update_dt is not None:
             self.last_update_dt = event.update_dt
-            self.best_bid_level = event.best_bid
-            self.best_ask_level = event.best_ask
+        self.update_best_levels()
+
+    def set_level(self, levels, keys, price, key, quantity):
+        if quantity > 0:
+            if price not in levels:
+                bisect.insort(keys, key)
+            levels[price] = quantity
+        elif price in levels:
+            del levels[price]
+            del keys[bisect.bisect_left(keys, key)]
+
+    def update_best_levels(self):
+        # best levels are handed out to strategies, so replace rather than
+        # mutate them, and only when they change
+        if self.bid_keys:
+            price = self.bid_keys[-1]
+            quantity = self.bids[price]
+            level = self.best_bid_level
+            if level is None or level.price != price or level.quantity != quantity:
+                self.best_bid_level = OrderbookLevel(self.instrument, Side.BUY, price, quantity)
+        else:
+            self.best_bid_level = None
+
+        if self.ask_keys:
+            price = -self.ask_keys[-1]
+            quantity = self.asks[price]
+            level = self.best_ask_level
+            if level is None or level.price != price or level.quantity != quantity:
+                self.best_ask_level = OrderbookLevel(self.instrument, Side.SELL, price, quantity)
+        else:
+            self.best_ask_level = None
+
+
+if __name__ == "__main__":
+    # replays an L2 stream through the book and times updates and queries
+    # usage: python -m singular.core.Orderbook [incremental_book_L2.csv[.gz]]
+    # with a tardis incremental_book_L2 file, otherwise a synthetic stream
+    import sys
+    import csv
+    import gzip
+    import time
+    import random
+
+    def read_tardis_events(path):
+        # rows sharing a local_timestamp form one message
+        events = []
+        sequence = 0
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as file:
+            rows = csv.DictReader(file)
+            current_key, levels, snapshot = None, [], False
+            for row in rows:
+                key = (row["local_timestamp"], row["is_snapshot"])
+                if key != current_key and levels:
+                    sequence += 1
+                    event_type = OrderbookSnapshot if snapshot else OrderbookLevelUpdate
+                    events.append(event_type(None, levels, sequence=sequence))
+                    levels = []
+                current_key, snapshot = key, row["is_snapshot"] == "true"
+                side = Side.BUY if row["side"] == "bid" else Side.SELL
+                levels.append(OrderbookLevel(None, side, float(row["price"]), float(row["amount"])))
+            if levels:
+                sequence += 1
+                event_type = OrderbookSnapshot if snapshot else OrderbookLevelUpdate
+                events.append(event_type(None, levels, sequence=sequence))
+        return events
+
+    def make_synthetic_events(count=200000, depth=1000, tick=0.1):
+        random.seed(0)
+        mid = 30000.0
+        levels = [OrderbookLevel(None, Side.BUY, round(mid - tick * (i + 1), 1), random.uniform(0.1, 5))
+                  for i in range(depth)]
+        levels += [OrderbookLevel(None, Side.SELL, round(mid + tick * (i + 1), 1), random.uniform(0.1, 5))
+                   for i in range(depth)]
+        events = [OrderbookSnapshot(None, levels, sequence=0)]
+        for sequence in range(1, count):
+            mid = round(mid + tick * random.choice((-1, 0, 0, 0, 1)), 1)
+            update_levels = []
+            for _ in range(random.randint(1, 6)):
+                side = random.choice((Side.BUY, Side.SELL))
+                # updates concentrate near the touch
+                distance = int(random.expovariate(0.1)) + 1
+                if side == Side.BUY:
+                    price = round(mid - tick * distance, 1)
+                else:
+                    price = round(mid + tick * distance, 1)
+                quantity = 0.0 if random.random() < 0.3 else random.uniform(0.1, 5)
+                update_levels.append(OrderbookLevel(None, side, price, quantity))
+            events.append(OrderbookLevelUpdate(None, update_levels, sequence=sequence))
+        return events
+
+    if len(sys.argv) > 1:
+        events = read_tardis_events(sys.argv[1])
+    else:
+        events = make_synthetic_events()
+    level_count = sum([len(event.levels) for event in events])
+
+    orderbook = Orderbook(None)
+    start = time.perf_counter()
+    for event in events:
+        orderbook.handle_event(event)
+    elapsed = time.perf_counter() - start
+    print(f"replay: {len(events)} events, {level_count} levels in {elapsed:.3f}s "
+          f"({len(events) / elapsed:.0f} events/s, {elapsed / level_count * 1e9:.0f} ns/level)")
+    print(f"book: {len(orderbook.bids)} bids, {len(orderbook.asks)} asks, "
+          f"synchronized {orderbook.is_synchronized()}, gaps {orderbook.get_gap_count()}")
+
+    best_bid = orderbook.get_best_bid_level().get_price()
+    queries = [
+        ("get_bid_levels(10)", lambda: orderbook.get_bid_levels(10)),
+        ("get_quantity_at_price", lambda: orderbook.get_quantity_at_price(Side.BUY, best_bid)),
+        ("get_cumulative_quantity(20 ticks)",
+         lambda: orderbook.get_cumulative_quantity(Side.BUY, best_bid - 2.0)),
+        ("get_price_for_quantity(10)", lambda: orderbook.get_price_for_quantity(Side.SELL, 10.0)),
+    ]
+    for name, query in queries:
+        count = 100000
+        start = time.perf_counter()
+        for _ in range(count):
+            query()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed / count * 1e9:.0f} ns")
@@ -1,5 +1,7 @@
 
 class OrderbookLevel:
+    __slots__ = ("instrument", "side", "price", "quantity")
+
     def __init__(self, instrument, side, price, quantity):
         self.instrument = instrument
         self.side = side
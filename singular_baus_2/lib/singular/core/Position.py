@@ -1,5 +1,7 @@
 
 class Position:
+    __slots__ = ("account", "instrument", "amount")
+
     def __init__(self, account, instrument, amount):
         self.account = account
         self.instrument = instrument
@@ -1,5 +1,7 @@
 
 class Price:
+    __slots__ = ("account", "instrument", "value")
+
     def __init__(self, account, instrument, value):
         self.account = account
         self.instrument = instrument
@@ -1,4 +1,6 @@
 
 class CancelAck:
+    __slots__ = ("order_id",)
+
     def __init__(self, order_id):
         self.order_id = order_id
\ No newline at end of file
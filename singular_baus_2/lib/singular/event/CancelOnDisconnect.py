@@ -1,5 +1,7 @@
 
 class CancelOnDisconnect:
+    __slots__ = ("account", "orders")
+
     def __init__(self, account, orders):
         self.account = account
         self.orders = orders
\ No newline at end of file
@@ -1,5 +1,7 @@
 
 class CancelReject:
+    __slots__ = ("order_id", "reason")
+
     def __init__(self, order_id, reason):
         self.order_id = order_id
         self.reason = reason
@@ -1,5 +1,7 @@
 
 class Deposit:
+    __slots__ = ("timestamp", "id", "account", "currency", "amount")
+
     def __init__(self, timestamp, id, account, currency, amount):
         self.timestamp = timestamp
         self.id = id
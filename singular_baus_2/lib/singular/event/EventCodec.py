@@ -0,0 +1,335 @@
+import pickle
+import struct
+import datetime as dt
+
+from ..core.Account import Account
+from ..core.Instrument import Instrument
+from ..core.OrderbookLevel import OrderbookLevel
+from ..core.Side import Side
+from .CancelAck import CancelAck
+from .CancelOnDisconnect import CancelOnDisconnect
+from .CancelReject import CancelReject
+from .Deposit import Deposit
+from .Fill import Fill
+from .GatewayDisconnect import GatewayDisconnect
+from .ModifyAck import ModifyAck
+from .OrderbookLevelUpdate import OrderbookLevelUpdate
+from .OrderbookSnapshot import OrderbookSnapshot
+from .PlaceAck import PlaceAck
+from .PlaceReject import PlaceReject
+from .TopOfBookUpdate import TopOfBookUpdate
+from .Trade import Trade
+from .Transfer import Transfer
+from .Withdrawal import Withdrawal
+
+# Binary codec for singular events. Every event type has a fixed layout: a
+# one byte type code, a 16 bit mask of fields that are None, then the fields
+# packed with struct. Instruments, accounts and currencies are interned: the
+# first message that references one carries an intern record ahead of the
+# event, later messages only carry its 2 byte id. The decoding side must see
+# every message the encoding side produced, in order (or both sides reset()).
+#
+# A value that does not fit its layout (e.g. an exception passed as a reject
+# reason) makes the whole event fall back to a pickle record, so decoding
+# always reproduces the event. Integer prices/quantities come back as floats.
+
+INT = "int"
+FLOAT = "float"
+INTERN = "intern"
+SIDE = "side"
+DATETIME = "datetime"
+STRING = "string"
+INTS = "ints"
+LEVEL = "level"
+LEVELS = "levels"
+
+FORMATS = {
+    INT: "q",
+    FLOAT: "d",
+    INTERN: "H",
+    SIDE: "B",
+    DATETIME: "q",
+    STRING: "I",
+    INTS: "I",
+    LEVEL: "HBdd",
+    LEVELS: "I"
+}
+
+RECORD_PICKLE = 0
+RECORD_INTERN = 255
+
+PICKLE_RECORD = struct.Struct("<BI")
+INTERN_RECORD = struct.Struct("<BHI")
+INT_RECORD = struct.Struct("<q")
+LEVEL_RECORD = struct.Struct("<" + FORMATS[LEVEL])
+
+SIDE_TO_CODE = {Side.BUY: 1, Side.SELL: 2}
+CODE_TO_SIDE = {1: Side.BUY, 2: Side.SELL}
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+LAYOUTS = [
+    (1, CancelAck, [("order_id", INT)]),
+    (2, CancelOnDisconnect, [("account", INTERN), ("orders", INTS)]),
+    (3, CancelReject, [("order_id", INT), ("reason", STRING)]),
+    (4, Deposit, [("timestamp", INT), ("id", STRING), ("account", INTERN),
+                  ("currency", INTERN), ("amount", FLOAT)]),
+    (5, Fill, [("timestamp", INT), ("fill_id", INT), ("order_id", INT), ("account", INTERN),
+               ("instrument", INTERN), ("side", SIDE), ("price", FLOAT), ("quantity", FLOAT),
+               ("fees", FLOAT), ("fee_currency", INTERN)]),
+    (6, GatewayDisconnect, [("account", INTERN)]),
+    (7, ModifyAck, [("order_id", INT), ("price", FLOAT), ("quantity", FLOAT)]),
+    (8, OrderbookLevelUpdate, [("instrument", INTERN), ("levels", LEVELS), ("update_dt", DATETIME),
+                               ("sequence", INT), ("previous_sequence", INT), ("trace", INTS)]),
+    (9, OrderbookSnapshot, [("instrument", INTERN), ("levels", LEVELS), ("update_dt", DATETIME),
+                            ("sequence", INT), ("trace", INTS)]),
+    (10, PlaceAck, [("order_id", INT), ("account", INTERN), ("instrument", INTERN),
+                    ("side", SIDE), ("price", FLOAT), ("quantity", FLOAT)]),
+    (11, PlaceReject, [("order_id", INT), ("reason", STRING)]),
+    (12, TopOfBookUpdate, [("instrument", INTERN), ("update_dt", DATETIME),
+                           ("best_bid", LEVEL), ("best_ask", LEVEL), ("trace", INTS)]),
+    (13, Trade, [("instrument", INTERN), ("side", SIDE), ("price", FLOAT), ("quantity", FLOAT),
+                 ("trace", INTS)]),
+    (14, Transfer, [("timestamp", INT), ("id", STRING), ("sending_account", INTERN),
+                    ("receiving_account", INTERN), ("currency", INTERN), ("amount", FLOAT)]),
+    (15, Withdrawal, [("timestamp", INT), ("id", STRING), ("account", INTERN),
+                      ("currency", INTERN), ("amount", FLOAT)]),
+]
+
+class Layout:
+    def __init__(self, code, event_type, fields):
+        self.code = code
+        self.event_type = event_type
+        self.fields = fields
+        self.struct = struct.Struct("<BH" + "".join(FORMATS[kind] for _, kind in fields))
+
+LAYOUTS_BY_TYPE = {event_type: Layout(code, event_type, fields)
+                   for code, event_type, fields in LAYOUTS}
+LAYOUTS_BY_CODE = {layout.code: layout for layout in LAYOUTS_BY_TYPE.values()}
+
+def get_intern_key(value):
+    if type(value) == Instrument:
+        return ("instrument", value.exchange, value.external_symbol)
+    elif type(value) == Account:
+        return ("account", value.exchange, value.name)
+    elif type(value) == str:
+        return value
+    else:
+        raise TypeError("EventCodec: cannot intern " + type(value).__name__)
+
+def get_datetime_value(value):
+    if value.tzinfo is not None:
+        raise TypeError("EventCodec: only naive datetimes are encoded")
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+class EventCodec:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        ### Encoder State ###
+        self.intern_ids = {}
+
+        ### Decoder State ###
+        self.interned = {}
+
+    ### Encoder Interface ###
+
+    def encode(self, event):
+        layout = LAYOUTS_BY_TYPE.get(type(event))
+        if layout is not None:
+            message = bytearray()
+            try:
+                return self.encode_layout(layout, event, message)
+            except (TypeError, AttributeError, KeyError, struct.error, OverflowError):
+                pass
+        else:
+            message = bytearray()
+
+        payload = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+        message += PICKLE_RECORD.pack(RECORD_PICKLE, len(payload))
+        message += payload
+        return bytes(message)
+
+    def encode_layout(self, layout, event, message):
+        values = [layout.code, 0]
+        nulls = 0
+        tail = bytearray()
+
+        # intern records land in message ahead of the packed event
+        for index, (name, kind) in enumerate(layout.fields):
+            value = getattr(event, name)
+            if value is None:
+                nulls |= 1 << index
+                if kind == LEVEL:
+                    values.extend((0, 0, 0.0, 0.0))
+                else:
+                    values.append(0)
+            elif kind == INT:
+                if type(value) != int:
+                    raise TypeError("EventCodec: int field is " + type(value).__name__)
+                values.append(value)
+            elif kind == FLOAT:
+                values.append(value)
+            elif kind == INTERN:
+                values.append(self.intern(value, message))
+            elif kind == SIDE:
+                values.append(SIDE_TO_CODE[value])
+            elif kind == DATETIME:
+                values.append(get_datetime_value(value))
+            elif kind == STRING:
+                if type(value) != str:
+                    raise TypeError("EventCodec: string field is " + type(value).__name__)
+                encoded = value.encode()
+                values.append(len(encoded))
+                tail += encoded
+            elif kind == INTS:
+                values.append(len(value))
+                for item in value:
+                    if type(item) != int:
+                        raise TypeError("EventCodec: int field is " + type(item).__name__)
+                    tail += INT_RECORD.pack(item)
+            elif kind == LEVEL:
+                values.extend(self.get_level_values(value, message))
+            elif kind == LEVELS:
+                values.append(len(value))
+                for level in value:
+                    tail += LEVEL_RECORD.pack(*self.get_level_values(level, message))
+
+        values[1] = nulls
+        message += layout.struct.pack(*values)
+        message += tail
+        return bytes(message)
+
+    def get_level_values(self, level, message):
+        if type(level) != OrderbookLevel:
+            raise TypeError("EventCodec: level is " + type(level).__name__)
+        return (self.intern(level.instrument, message) if level.instrument is not None else 0,
+                SIDE_TO_CODE[level.side], level.price, level.quantity)
+
+    def forget_interns(self, intern_count):
+        # back to the first intern_count interns, for messages that were
+        # encoded but never delivered
+        for key in list(self.intern_ids)[intern_count:]:
+            del self.intern_ids[key]
+
+    def intern(self, value, message):
+        key = get_intern_key(value)
+        intern_id = self.intern_ids.get(key)
+        if intern_id is None:
+            # id 0 is reserved for None inside levels
+            intern_id = len(self.intern_ids) + 1
+            self.intern_ids[key] = intern_id
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            message += INTERN_RECORD.pack(RECORD_INTERN, intern_id, len(payload))
+            message += payload
+        return intern_id
+
+    ### Decoder Interface ###
+
+    def decode(self, buffer, offset=0):
+        while True:
+            code = buffer[offset]
+            if code == RECORD_INTERN:
+                _, intern_id, length = INTERN_RECORD.unpack_from(buffer, offset)
+                offset += INTERN_RECORD.size
+                self.interned[intern_id] = pickle.loads(buffer[offset:offset + length])
+                offset += length
+            elif code == RECORD_PICKLE:
+                _, length = PICKLE_RECORD.unpack_from(buffer, offset)
+                offset += PICKLE_RECORD.size
+                return pickle.loads(buffer[offset:offset + length])
+            else:
+                return self.decode_layout(LAYOUTS_BY_CODE[code], buffer, offset)
+
+    def decode_layout(self, layout, buffer, offset):
+        values = layout.struct.unpack_from(buffer, offset)
+        offset += layout.struct.size
+        nulls = values[1]
+        position = 2
+        arguments = []
+
+        for index, (name, kind) in enumerate(layout.fields):
+            if kind == LEVEL:
+                value = values[position:position + 4]
+                position += 4
+            else:
+                value = values[position]
+                position += 1
+
+            if nulls & (1 << index):
+                arguments.append(None)
+            elif kind == INT or kind == FLOAT:
+                arguments.append(value)
+            elif kind == INTERN:
+                arguments.append(self.interned[value])
+            elif kind == SIDE:
+                arguments.append(CODE_TO_SIDE[value])
+            elif kind == DATETIME:
+                arguments.append(EPOCH + dt.timedelta(microseconds=value))
+            elif kind == STRING:
+                arguments.append(bytes(buffer[offset:offset + value]).decode())
+                offset += value
+            elif kind == INTS:
+                items = []
+                for _ in range(value):
+                    items.append(INT_RECORD.unpack_from(buffer, offset)[0])
+                    offset += INT_RECORD.size
+                arguments.append(items)
+            elif kind == LEVEL:
+                arguments.append(self.get_level(value))
+            elif kind == LEVELS:
+                levels = []
+                for _ in range(value):
+                    levels.append(self.get_level(LEVEL_RECORD.unpack_from(buffer, offset)))
+                    offset += LEVEL_RECORD.size
+                arguments.append(levels)
+
+        return layout.event_type(*arguments)
+
+    def get_level(self, values):
+        instrument_id, side, price, quantity = values
+        return OrderbookLevel(self.interned[instrument_id] if instrument_id else None,
+                              CODE_TO_SIDE[side], price, quantity)
+
+if __name__ == "__main__":
+    # encode/decode microbenchmark against pickle
+    # usage: python -m singular.event.EventCodec
+    import timeit
+    from ..core import Exchange, InstrumentType
+
+    instrument = Instrument(Exchange.OKX, "BTC-USD-SWAP", "BTC-USD-SWAP", "BTC", "USD",
+                            0.1, 1, 1, 1, InstrumentType.INVERSE_PERPETUAL, 100)
+    account = Account(Exchange.OKX, "main")
+    now = dt.datetime.now()
+    events = [
+        TopOfBookUpdate(instrument, now,
+                        OrderbookLevel(instrument, Side.BUY, 29000.1, 1250.0),
+                        OrderbookLevel(instrument, Side.SELL, 29000.2, 730.0)),
+        Trade(instrument, Side.SELL, 29000.1, 12.0),
+        Fill(1690000000000, 42, 7, account, instrument, Side.BUY, 29000.1, 3.0, -0.01, "BTC"),
+        PlaceAck(7, account, instrument, Side.BUY, 29000.1, 3.0),
+        CancelAck(7),
+        PlaceReject(8, "INTERNAL RATE LIMIT"),
+        OrderbookSnapshot(instrument, [OrderbookLevel(instrument, Side.BUY, 29000.0 - i, 1.0)
+                                       for i in range(20)]),
+    ]
+
+    number = 20000
+    print(f"{'event':<22}{'bytes':>7}{'pickle':>8}{'encode us':>11}{'decode us':>11}"
+          f"{'pickle.dumps us':>17}{'pickle.loads us':>17}")
+    for event in events:
+        codec = EventCodec()
+        codec.decode(codec.encode(event))
+        message = codec.encode(event)
+        pickled = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+        assert type(codec.decode(message)) == type(event)
+
+        encode_us = timeit.timeit(lambda: codec.encode(event), number=number) / number * 1e6
+        decode_us = timeit.timeit(lambda: codec.decode(message), number=number) / number * 1e6
+        dumps_us = timeit.timeit(lambda: pickle.dumps(event, pickle.HIGHEST_PROTOCOL),
+                                 number=number) / number * 1e6
+        loads_us = timeit.timeit(lambda: pickle.loads(pickled), number=number) / number * 1e6
+        print(f"{type(event).__name__:<22}{len(message):>7}{len(pickled):>8}{encode_us:>11.2f}"
+              f"{decode_us:>11.2f}{dumps_us:>17.2f}{loads_us:>17.2f}")
@@ -1,4 +1,7 @@
 class Fill:
+    __slots__ = ("timestamp", "fill_id", "order_id", "account", "instrument", "side", "price",
+                 "quantity", "fees", "fee_currency")
+
     def __init__(self, timestamp, fill_id, order_id, account, instrument, side, 
                  price, quantity, fees, fee_currency):
         self.timestamp = timestamp
@@ -1,4 +1,6 @@
 
 class GatewayDisconnect:
+    __slots__ = ("account",)
+
     def __init__(self, account):
         self.account = account
\ No newline at end of file
@@ -1,5 +1,7 @@
 
 class ModifyAck:
+    __slots__ = ("order_id", "price", "quantity")
+
     def __init__(self, order_id, price, quantity):
         self.order_id = order_id
         self.price = price
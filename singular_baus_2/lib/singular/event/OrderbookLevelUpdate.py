@@ -1,5 +1,11 @@
 
 class OrderbookLevelUpdate:
-    def __init__(self, instrument, levels):
+    __slots__ = ("instrument", "levels", "update_dt", "sequence", "previous_sequence", "trace")
+
+    def __init__(self, instrument, levels, update_dt=None, sequence=None, previous_sequence=None, trace=None):
         self.instrument = instrument
-        self.levels = levels
\ No newline at end of file
+        self.levels = levels
+        self.update_dt = update_dt
+        self.sequence = sequence
+        self.previous_sequence = previous_sequence
+        self.trace = trace
\ No newline at end of file
@@ -1,5 +1,10 @@
 
 class OrderbookSnapshot:
-    def __init__(self, instrument, levels):
+    __slots__ = ("instrument", "levels", "update_dt", "sequence", "trace")
+
+    def __init__(self, instrument, levels, update_dt=None, sequence=None, trace=None):
         self.instrument = instrument
-        self.levels = levels
\ No newline at end of file
+        self.levels = levels
+        self.update_dt = update_dt
+        self.sequence = sequence
+        self.trace = trace
\ No newline at end of file
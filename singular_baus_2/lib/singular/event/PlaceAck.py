@@ -1,5 +1,7 @@
 
 class PlaceAck:
+    __slots__ = ("order_id", "account", "instrument", "side", "price", "quantity")
+
     def __init__(self, order_id, account, instrument, side, price, quantity):
         self.order_id = order_id
         self.account = account
@@ -1,7 +1,10 @@
 
 class TopOfBookUpdate:
-    def __init__(self, instrument, update_dt, best_bid, best_ask):
+    __slots__ = ("instrument", "update_dt", "best_bid", "best_ask", "trace")
+
+    def __init__(self, instrument, update_dt, best_bid, best_ask, trace=None):
         self.instrument = instrument
         self.update_dt = update_dt
         self.best_bid = best_bid
         self.best_ask = best_ask
+        self.trace = trace
\ No newline at end of file
@@ -1,7 +1,10 @@
 
 class Trade:
-    def __init__(self, instrument, side, price, quantity):
+    __slots__ = ("instrument", "side", "price", "quantity", "trace")
+
+    def __init__(self, instrument, side, price, quantity, trace=None):
         self.instrument = instrument
         self.side = side
         self.price = price
         self.quantity = quantity
+        self.trace = trace
\ No newline at end of file
@@ -1,5 +1,7 @@
 
 class Transfer:
+    __slots__ = ("timestamp", "id", "sending_account", "receiving_account", "currency", "amount")
+
     def __init__(self, timestamp, id, sending_account, receiving_account, currency, amount):
         self.timestamp = timestamp
         self.id = id
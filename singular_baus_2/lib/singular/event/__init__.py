@@ -13,4 +13,5 @@ from .RejectReasonType import RejectReasonType
 from .TopOfBookUpdate import TopOfBookUpdate
 from .Trade import Trade
 from .Transfer import Transfer
-from .Withdrawal import Withdrawal
\ No newline at end of file
+from .Withdrawal import Withdrawal
+from .EventCodec import EventCodec
\ No newline at end of file
@@ -1,3 +1,5 @@
+import time
+import signal
 import asyncio
 import multiprocessing
 from queue import Empty
@@ -6,20 +8,28 @@ import singular.gateway
 import singular.config 
 import singular.core
 import singular.event
+from singular.utilities.time import LatencyHistogram, tracer
+from singular.utilities.dispatch import HandlerTable
+from singular.recording import MarketdataRecorder
+from .SharedMemoryQueue import SharedMemoryQueue, DEFAULT_SIZE, DEFAULT_FULL_TIMEOUT
 
 class PlaceRequest:
-    def __init__(self, order_id, order):
+    def __init__(self, order_id, order, trace=None):
         self.order_id = order_id
         self.order = order
+        self.sent_ns = time.monotonic_ns()
+        self.trace = trace
 
 class CancelRequest:
     def __init__(self, order_id):
         self.order_id = order_id
+        self.sent_ns = time.monotonic_ns()
 
 class ModifyRequest:
     def __init__(self, order_id, order):
         self.order_id = order_id
         self.order = order
+        self.sent_ns = time.monotonic_ns()
 
 class SubscribeOrderbookRequest:
     def __init__(self, instrument):
@@ -34,36 +44,99 @@ class SubscribeFillsRequest:
         pass
 
 class Handler:
-    def __init__(self, executor, gateway, inbound_queue):
+    def __init__(self, executor, gateway, inbound_reader, report_interval):
         self.executor = executor
         self.gateway = gateway
-        self.inbound_queue = inbound_queue
+        self.inbound_reader = inbound_reader
+        self.report_interval = report_interval
+
+        # CLOCK_MONOTONIC is system wide, so the parent's send stamp can be
+        # compared against the child's clock directly
+        self.request_histograms = {
+            PlaceRequest: LatencyHistogram("place_to_gateway_us"),
+            CancelRequest: LatencyHistogram("cancel_to_gateway_us"),
+            ModifyRequest: LatencyHistogram("modify_to_gateway_us")
+        }
+
+        self.request_handlers = HandlerTable()
+        self.request_handlers.register(PlaceRequest, self.handle_place)
+        self.request_handlers.register(
+            CancelRequest, lambda request: self.gateway.cancel(request.order_id))
+        self.request_handlers.register(
+            ModifyRequest, lambda request: self.gateway.modify(request.order_id, request.order))
+        self.request_handlers.register(
+            SubscribeOrderbookRequest, lambda request: self.gateway.subscribe_orderbook(request.instrument))
+        self.request_handlers.register(
+            SubscribeTradesRequest, lambda request: self.gateway.subscribe_trades(request.instrument))
+        self.request_handlers.register(
+            SubscribeFillsRequest, lambda request: self.gateway.subscribe_fills())
+
+    def run(self):
+        self.executor.add_reader(self.inbound_reader.fileno(), self.poll)
+        self.executor.create_task(self.report())
 
-    async def poll(self):
+    def poll(self):
+        # drains every request that arrived since the last wakeup
+        try:
+            while self.inbound_reader.poll():
+                self.handle_request(self.inbound_reader.recv())
+        except EOFError:
+            print("MultiprocessingGateway(Handler): poll: parent closed request pipe")
+            self.executor.remove_reader(self.inbound_reader.fileno())
+
+    def handle_request(self, request):
+        self.request_handlers.dispatch(request)
+
+        histogram = self.request_histograms.get(type(request))
+        if histogram is not None:
+            histogram.record(time.monotonic_ns() - request.sent_ns)
+
+    def handle_place(self, request):
+        self.gateway.place(request.order_id, request.order)
+        if request.trace is not None:
+            tracer.mark_send(request.trace)
+
+    async def report(self):
         while True:
-            request_future = self.executor.run_in_executor(None, self.inbound_queue.get)
-            await request_future
-            request = request_future.result()
-
-            if type(request) == PlaceRequest:
-                self.gateway.place(request.order_id, request.order)
-            elif type(request) == CancelRequest:
-                self.gateway.cancel(request.order_id)
-            elif type(request) == ModifyRequest:
-                self.gateway.modify(request.order_id, request.order)
-            elif type(request) == SubscribeOrderbookRequest:
-                self.gateway.subscribe_orderbook(request.instrument)
-            elif type(request) == SubscribeTradesRequest:
-                self.gateway.subscribe_trades(request.instrument)
-            elif type(request) == SubscribeFillsRequest:
-                self.gateway.subscribe_fills()
+            await asyncio.sleep(self.report_interval)
+            for histogram in self.request_histograms.values():
+                if histogram.get_count():
+                    print("MultiprocessingGateway(Handler):", histogram.get_summary())
+                    histogram.reset()
+            if tracer.enabled:
+                tracer.report("MultiprocessingGateway(Handler):")
+                tracer.reset()
 
 class MultiprocessingGateway:
     def __init__(self, callbacks, config):
         self.config = config
         self.callbacks = callbacks
-        self.outbound_queue = multiprocessing.Queue()
-        self.inbound_queue = multiprocessing.Queue()
+        if self.config.get("transport", "queue") == "shared_memory":
+            self.outbound_queue = SharedMemoryQueue(self.config.get("transport_size", DEFAULT_SIZE),
+                                                    self.config.get("transport_full_timeout", DEFAULT_FULL_TIMEOUT))
+        else:
+            self.outbound_queue = multiprocessing.Queue()
+        # requests are written straight to the pipe by the caller, there is no
+        # feeder thread on this side or executor hop on the gateway side
+        self.inbound_reader, self.inbound_writer = multiprocessing.Pipe(duplex=False)
+
+        self.event_handlers = HandlerTable(
+            lambda event: print("MultiprocessingGateway: unhandled event type")
+        )
+        self.event_handlers.register_all([singular.event.PlaceAck,
+                                          singular.event.CancelAck,
+                                          singular.event.ModifyAck,
+                                          singular.event.PlaceReject,
+                                          singular.event.CancelReject,
+                                          singular.event.Fill],
+                                         lambda event: self.callbacks.on_order_update(event))
+        self.event_handlers.register_all([singular.event.OrderbookSnapshot,
+                                          singular.event.OrderbookLevelUpdate,
+                                          singular.event.TopOfBookUpdate,
+                                          singular.event.Trade],
+                                         self.handle_marketdata_event)
+        self.event_handlers.register_all([singular.event.GatewayDisconnect],
+                                         lambda event: self.callbacks.on_gateway_update(event))
 
     def run(self):
         def create_process():
@@ -72,10 +145,20 @@ class MultiprocessingGateway:
             
             callbacks = singular.gateway.GatewayCallbacks(
                 lambda event: self.outbound_queue.put(event),
-                lambda event: self.outbound_queue.put(event),
+                self.publish_marketdata_event,
                 lambda event: self.outbound_queue.put(event)
             )
 
+            # the recorder's writer thread has to start in the gateway process
+            if self.config.get("recording") is not None:
+                recorder = MarketdataRecorder(self.config["recording"], self.config["account"]["name"])
+                callbacks = recorder.attach(callbacks)
+                recorder.run()
+
+            if tracer.enabled:
+                signal.signal(signal.SIGUSR1,
+                              lambda signum, frame: tracer.report("MultiprocessingGateway(Handler):"))
+
             exchange = singular.config.exchange_str_to_exchange(
                 self.config["account"]["exchange"]
             )
@@ -93,8 +176,9 @@ class MultiprocessingGateway:
 
             gateway.run()
            
-            handler = Handler(executor, gateway, self.inbound_queue)
-            executor.create_task(handler.poll())
+            handler = Handler(executor, gateway, self.inbound_reader,
+                              self.config.get("latency_report_interval", 60))
+            handler.run()
             executor.run_forever()
 
         process = multiprocessing.Process(
@@ -103,6 +187,35 @@ class MultiprocessingGateway:
 
         process.start()
 
+    def publish_marketdata_event(self, event):
+        # gateway process side
+        if tracer.enabled:
+            event.trace = tracer.start()
+            tracer.mark_enqueue(event.trace)
+        self.outbound_queue.put(event)
+
+    def handle_marketdata_event(self, event):
+        # main process side
+        if event.trace is not None:
+            tracer.mark_dequeue(event.trace)
+        self.callbacks.on_marketdata_update(event)
+
+    def fileno(self):
+        if type(self.outbound_queue) == SharedMemoryQueue:
+            return self.outbound_queue.fileno()
+        else:
+            return self.outbound_queue._reader.fileno()
+
+    def prepare_wait(self):
+        if type(self.outbound_queue) == SharedMemoryQueue:
+            return self.outbound_queue.prepare_wait()
+        else:
+            return False
+
+    def clear_wakeup(self):
+        if type(self.outbound_queue) == SharedMemoryQueue:
+            self.outbound_queue.clear_wakeup()
+
     def is_active(self):
         # TODO: figure out way of passing bool
         return True
@@ -110,57 +223,43 @@ class MultiprocessingGateway:
     def place(self, order_id, order):
         # try:
         #     print("MultiprocessingGateway: place:", order_id, "start")
-        self.inbound_queue.put(
-            PlaceRequest(order_id, order)
+        self.inbound_writer.send(
+            PlaceRequest(order_id, order, tracer.get_order_trace() if tracer.enabled else None)
         )
         #     print("MultiprocessingGateway: place:", order_id, "end")
         # except Exception as e:
         #     print("MultiprocessingGateway: place:", order.instrument.get_external_symbol(), "Error", e, e.message)
 
     def cancel(self, order_id):
-        self.inbound_queue.put(
+        self.inbound_writer.send(
             CancelRequest(order_id)
         )
 
     def modify(self, order_id, order):
-        self.inbound_queue.put(
+        self.inbound_writer.send(
             ModifyRequest(order_id, order)
         )
 
     def subscribe_orderbook(self, instrument):
-        self.inbound_queue.put(
+        self.inbound_writer.send(
             SubscribeOrderbookRequest(instrument)
         )
 
     def subscribe_trades(self, instrument):
-        self.inbound_queue.put(
+        self.inbound_writer.send(
             SubscribeTradesRequest(instrument)
         )
 
     def subscribe_fills(self):
-        self.inbound_queue.put(
+        self.inbound_writer.send(
             SubscribeFillsRequest()
         )
 
     def consume_all(self):
+        dispatch = self.event_handlers.dispatch
         while True:
             try:
                 event = self.outbound_queue.get_nowait()
-                
-                if type(event) in [singular.event.PlaceAck,
-                                   singular.event.CancelAck,
-                                   singular.event.ModifyAck,
-                                   singular.event.PlaceReject,
-                                   singular.event.CancelReject,
-                                   singular.event.Fill]:
-                    self.callbacks.on_order_update(event)
-                elif type(event) in [singular.event.OrderbookSnapshot,
-                                     singular.event.OrderbookLevelUpdate,
-                                     singular.event.TopOfBookUpdate]:
-                    self.callbacks.on_marketdata_update(event)
-                elif type(event) in [singular.event.GatewayDisconnect]:
-                    self.callbacks.on_gateway_update(event)
-                else:
-                    print("MultiprocessingGateway: unhandled event type")
             except Empty:
-                break
\ No newline at end of file
+                break
+            dispatch(event)
@@ -0,0 +1,186 @@
+import os
+import time
+import atexit
+import struct
+from queue import Empty
+from multiprocessing import shared_memory
+
+from ..event import EventCodec
+
+# Single-producer/single-consumer ring buffer in shared memory. The producer
+# only ever writes the head counter and the consumer only ever writes the tail
+# counter, each on its own cache line, so no lock is needed. A record is
+# published by writing its bytes first and bumping the head afterwards.
+# Events are serialized with EventCodec.
+#
+# A consumer that wants to block sets the waiting flag and selects on the
+# doorbell pipe; the producer only pays for a write syscall when that flag is
+# set, so a spinning consumer costs the producer nothing.
+#
+# A full ring is waited on for at most full_timeout seconds, and not at all
+# once the consumer (the process that created the queue) is gone; the record
+# is then dropped and counted in full_count. Drops go on without waiting
+# until the consumer frees space again, so a stalled consumer never blocks
+# the producer's event loop for more than one timeout.
+
+HEADER_SIZE = 128
+HEAD_OFFSET = 0
+TAIL_OFFSET = 64
+WAITING_OFFSET = 72
+ALIGNMENT = 8
+WRAP = 0xFFFFFFFF
+DEFAULT_SIZE = 1 << 22
+DEFAULT_FULL_TIMEOUT = 0.1
+
+COUNTER = struct.Struct("<Q")
+LENGTH = struct.Struct("<I")
+
+class SharedMemoryQueue:
+    def __init__(self, size=DEFAULT_SIZE, full_timeout=DEFAULT_FULL_TIMEOUT):
+        if size % ALIGNMENT != 0:
+            raise ValueError("SharedMemoryQueue: size must be a multiple of 8")
+
+        self.size = size
+        self.full_timeout = full_timeout
+        self.consumer_pid = os.getpid()
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + size)
+        self.buffer = self.shared_memory.buf
+        COUNTER.pack_into(self.buffer, HEAD_OFFSET, 0)
+        COUNTER.pack_into(self.buffer, TAIL_OFFSET, 0)
+        self.buffer[WAITING_OFFSET] = 0
+
+        self.doorbell_reader, self.doorbell_writer = os.pipe()
+        os.set_blocking(self.doorbell_reader, False)
+        os.set_blocking(self.doorbell_writer, False)
+
+        ### Producer State ###
+        self.head = 0
+        self.cached_tail = 0
+        # records dropped on a full ring
+        self.full_count = 0
+        self.dropping = False
+
+        ### Consumer State ###
+        self.tail = 0
+        self.cached_head = 0
+
+        # each process only uses its own side of the codec
+        self.codec = EventCodec()
+
+        # forked gateway processes exit without running atexit handlers, so
+        # only the creating process unlinks the segment
+        atexit.register(self.close)
+
+    def close(self):
+        self.buffer = None
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+        os.close(self.doorbell_reader)
+        os.close(self.doorbell_writer)
+
+    ### Producer Interface ###
+
+    def put(self, event):
+        intern_count = len(self.codec.intern_ids)
+        if not self.write(self.codec.encode(event)):
+            # the consumer never sees the interns of a dropped record
+            self.codec.forget_interns(intern_count)
+
+    def write(self, record):
+        # returns False if the record was dropped
+        length = LENGTH.size + len(record)
+        aligned_length = (length + ALIGNMENT - 1) & ~(ALIGNMENT - 1)
+        if aligned_length > self.size // 2:
+            raise ValueError("SharedMemoryQueue: record larger than half the buffer")
+
+        position = self.head % self.size
+        remaining = self.size - position
+        if remaining < aligned_length:
+            # records never straddle the end of the buffer
+            if not self.wait_for_space(remaining + aligned_length):
+                return False
+            LENGTH.pack_into(self.buffer, HEADER_SIZE + position, WRAP)
+            self.head += remaining
+            position = 0
+        elif not self.wait_for_space(aligned_length):
+            return False
+
+        start = HEADER_SIZE + position
+        LENGTH.pack_into(self.buffer, start, length)
+        self.buffer[start + LENGTH.size:start + length] = record
+        self.head += aligned_length
+        COUNTER.pack_into(self.buffer, HEAD_OFFSET, self.head)
+
+        if self.buffer[WAITING_OFFSET]:
+            self.buffer[WAITING_OFFSET] = 0
+            try:
+                os.write(self.doorbell_writer, b"\0")
+            except BlockingIOError:
+                # doorbell already rung
+                pass
+        return True
+
+    def has_space(self, required):
+        if self.size - (self.head - self.cached_tail) >= required:
+            return True
+        self.cached_tail = COUNTER.unpack_from(self.buffer, TAIL_OFFSET)[0]
+        return self.size - (self.head - self.cached_tail) >= required
+
+    def is_consumer_alive(self):
+        # forked producers are reparented when the consumer exits
+        return os.getpid() == self.consumer_pid or os.getppid() == self.consumer_pid
+
+    def wait_for_space(self, required):
+        if self.has_space(required):
+            self.dropping = False
+            return True
+
+        if not self.dropping:
+            deadline = time.monotonic() + self.full_timeout
+            while self.is_consumer_alive() and time.monotonic() < deadline:
+                time.sleep(0)
+                if self.has_space(required):
+                    return True
+            print("SharedMemoryQueue: full, dropping records until the consumer catches up")
+            self.dropping = True
+
+        self.full_count += 1
+        return False
+
+    ### Consumer Interface ###
+
+    def fileno(self):
+        return self.doorbell_reader
+
+    def prepare_wait(self):
+        # returns True if records are already pending and the caller should
+        # not block
+        self.buffer[WAITING_OFFSET] = 1
+        return COUNTER.unpack_from(self.buffer, HEAD_OFFSET)[0] != self.tail
+
+    def clear_wakeup(self):
+        try:
+            while os.read(self.doorbell_reader, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def get_nowait(self):
+        while True:
+            if self.tail == self.cached_head:
+                self.cached_head = COUNTER.unpack_from(self.buffer, HEAD_OFFSET)[0]
+                if self.tail == self.cached_head:
+                    raise Empty
+
+            position = self.tail % self.size
+            start = HEADER_SIZE + position
+            length = LENGTH.unpack_from(self.buffer, start)[0]
+            if length == WRAP:
+                self.tail += self.size - position
+                COUNTER.pack_into(self.buffer, TAIL_OFFSET, self.tail)
+                continue
+
+            event = self.codec.decode(self.buffer, start + LENGTH.size)
+            self.tail += (length + ALIGNMENT - 1) & ~(ALIGNMENT - 1)
+            COUNTER.pack_into(self.buffer, TAIL_OFFSET, self.tail)
+            return event
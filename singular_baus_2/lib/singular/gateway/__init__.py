@@ -1,7 +1,9 @@
 from .AbstractGateway import AbstractGateway
 from .GatewayCallbacks import GatewayCallbacks
+from .SharedMemoryQueue import SharedMemoryQueue
 from .MultiprocessingGateway import MultiprocessingGateway
 from .okx.OkxGateway import OkxGateway
 from .binancecm.BinancecmGateway import BinancecmGateway
 from .binanceusdm.BinanceusdmGateway import BinanceusdmGateway
-from .deribit.DeribitGateway import DeribitGateway
\ No newline at end of file
+from .deribit.DeribitGateway import DeribitGateway
+from .replay.ReplayGateway import ReplayGateway
\ No newline at end of file
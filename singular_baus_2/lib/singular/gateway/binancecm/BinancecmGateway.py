@@ -42,10 +42,29 @@ class BinancecmGateway(AbstractGateway):
                         diagnose=True, rotation='00:00')
         self.rate_limited = False
         self.rate_limited_ts = None
+        # optional order entry over the websocket api, REST stays the fallback
+        self.order_websocket_client = None
+        if config.get("order_entry") == "websocket":
+            self.order_websocket_client = WebsocketClient(self.executor, self.get_order_entry_host(),
+                                                          self.parse_order_websocket,
+                                                          self.notify_order_disconnect)
+        self.order_request_id = 0
+        self.order_requests = {}
+        # places sent on a session that dropped before the response, client order id ->
+        # (order_id, order), until reconcile_order or their first order update resolves them
+        self.unknown_orders = {}
+        # orders placed over the websocket carry a client order id so that they can be queried
+        self.client_order_id_prefix = f"sg{int(time.time())}-"
 
     def is_active(self):
         return self.websocket_client.is_active()
 
+    def order_websocket_is_active(self):
+        return self.order_websocket_client is not None and self.order_websocket_client.is_active()
+
+    def get_order_entry_host(self):
+        return self.config.get("order_entry_host", "wss://ws-dapi.binance.com/ws-dapi/v1")
+
     def signature(self, payload_str: str = None):
         sig = hmac.new(
             self.config['secret'].encode(),
@@ -64,6 +83,19 @@ class BinancecmGateway(AbstractGateway):
 
         return f"{signed_payload}&signature={sig}"
 
+    def sign_params(self, params: dict = None, rec_window: int = 60000):
+        # websocket api requests carry the key in the params and are signed
+        # over the params sorted by key
+        params = params if params else {}
+        params = {**params,
+                  'apiKey': self.config['key'],
+                  'timestamp': int(time.time() * 1000),
+                  'recvWindow': rec_window}
+        params = dict(sorted(params.items()))
+        params['signature'] = self.signature(parse.urlencode(params))
+
+        return params
+
     def get_headers(self, method: str):
         headers = {'X-MBX-APIKEY': self.config['key']}
         if method.upper() == 'GET':
@@ -97,67 +129,102 @@ class BinancecmGateway(AbstractGateway):
         task = self.executor.create_task(self.websocket_client.send(message))
         self.tasks.add(task)
 
+    def get_order_payload(self, order):
+        if order.type == OrderType.IOC:
+            time_in_force = 'IOC'
+        elif order.type == OrderType.POST_ONLY:
+            time_in_force = 'GTX'
+        else:  # limit
+            time_in_force = 'GTC'
+        payload = {
+            'symbol': order.instrument.get_external_symbol(),
+            'side': order.side.name.upper(),
+            'type': 'LIMIT',
+            'timeInForce': time_in_force,
+            'quantity': order.quantity,
+            'price': round(order.price, 2)
+        }
+
+        return payload
+
+    def handle_place_response(self, order_id, order, message):
+        if 'orderId' in message:
+            self.internal_to_external_map[order_id] = message["orderId"]
+            self.external_to_internal_map[message["orderId"]] = order_id
+            self.internal_id_to_instrument_map[order_id] = order.instrument
+
+            event = PlaceAck(order_id,
+                             self.account,
+                             order.instrument,
+                             order.side,
+                             float(message["price"]),
+                             float(message["origQty"]))
+
+            self.callbacks.on_order_update(event)
+
+            # print("Placing", order_id, message["id"], message, type(message["id"]))
+
+            if message["orderId"] in self.cached_fills.keys():
+                for fill_update in self.cached_fills[message["orderId"]]:
+                    fill_update.order_id = order_id
+                    self.callbacks.on_order_update(fill_update)
+                del self.cached_fills[message["orderId"]]
+        else:
+            self.logger.info(f'BinancecmGateway: unable to parse place_wrapper message {message}')
+            self.callbacks.on_order_update(PlaceReject(order_id, message))
+            if "code" in message.keys():
+                if message["code"] == -1015:
+                    self.rate_limited = True
+                    self.rate_limited_ts = time.time()
+
     async def place_wrapper(self, order_id, order):
         try:
             endpoint = 'dapi/v1/order'
-            if order.type == OrderType.IOC:
-                time_in_force = 'IOC'
-            elif order.type == OrderType.POST_ONLY:
-                time_in_force = 'GTX'
-            else:  # limit
-                time_in_force = 'GTC'
-            payload = {
-                'symbol': order.instrument.get_external_symbol(),
-                'side': order.side.name.upper(),
-                'type': 'LIMIT',
-                'timeInForce': time_in_force,
-                'quantity': order.quantity,
-                'price': round(order.price, 2)
-            }
-
+            payload = self.get_order_payload(order)
             signed_payload_str = self.sign_payload(payload)
             message = await self.http_client.post(endpoint=f'{endpoint}?{signed_payload_str}',
                                                   header=self.get_headers(method='POST'),
                                                   data=None)
 
-            if 'orderId' in message:
-                self.internal_to_external_map[order_id] = message["orderId"]
-                self.external_to_internal_map[message["orderId"]] = order_id
-                self.internal_id_to_instrument_map[order_id] = order.instrument
-
-                event = PlaceAck(order_id,
-                                 self.account,
-                                 order.instrument,
-                                 order.side,
-                                 float(message["price"]),
-                                 float(message["origQty"]))
-
-                self.callbacks.on_order_update(event)
-
-                # print("Placing", order_id, message["id"], message, type(message["id"]))
-
-                if message["orderId"] in self.cached_fills.keys():
-                    for fill_update in self.cached_fills[message["orderId"]]:
-                        fill_update.order_id = order_id
-                        self.callbacks.on_order_update(fill_update)
-                    del self.cached_fills[message["orderId"]]
-            else:
-                self.logger.info(f'BinancecmGateway: unable to parse place_wrapper message {message}')
-                self.callbacks.on_order_update(PlaceReject(order_id, message))
-                if "code" in message.keys():
-                    if message["code"] == -1015:
-                        self.rate_limited = True
-                        self.rate_limited_ts = time.time()
+            self.handle_place_response(order_id, order, message)
 
         except Exception as e:
             self.logger.info(f'BinancecmGateway: place wrapper error {e}')
             # self.logger.info("BinancecmGateway: place_wrapper", order.instrument.get_external_symbol(), "Error", str(e))
             # self.logger.exception("BinancecmGateway: place_wrapper", order.instrument.get_external_symbol(), "Error", str(e))
             self.callbacks.on_order_update(PlaceReject(order_id, e))
+
+    def get_client_order_id(self, order_id):
+        return f"{self.client_order_id_prefix}{order_id}"
+
+    async def place_websocket(self, order_id, order):
+        try:
+            request_id = self.get_order_request_id()
+            payload = self.get_order_payload(order)
+            payload['newClientOrderId'] = self.get_client_order_id(order_id)
+            message = json.dumps({"id": request_id,
+                                  "method": "order.place",
+                                  "params": self.sign_params(payload)})
+        except Exception as e:
+            self.logger.info(f'BinancecmGateway: place websocket error {e}')
+            self.callbacks.on_order_update(PlaceReject(order_id, e))
+            return
+
+        self.order_requests[request_id] = ('place', order_id, order)
+        try:
+            await self.order_websocket_client.send_request(message)
+        except Exception as e:
+            # not sent, unless the disconnect already took the request over
+            if self.order_requests.pop(request_id, None) is not None:
+                self.logger.info(f'BinancecmGateway: place websocket send error {e}, placing over REST')
+                await self.place_wrapper(order_id, order)
     
     def place(self, order_id, order):
         if not self.rate_limited:
-            task = self.executor.create_task(self.place_wrapper(order_id, order))
+            if self.order_websocket_is_active():
+                task = self.executor.create_task(self.place_websocket(order_id, order))
+            else:
+                task = self.executor.create_task(self.place_wrapper(order_id, order))
             self.tasks.add(task)
         else:
             self.callbacks.on_order_update(PlaceReject(order_id=order_id, reason="INTERNAL RATE LIMIT"))
@@ -186,9 +253,45 @@ class BinancecmGateway(AbstractGateway):
 
         self.callbacks.on_order_update(event)
 
+    async def cancel_websocket(self, order_id, instrument):
+        try:
+            request_id = self.get_order_request_id()
+            params = {
+                'symbol': instrument.get_external_symbol(),
+                'orderId': self.internal_to_external_map[order_id],
+            }
+            message = json.dumps({"id": request_id,
+                                  "method": "order.cancel",
+                                  "params": self.sign_params(params)})
+        except Exception as e:
+            self.logger.info((f"BinancecmGateway: cancel_websocket error for {order_id}, reason: {e}"))
+            self.callbacks.on_order_update(CancelReject(order_id, e))
+            return
+
+        self.order_requests[request_id] = ('cancel', order_id, instrument)
+        try:
+            await self.order_websocket_client.send_request(message)
+        except Exception as e:
+            if self.order_requests.pop(request_id, None) is not None:
+                self.logger.info(f"BinancecmGateway: cancel websocket send error {e}, cancelling over REST")
+                await self.cancel_wrapper(order_id, instrument)
+
+    def handle_cancel_response(self, order_id, message):
+        # -2011 is unknown order, i.e. it is already filled or cancelled
+        if 'orderId' in message or message.get("code") == -2011:
+            event = CancelAck(order_id)
+        else:
+            self.logger.info(f"BinancecmGateway: cancel rejected for {order_id}, message {message}")
+            event = CancelReject(order_id, message)
+
+        self.callbacks.on_order_update(event)
+
     def cancel(self, order_id):
         instrument = self.internal_id_to_instrument_map[order_id]
-        task = self.executor.create_task(self.cancel_wrapper(order_id, instrument))
+        if self.order_websocket_is_active():
+            task = self.executor.create_task(self.cancel_websocket(order_id, instrument))
+        else:
+            task = self.executor.create_task(self.cancel_wrapper(order_id, instrument))
         self.tasks.add(task)
 
     def subscribe_orderbook(self, instrument):
@@ -234,6 +337,12 @@ class BinancecmGateway(AbstractGateway):
                                         
                 elif message["e"] == "ORDER_TRADE_UPDATE":
                     # print("ORDER TRADE UPDATE", message)
+                    if message["o"].get("c") in self.unknown_orders:
+                        # the update of an order placed on a dropped session acks it
+                        self.resolve_unknown_order(message["o"]["c"],
+                                                   {"orderId": int(message["o"]["i"]),
+                                                    "price": message["o"]["p"],
+                                                    "origQty": message["o"]["q"]})
                     if message["o"]["L"] != "0":  #TODO confirm this is the way to filter for fills
                         ext_id = int(message["o"]["i"])
                         # print("BinancecmGateway: parse_websocket: fill msg", ext_id, message)
@@ -302,6 +411,100 @@ class BinancecmGateway(AbstractGateway):
             self.logger.info("BinancecmGateway: parse_websocket exception: ", e)
             # self.logger.exception("BinancecmGateway: parse_websocket exception: ", e)
 
+    def get_order_request_id(self):
+        self.order_request_id += 1
+        return self.order_request_id
+
+    def parse_order_websocket(self, message):
+        try:
+            message = json.loads(message)
+            if message.get("id") not in self.order_requests:
+                self.logger.info(f"BinancecmGateway: parse_order_websocket: no request for message {message}")
+                return
+
+            request_type, order_id, target = self.order_requests.pop(message["id"])
+            # the result and error bodies match the REST responses
+            if message.get("status") == 200:
+                response = message["result"]
+            else:
+                response = message.get("error", message)
+
+            if request_type == 'place':
+                self.handle_place_response(order_id, target, response)
+            else:
+                self.handle_cancel_response(order_id, response)
+        except Exception as e:
+            self.logger.info(f"BinancecmGateway: parse_order_websocket exception: {e}")
+
+    def resolve_unknown_order(self, client_order_id, message):
+        # message is a place response (or looks like one), None if the status is still unknown
+        # after every retry
+        order_id, order = self.unknown_orders.pop(client_order_id)
+        self.logger.info(f"BinancecmGateway: resolve_unknown_order {order_id} message {message}")
+        if message is None:
+            self.callbacks.on_order_update(PlaceReject(order_id, "unknown after disconnect"))
+        else:
+            self.handle_place_response(order_id, order, message)
+
+    async def reconcile_order(self, client_order_id, retries=10, retry_interval=1.0, max_retry_interval=30.0):
+        # a place whose response was lost may or may not be on the exchange, its status tells
+        endpoint = 'dapi/v1/order'
+        for _ in range(retries):
+            await asyncio.sleep(retry_interval)
+            retry_interval = min(retry_interval * 2, max_retry_interval)
+            if client_order_id not in self.unknown_orders:
+                # resolved by its order update
+                return
+            order_id, order = self.unknown_orders[client_order_id]
+            try:
+                payload = {
+                    'symbol': order.instrument.get_external_symbol(),
+                    'origClientOrderId': client_order_id,
+                }
+                signed_payload_str = self.sign_payload(payload)
+                message = await self.http_client.get(endpoint=f"{endpoint}?{signed_payload_str}",
+                                                     header=self.get_headers('GET'))
+            except Exception as e:
+                self.logger.info(f"BinancecmGateway: reconcile_order error for {order_id}, reason: {e}")
+                continue
+
+            if client_order_id not in self.unknown_orders:
+                return
+            # -2013 is order does not exist, the place never reached the exchange
+            if 'orderId' in message or message.get("code") == -2013:
+                self.resolve_unknown_order(client_order_id, message)
+                return
+            self.logger.info(f"BinancecmGateway: reconcile_order {order_id} unresolved, message {message}")
+
+        if client_order_id in self.unknown_orders:
+            self.logger.error(f"BinancecmGateway: reconcile_order gave up on {client_order_id}")
+            self.resolve_unknown_order(client_order_id, None)
+
+    def notify_order_disconnect(self):
+        self.logger.info("BinancecmGateway: notify_order_disconnect")
+        # requests in flight on the dropped session will never be answered: places may be live on
+        # the exchange so their status is queried, cancels are sent again over REST
+        for request_type, order_id, target in self.order_requests.values():
+            if request_type == 'place':
+                client_order_id = self.get_client_order_id(order_id)
+                self.unknown_orders[client_order_id] = (order_id, target)
+                task = self.executor.create_task(self.reconcile_order(client_order_id))
+            else:
+                task = self.executor.create_task(self.cancel_wrapper(order_id, target))
+            self.tasks.add(task)
+        self.order_requests = {}
+
+        self.order_websocket_client = WebsocketClient(self.executor, self.get_order_entry_host(),
+                                                      self.parse_order_websocket,
+                                                      self.notify_order_disconnect)
+        self.run_order_websocket()
+
+    def run_order_websocket(self):
+        self.logger.info("BinancecmGateway: run_order_websocket")
+        status = asyncio.Event()
+        task = self.order_websocket_client.start(status)
+        self.tasks.add(task)
+
     def notify_disconnect(self):
         self.logger.info("BinancecmGateway: notify_disconnect")
         self.callbacks.on_gateway_update(GatewayDisconnect(self.account))
@@ -319,7 +522,15 @@ class BinancecmGateway(AbstractGateway):
         task = self.executor.create_task(self.websocket_client.run(status))
         self.tasks.add(task)
 
+        # reconnecting the market data websocket reruns this, keep the order session
+        if self.order_websocket_client is not None and not self.order_websocket_client.started:
+            self.run_order_websocket()
+
         self.logger.info("BinancecmGateway: keep_alive_listen_key")
         task = self.executor.create_task(self.keep_alive_listen_key())
         self.tasks.add(task)
 
+        self.logger.info("BinancecmGateway: warm_up http connections")
+        task = self.executor.create_task(self.http_client.warm_up('dapi/v1/ping'))
+        self.tasks.add(task)
+
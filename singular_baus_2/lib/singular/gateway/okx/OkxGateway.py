@@ -365,6 +365,11 @@ class OkxGateway(AbstractGateway):
 
     def reconnect(self):
         print("OkxGateway: reconnect: new websockets and re-run")
+        # either session dropping lands here, the other one may still be up and
+        # would deliver every private update a second time
+        for websocket_client in (self.public_websocket_client, self.private_websocket_client):
+            task = self.executor.create_task(websocket_client.close())
+            self.tasks.add(task)
         self.public_websocket_client = WebsocketClient(self.executor, self.config['public_host'],
                                                        self.parse_websocket, self.notify_disconnect)
         self.private_websocket_client = WebsocketClient(self.executor, self.config['private_host'],
@@ -0,0 +1,103 @@
+from ...core.Account import Account
+from ...config import exchange_str_to_exchange
+from ...event.Trade import Trade
+from .SimulatedMatchingEngine import SimulatedMatchingEngine, get_key
+
+# Stands in for a MultiprocessingGateway when replaying recorded market data.
+# Everything runs in the caller's process and on the replay clock: the replay
+# driver hands every recorded event to handle_marketdata_event, orders go to a
+# SimulatedMatchingEngine, and consume_all delivers the resulting events to
+# the callbacks like a live gateway would. Market data is only delivered for
+# subscribed instruments.
+
+class ReplayGateway:
+    def __init__(self, callbacks, config, replay_config):
+        self.config = config
+        self.callbacks = callbacks
+        self.account = Account(exchange_str_to_exchange(config["account"]["exchange"]),
+                               config["account"]["name"])
+
+        self.now_ns = 0
+        self.pending_order_events = []
+        self.pending_marketdata_events = []
+        self.orderbook_subscriptions = set()
+        self.trade_subscriptions = set()
+
+        self.matching_engine = SimulatedMatchingEngine(self.account,
+                                                       replay_config.get("matching", {}),
+                                                       self.pending_order_events.append)
+
+    ### Replay Interface ###
+
+    def get_account(self):
+        return self.account
+
+    def advance(self, now_ns):
+        self.now_ns = now_ns
+        self.matching_engine.advance(now_ns)
+
+    def handle_marketdata_event(self, now_ns, event, publish=True):
+        self.now_ns = now_ns
+        self.matching_engine.handle_marketdata_event(now_ns, event)
+        if publish:
+            key = get_key(event.instrument)
+            if type(event) == Trade:
+                subscribed = key in self.trade_subscriptions
+            else:
+                subscribed = key in self.orderbook_subscriptions
+            if subscribed:
+                self.pending_marketdata_events.append(event)
+
+    def has_pending_events(self):
+        return bool(self.pending_order_events or self.pending_marketdata_events) or\
+            self.matching_engine.has_pending_requests(self.now_ns)
+
+    ### Gateway Interface ###
+
+    def run(self):
+        print("ReplayGateway: replaying", self.account.get_name())
+
+    def is_active(self):
+        return True
+
+    def prepare_wait(self):
+        return self.has_pending_events()
+
+    def clear_wakeup(self):
+        pass
+
+    def place(self, order_id, order):
+        self.matching_engine.place(order_id, order)
+
+    def cancel(self, order_id):
+        self.matching_engine.cancel(order_id)
+
+    def modify(self, order_id, order):
+        self.matching_engine.modify(order_id, order)
+
+    def subscribe_orderbook(self, instrument):
+        self.orderbook_subscriptions.add(get_key(instrument))
+
+    def subscribe_trades(self, instrument):
+        self.trade_subscriptions.add(get_key(instrument))
+
+    def subscribe_fills(self):
+        pass
+
+    def get_funding(self, instrument):
+        pass
+
+    def consume_all(self):
+        # order events go ahead of the market data of the same step
+        count = 0
+        while self.pending_order_events or self.pending_marketdata_events:
+            order_events = self.pending_order_events[:]
+            marketdata_events = self.pending_marketdata_events[:]
+            del self.pending_order_events[:]
+            del self.pending_marketdata_events[:]
+            for event in order_events:
+                self.callbacks.on_order_update(event)
+            for event in marketdata_events:
+                self.callbacks.on_marketdata_update(event)
+            count += len(order_events) + len(marketdata_events)
+        return count
@@ -0,0 +1,245 @@
+import copy
+import heapq
+
+from ...core.Orderbook import Orderbook
+from ...core.OrderType import OrderType
+from ...core.Side import Side
+from ...event.CancelAck import CancelAck
+from ...event.CancelReject import CancelReject
+from ...event.Fill import Fill
+from ...event.ModifyAck import ModifyAck
+from ...event.PlaceAck import PlaceAck
+from ...event.PlaceReject import PlaceReject
+from ...event.Trade import Trade
+
+# Matches one account's orders against replayed market data. Requests reach
+# the exchange after a fixed latency and are then executed in arrival order.
+#
+#   marketable on arrival   fills at the touch, up to the touch quantity, as
+#                           taker; the rest rests (IOC: is cancelled,
+#                           POST_ONLY: the order is rejected)
+#   resting                 fills at its own price, as maker, when the
+#                           opposite touch crosses it (up to the touch
+#                           quantity) or a trade prints through it (up to the
+#                           trade quantity, or at its price with
+#                           fill_on_touch)
+#
+# There is no queue position, so resting fills are optimistic for orders
+# joining a level and pessimistic for orders that would have been early in
+# the queue.
+
+PLACE = 0
+CANCEL = 1
+MODIFY = 2
+
+def get_key(instrument):
+    return (instrument.get_exchange(), instrument.get_external_symbol())
+
+class SimulatedOrder:
+    __slots__ = ("order_id", "order", "price", "remaining")
+
+    def __init__(self, order_id, order):
+        self.order_id = order_id
+        self.order = order
+        self.price = order.price
+        self.remaining = order.quantity
+
+class SimulatedMatchingEngine:
+    def __init__(self, account, config, emit):
+        self.account = account
+        self.emit = emit
+        self.latency_ns = int(config.get("latency", 0.0) * 1e9)
+        self.maker_fee = config.get("maker_fee", 0.0)
+        self.taker_fee = config.get("taker_fee", 0.0)
+        self.fill_on_touch = config.get("fill_on_touch", False)
+        self.fee_currency = config.get("fee_currency")
+
+        self.now_ns = 0
+        self.requests = []
+        self.request_sequence = 0
+        self.fill_id = 0
+
+        self.orderbooks = {}
+        # key -> order_id -> SimulatedOrder, in arrival order
+        self.orders = {}
+        self.order_keys = {}
+
+    ### Interface ###
+
+    def place(self, order_id, order):
+        self.push_request(PLACE, order_id, order)
+
+    def cancel(self, order_id):
+        self.push_request(CANCEL, order_id, None)
+
+    def modify(self, order_id, order):
+        self.push_request(MODIFY, order_id, order)
+
+    def get_open_orders(self):
+        return [simulated_order for orders in self.orders.values() for simulated_order in orders.values()]
+
+    def has_pending_requests(self, now_ns):
+        return bool(self.requests) and self.requests[0][0] <= now_ns
+
+    def advance(self, now_ns):
+        # executes the requests that reached the exchange by now_ns
+        requests = self.requests
+        while requests and requests[0][0] <= now_ns:
+            due_ns, _, kind, order_id, order = heapq.heappop(requests)
+            self.now_ns = due_ns
+            if kind == PLACE:
+                self.execute_place(order_id, order)
+            elif kind == CANCEL:
+                self.execute_cancel(order_id)
+            else:
+                self.execute_modify(order_id, order)
+        self.now_ns = max(self.now_ns, now_ns)
+
+    def handle_marketdata_event(self, now_ns, event):
+        self.advance(now_ns)
+        key = get_key(event.instrument)
+        if type(event) == Trade:
+            self.match_trade(key, event)
+        else:
+            orderbook = self.orderbooks.get(key)
+            if orderbook is None:
+                orderbook = self.orderbooks[key] = Orderbook(event.instrument)
+            orderbook.handle_event(event)
+            self.match_book(key)
+
+    ### Execution ###
+
+    def push_request(self, kind, order_id, order):
+        # a live gateway only ever sees a copy of the strategy's order
+        if order is not None:
+            order = copy.copy(order)
+        self.request_sequence += 1
+        heapq.heappush(self.requests, (self.now_ns + self.latency_ns, self.request_sequence,
+                                       kind, order_id, order))
+
+    def execute_place(self, order_id, order):
+        if order.quantity is None or order.quantity <= 0 or order.price is None:
+            self.emit(PlaceReject(order_id, "invalid price or quantity"))
+            return
+
+        key = get_key(order.instrument)
+        touch = self.get_opposite_touch(key, order.side)
+        marketable = touch is not None and self.crosses(order.side, order.price, touch.price)
+        if marketable and order.type == OrderType.POST_ONLY:
+            self.emit(PlaceReject(order_id, "post only order would cross"))
+            return
+
+        self.emit(PlaceAck(order_id, self.account, order.instrument, order.side,
+                           order.price, order.quantity))
+        simulated_order = SimulatedOrder(order_id, order)
+        if marketable:
+            self.fill(simulated_order, touch.price, min(simulated_order.remaining, touch.quantity),
+                      self.taker_fee)
+
+        if simulated_order.remaining > 0:
+            if order.type == OrderType.IOC:
+                self.emit(CancelAck(order_id))
+            else:
+                self.orders.setdefault(key, {})[order_id] = simulated_order
+                self.order_keys[order_id] = key
+
+    def execute_cancel(self, order_id):
+        key = self.order_keys.pop(order_id, None)
+        if key is None:
+            self.emit(CancelReject(order_id, "unknown order"))
+            return
+        del self.orders[key][order_id]
+        self.emit(CancelAck(order_id))
+
+    def execute_modify(self, order_id, order):
+        key = self.order_keys.get(order_id)
+        if key is None:
+            print("SimulatedMatchingEngine: execute_modify: unknown order", order_id)
+            return
+
+        simulated_order = self.orders[key][order_id]
+        filled = simulated_order.order.quantity - simulated_order.remaining
+        simulated_order.price = order.price
+        simulated_order.remaining = order.quantity - filled
+        simulated_order.order.quantity = order.quantity
+        self.emit(ModifyAck(order_id, order.price, order.quantity))
+
+        if simulated_order.remaining <= 0:
+            self.remove(key, order_id)
+            return
+        touch = self.get_opposite_touch(key, simulated_order.order.side)
+        if touch is not None and self.crosses(simulated_order.order.side, order.price, touch.price):
+            self.fill(simulated_order, touch.price, min(simulated_order.remaining, touch.quantity),
+                      self.taker_fee)
+            if simulated_order.remaining <= 0:
+                self.remove(key, order_id)
+
+    ### Matching ###
+
+    def match_book(self, key):
+        orders = self.orders.get(key)
+        if not orders:
+            return
+
+        orderbook = self.orderbooks[key]
+        for simulated_order in list(orders.values()):
+            touch = self.get_opposite_level(orderbook, simulated_order.order.side)
+            if touch is not None and self.crosses(simulated_order.order.side, simulated_order.price,
+                                                  touch.price):
+                self.fill(simulated_order, simulated_order.price,
+                          min(simulated_order.remaining, touch.quantity), self.maker_fee)
+                if simulated_order.remaining <= 0:
+                    self.remove(key, simulated_order.order_id)
+
+    def match_trade(self, key, event):
+        orders = self.orders.get(key)
+        if not orders:
+            return
+
+        quantity = event.quantity
+        for simulated_order in list(orders.values()):
+            if quantity <= 0:
+                break
+            if simulated_order.order.side == Side.BUY:
+                through = event.price < simulated_order.price
+            else:
+                through = event.price > simulated_order.price
+            if through or (self.fill_on_touch and event.price == simulated_order.price):
+                fill_quantity = min(simulated_order.remaining, quantity)
+                quantity -= fill_quantity
+                self.fill(simulated_order, simulated_order.price, fill_quantity, self.maker_fee)
+                if simulated_order.remaining <= 0:
+                    self.remove(key, simulated_order.order_id)
+
+    def fill(self, simulated_order, price, quantity, fee_rate):
+        order = simulated_order.order
+        simulated_order.remaining -= quantity
+        self.fill_id += 1
+        fee_currency = self.fee_currency
+        if fee_currency is None and order.instrument is not None:
+            fee_currency = order.instrument.get_quote_currency()
+        self.emit(Fill(self.now_ns // 1000000, self.fill_id, simulated_order.order_id, self.account,
+                       order.instrument, order.side, price, quantity, price * quantity * fee_rate,
+                       fee_currency))
+
+    def remove(self, key, order_id):
+        del self.orders[key][order_id]
+        del self.order_keys[order_id]
+
+    def get_opposite_touch(self, key, side):
+        orderbook = self.orderbooks.get(key)
+        if orderbook is None:
+            return None
+        return self.get_opposite_level(orderbook, side)
+
+    def get_opposite_level(self, orderbook, side):
+        if side == Side.BUY:
+            return orderbook.get_best_ask_level()
+        else:
+            return orderbook.get_best_bid_level()
+
+    def crosses(self, side, price, touch_price):
+        if side == Side.BUY:
+            return price >= touch_price
+        else:
+            return price <= touch_price
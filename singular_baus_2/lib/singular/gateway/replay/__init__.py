@@ -0,0 +1 @@
+from .ReplayGateway import ReplayGateway
\ No newline at end of file
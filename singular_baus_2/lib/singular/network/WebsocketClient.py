@@ -2,12 +2,24 @@ import websockets
 from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK
 import asyncio
 
+from ..utilities.time import tracer
+
+# process wide hook called with (host, message) for every message received,
+# used to record raw frames
+frame_callback = None
+
+def set_frame_callback(callback):
+    global frame_callback
+    frame_callback = callback
+
 class WebsocketSession:
     def __init__(self, host, on_read_callback, on_error_callback):
         self.host = host
         self.on_read_callback = on_read_callback
         self.on_error_callback = on_error_callback
         self.active = False
+        # set by close, the session then ends without calling on_error_callback
+        self.closing = False
 
     def __await__(self):
         return self._async_init().__await__()
@@ -29,6 +41,7 @@ class WebsocketSession:
             raise
         except Exception as e:
             print(f"WebsocketClient(Session): send: Error {e.__class__.__name__}: {e}")
+            raise
 
     async def receive(self):
         try:
@@ -43,19 +56,37 @@ class WebsocketSession:
         while True:
             try:
                 message = await self.receive()
+                if tracer.enabled:
+                    tracer.mark_receive()
+                if frame_callback is not None and message is not None:
+                    frame_callback(self.host, message)
                 self.on_read_callback(message)
+                if tracer.enabled:
+                    tracer.end_receive()
             except (ConnectionClosedError, ConnectionClosedOK) as e:
+                if self.closing:
+                    return
                 print('WebsocketClient(Session): run:', {e.__class__.__name__}, str(e),
                       'cooling off before reconnecting')
                 self.active = False
-                await self._conn.__aexit__()
+                await self._conn.__aexit__(None, None, None)
                 await asyncio.sleep(5.5)
                 self.on_error_callback()
+                return
             except Exception as e:
+                if self.closing:
+                    return
                 print("WebsocketClient(Session): run: Error", str(e))
                 self.active = False
-                await self._conn.__aexit__()
+                await self._conn.__aexit__(None, None, None)
                 self.on_error_callback()
+                return
+
+    async def close(self):
+        self.closing = True
+        if self.active:
+            self.active = False
+            await self._conn.__aexit__(None, None, None)
 
 
 class WebsocketClient:
@@ -66,18 +97,40 @@ class WebsocketClient:
         self.on_error_callback = on_error_callback
         self.client = None
         self.active = False
+        # run was called, the session may still be connecting
+        self.started = False
+        self.closing = False
 
     async def run(self, status):
+        self.started = True
         self.client = await WebsocketSession(self.host, self.on_read_callback, self.on_error_callback)
+        if self.closing:
+            # closed while connecting
+            await self.client.close()
+            return
         self.active = True
         status.set()
         self.executor.create_task(self.client.run())
 
+    def start(self, status):
+        # run as a task, marked started before the task gets to run
+        self.started = True
+        return self.executor.create_task(self.run(status))
+
+    async def close(self):
+        # ends the session (or the connection in progress) for good, without
+        # calling on_error_callback
+        self.closing = True
+        self.active = False
+        if self.client is not None:
+            await self.client.close()
+
     def is_active(self):
+        # the session goes inactive when its connection drops
         if self.client is None:
             return False
         else:
-            return self.active
+            return self.active and self.client.is_active()
 
     def get_status_flag(self):
         return self.connected
@@ -88,6 +141,12 @@ class WebsocketClient:
         except Exception as e:
             print("WebsocketClient: send: Error", str(e))
 
+    async def send_request(self, message):
+        # unlike send, raises when the message could not be sent
+        if not self.is_active():
+            raise ConnectionError(f"WebsocketClient: send_request: {self.host} is not connected")
+        await self.client.send(message)
+
     async def receive(self):
         try:
             await self.client.receive()
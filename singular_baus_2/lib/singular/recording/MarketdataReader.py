@@ -0,0 +1,99 @@
+import os
+import glob
+import zlib
+
+from ..event.EventCodec import EventCodec
+from .MarketdataRecorder import (
+    MAGIC, EVENT, TEXT_FRAME, CHUNK_HEADER, RECORD_HEADER, decompress
+)
+
+# Reads recordings written by MarketdataRecorder. Records come back as
+# (kind, wall_ns, monotonic_ns, source, data) with events decoded and text
+# frames as str. A torn or corrupt chunk is reported and skipped by scanning
+# for the next chunk header, so a recording that was appended to after a
+# crash stays readable.
+
+class MarketdataReader:
+    def __init__(self, paths, events=True, frames=True):
+        if type(paths) == str:
+            paths = [paths]
+        self.paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                self.paths.extend(sorted(glob.glob(os.path.join(path, "*.sbmd"))))
+            else:
+                self.paths.append(path)
+        self.events = events
+        self.frames = frames
+        self.codec = EventCodec()
+        self.skipped_chunk_count = 0
+
+    ### Interface ###
+
+    def __iter__(self):
+        for path in self.paths:
+            yield from self.read_file(path)
+
+    def get_skipped_chunk_count(self):
+        return self.skipped_chunk_count
+
+    def read_file(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+
+        offset = 0
+        while offset + CHUNK_HEADER.size <= len(data):
+            magic, compression, length, crc, count, _, _ = CHUNK_HEADER.unpack_from(data, offset)
+            start = offset + CHUNK_HEADER.size
+            payload = data[start:start + length]
+            if magic != MAGIC or len(payload) != length or zlib.crc32(payload) != crc:
+                print("MarketdataReader: read_file: skipping corrupt chunk in", path, "at", offset)
+                self.skipped_chunk_count += 1
+                offset = data.find(MAGIC, offset + 1)
+                if offset < 0:
+                    break
+                continue
+
+            yield from self.read_chunk(decompress(compression, payload), count)
+            offset = start + length
+
+    def read_chunk(self, chunk, count):
+        # the recorder reset its codec at the start of every chunk
+        self.codec.reset()
+        offset = 0
+        for _ in range(count):
+            kind, wall_ns, monotonic_ns, source_length, length =\
+                RECORD_HEADER.unpack_from(chunk, offset)
+            offset += RECORD_HEADER.size
+            source = chunk[offset:offset + source_length].decode()
+            offset += source_length
+
+            if kind == EVENT:
+                if self.events:
+                    yield (kind, wall_ns, monotonic_ns, source, self.codec.decode(chunk, offset))
+            elif self.frames:
+                data = chunk[offset:offset + length]
+                yield (kind, wall_ns, monotonic_ns, source,
+                       data.decode() if kind == TEXT_FRAME else data)
+            offset += length
+
+
+if __name__ == "__main__":
+    # summarises recordings
+    # usage: python -m singular.recording.MarketdataReader <file or directory>...
+    import sys
+    import collections
+
+    counts = collections.Counter()
+    first_ns, last_ns = None, None
+    reader = MarketdataReader(sys.argv[1:])
+    for kind, wall_ns, monotonic_ns, source, data in reader:
+        name = type(data).__name__ if kind == EVENT else "frame"
+        counts[(source, name)] += 1
+        first_ns = wall_ns if first_ns is None else first_ns
+        last_ns = wall_ns
+
+    for (source, name), count in sorted(counts.items()):
+        print(f"{source:<40}{name:<24}{count:>10}")
+    if first_ns is not None:
+        print(f"span: {(last_ns - first_ns) / 1e9:.3f}s, skipped chunks: {reader.get_skipped_chunk_count()}")
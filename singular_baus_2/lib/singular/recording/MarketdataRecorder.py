@@ -0,0 +1,226 @@
+import os
+import time
+import zlib
+import lzma
+import struct
+import threading
+import collections
+import datetime as dt
+
+from ..event.EventCodec import EventCodec
+from ..network.WebsocketClient import set_frame_callback
+
+# Recording files are append-only sequences of self-contained chunks:
+#
+#   chunk header   magic, compression, payload length, crc32 of the payload,
+#                  record count, first and last wall clock ns of the records
+#   payload        compressed records
+#
+# Each record is a header (kind, wall clock ns, monotonic ns, source length,
+# data length) followed by the source and the data. Events are EventCodec
+# messages; the codec is reset at every chunk so chunks decode independently
+# and a chunk torn by a crash only loses itself. Frames are the websocket
+# messages as received, sourced by host.
+#
+# Callers only append to a bounded deque; encoding, compression and file IO
+# happen on a background thread, and records that do not fit the buffer are
+# dropped and counted rather than blocking the gateway event loop.
+
+MAGIC = b"SBMD"
+
+EVENT = 1
+TEXT_FRAME = 2
+BINARY_FRAME = 3
+
+ZLIB = 1
+LZMA = 2
+
+COMPRESSIONS = {"zlib": ZLIB, "lzma": LZMA}
+
+CHUNK_HEADER = struct.Struct("<4sBIIIqq")
+RECORD_HEADER = struct.Struct("<BqqHI")
+
+def compress(compression, payload, level):
+    if compression == ZLIB:
+        return zlib.compress(payload, level)
+    else:
+        return lzma.compress(payload, preset=level)
+
+def decompress(compression, payload):
+    if compression == ZLIB:
+        return zlib.decompress(payload)
+    else:
+        return lzma.decompress(payload)
+
+class MarketdataRecorder:
+    def __init__(self, config, name):
+        self.name = name
+        self.path = config.get("path", "recordings")
+        self.record_events = config.get("events", True)
+        self.record_frames = config.get("frames", False)
+        self.compression = COMPRESSIONS[config.get("compression", "zlib")]
+        self.level = config.get("level", 1)
+        self.chunk_size = config.get("chunk_size", 1 << 20)
+        self.flush_interval = config.get("flush_interval", 1.0)
+        self.rotate_interval = config.get("rotate_interval", 3600)
+        self.buffer_size = config.get("buffer_size", 1 << 16)
+
+        self.pending = collections.deque()
+        self.running = False
+        self.thread = None
+
+        ### Writer State ###
+        self.codec = EventCodec()
+        self.chunk = bytearray()
+        self.chunk_count = 0
+        self.chunk_first_ns = 0
+        self.chunk_last_ns = 0
+        self.chunk_start = 0.0
+        self.file = None
+        self.file_start = 0.0
+        # bumped after a failed write, which may have left a partial chunk at
+        # the end of the file, so the next chunk starts a new file
+        self.file_part = 0
+
+        ### Statistics ###
+        self.record_count = 0
+        self.dropped_count = 0
+        self.written_chunk_count = 0
+        self.written_bytes = 0
+
+    ### Interface ###
+
+    def attach(self, callbacks):
+        # records market data handed to callbacks, after it is forwarded so
+        # traces carry their gateway side stamps; frames are taken from every
+        # websocket client of this process
+        if self.record_frames:
+            set_frame_callback(self.record_frame)
+
+        if self.record_events:
+            on_marketdata_update = callbacks.on_marketdata_update
+
+            def record_and_forward(event):
+                wall_ns = time.time_ns()
+                monotonic_ns = time.monotonic_ns()
+                on_marketdata_update(event)
+                self.append((EVENT, wall_ns, monotonic_ns, self.name, event))
+
+            callbacks.on_marketdata_update = record_and_forward
+        return callbacks
+
+    def run(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.running = True
+        self.thread = threading.Thread(target=self.write_loop, name="MarketdataRecorder", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def get_statistics(self):
+        return {
+            "records": self.record_count,
+            "dropped": self.dropped_count,
+            "pending": len(self.pending),
+            "chunks": self.written_chunk_count,
+            "bytes": self.written_bytes
+        }
+
+    ### Producer Interface ###
+
+    def record_event(self, event):
+        self.append((EVENT, time.time_ns(), time.monotonic_ns(), self.name, event))
+
+    def record_frame(self, source, message):
+        kind = TEXT_FRAME if type(message) == str else BINARY_FRAME
+        self.append((kind, time.time_ns(), time.monotonic_ns(), source, message))
+
+    def append(self, record):
+        if len(self.pending) >= self.buffer_size:
+            self.dropped_count += 1
+            return
+        self.pending.append(record)
+        self.record_count += 1
+
+    ### Writer ###
+
+    def write_loop(self):
+        pending = self.pending
+        while self.running or pending:
+            if not pending:
+                if self.chunk_count and time.monotonic() - self.chunk_start >= self.flush_interval:
+                    self.write_chunk()
+                time.sleep(min(self.flush_interval, 0.05))
+                continue
+
+            while pending:
+                self.add_record(*pending.popleft())
+                if len(self.chunk) >= self.chunk_size:
+                    self.write_chunk()
+        if self.chunk_count:
+            self.write_chunk()
+        self.close_file()
+
+    def add_record(self, kind, wall_ns, monotonic_ns, source, data):
+        if kind == EVENT:
+            data = self.codec.encode(data)
+        elif kind == TEXT_FRAME:
+            data = data.encode()
+        source = source.encode()
+
+        if not self.chunk_count:
+            self.chunk_first_ns = wall_ns
+            self.chunk_start = time.monotonic()
+        self.chunk_last_ns = wall_ns
+        self.chunk_count += 1
+        self.chunk += RECORD_HEADER.pack(kind, wall_ns, monotonic_ns, len(source), len(data))
+        self.chunk += source
+        self.chunk += data
+
+    def write_chunk(self):
+        payload = compress(self.compression, bytes(self.chunk), self.level)
+        try:
+            file = self.get_file()
+            file.write(CHUNK_HEADER.pack(MAGIC, self.compression, len(payload), zlib.crc32(payload),
+                                         self.chunk_count, self.chunk_first_ns, self.chunk_last_ns))
+            file.write(payload)
+            file.flush()
+            self.written_chunk_count += 1
+            self.written_bytes += CHUNK_HEADER.size + len(payload)
+        except OSError as e:
+            print("MarketdataRecorder: write_chunk: Error", str(e))
+            self.dropped_count += self.chunk_count
+            self.close_file()
+            self.file_part += 1
+
+        self.chunk = bytearray()
+        self.chunk_count = 0
+        self.codec.reset()
+
+    def close_file(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError as e:
+                print("MarketdataRecorder: close_file: Error", str(e))
+            self.file = None
+
+    def get_file(self):
+        now = time.time()
+        if self.file is not None and now - self.file_start >= self.rotate_interval:
+            self.close_file()
+
+        if self.file is None:
+            file_start = now - now % self.rotate_interval
+            if file_start != self.file_start:
+                self.file_start = file_start
+                self.file_part = 0
+            timestamp = dt.datetime.fromtimestamp(self.file_start, dt.timezone.utc).strftime("%Y%m%d-%H%M%S")
+            # parts sort after the first file of the interval
+            part = f"_{self.file_part:03d}" if self.file_part else ""
+            self.file = open(os.path.join(self.path, f"{self.name}-{timestamp}{part}.sbmd"), "ab")
+        return self.file
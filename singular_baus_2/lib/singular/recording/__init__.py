@@ -0,0 +1,2 @@
+from .MarketdataRecorder import MarketdataRecorder
+from .MarketdataReader import MarketdataReader
\ No newline at end of file
@@ -0,0 +1,110 @@
+import time
+import datetime as dt
+
+from ...core import Account, Exchange, Instrument, OrderbookLevel, Side
+from ...event import (PlaceAck, PlaceReject, CancelAck, CancelReject, ModifyAck, Fill,
+                      TopOfBookUpdate, OrderbookSnapshot, OrderbookLevelUpdate,
+                      GatewayDisconnect)
+from ..dispatch import HandlerTable
+
+# Per-event routing cost of the type(event) == / type(event) in [...] chains
+# that MultiprocessingGateway.consume_all and PersistentOrder.handle_update
+# used, against HandlerTable.dispatch with the same handlers.
+# usage: python -m singular.utilities.benchmark.EventRouting
+
+def on_order_update(event):
+    pass
+
+def on_marketdata_update(event):
+    pass
+
+def on_gateway_update(event):
+    pass
+
+def route_consume_all_chain(event):
+    if type(event) in [PlaceAck,
+                       CancelAck,
+                       ModifyAck,
+                       PlaceReject,
+                       CancelReject,
+                       Fill]:
+        on_order_update(event)
+    elif type(event) in [OrderbookSnapshot,
+                         OrderbookLevelUpdate,
+                         TopOfBookUpdate]:
+        on_marketdata_update(event)
+    elif type(event) in [GatewayDisconnect]:
+        on_gateway_update(event)
+    else:
+        print("unhandled event type")
+
+def get_consume_all_table():
+    table = HandlerTable(lambda event: print("unhandled event type"))
+    table.register_all([PlaceAck, CancelAck, ModifyAck, PlaceReject, CancelReject, Fill],
+                       on_order_update)
+    table.register_all([OrderbookSnapshot, OrderbookLevelUpdate, TopOfBookUpdate],
+                       on_marketdata_update)
+    table.register(GatewayDisconnect, on_gateway_update)
+    return table
+
+def route_persistent_order_chain(update):
+    if type(update) == PlaceAck:
+        pass
+    elif type(update) == CancelAck or type(update) == PlaceReject:
+        pass
+    elif type(update) == CancelReject:
+        pass
+    elif type(update) == Fill:
+        pass
+    else:
+        pass
+
+def get_persistent_order_table():
+    def handle(update):
+        pass
+
+    table = HandlerTable()
+    table.register(PlaceAck, handle)
+    table.register_all([CancelAck, PlaceReject], handle)
+    table.register(CancelReject, handle)
+    table.register(Fill, handle)
+    return table
+
+def get_events():
+    account = Account(Exchange.BINANCEUSDM, "main")
+    instrument = Instrument(Exchange.BINANCEUSDM, "BTCUSDT", "BTCUSDT", "BTC", "USDT",
+                            0.1, 0.001, 0.001, 5, None)
+    return [
+        PlaceAck(1, account, instrument, Side.BUY, 29000.1, 0.01),
+        Fill(1690000000000, None, 1, account, instrument, Side.BUY, 29000.1, 0.01, 0.0, "USDT"),
+        CancelReject(1, "unknown order"),
+        TopOfBookUpdate(instrument, dt.datetime.now(),
+                        OrderbookLevel(instrument, Side.BUY, 29000.1, 1.5),
+                        OrderbookLevel(instrument, Side.SELL, 29000.2, 0.7)),
+        GatewayDisconnect(account),
+    ]
+
+def measure(route, event, count, repeat=5):
+    events = [event] * count
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for event in events:
+            route(event)
+        timings.append((time.perf_counter_ns() - start) / count)
+    return min(timings)
+
+def run(count=200000):
+    routing_points = [
+        ("consume_all", route_consume_all_chain, get_consume_all_table().dispatch),
+        ("PersistentOrder", route_persistent_order_chain, get_persistent_order_table().dispatch),
+    ]
+
+    print(f"{'routing point':<18}{'event':<20}{'chain ns':>10}{'table ns':>10}")
+    for name, chain, table in routing_points:
+        for event in get_events():
+            print(f"{name:<18}{type(event).__name__:<20}"
+                  f"{measure(chain, event, count):>10.0f}{measure(table, event, count):>10.0f}")
+
+if __name__ == "__main__":
+    run()
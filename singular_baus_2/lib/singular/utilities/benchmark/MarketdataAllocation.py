@@ -0,0 +1,79 @@
+import gc
+import sys
+import time
+import tracemalloc
+import datetime as dt
+
+from ...core import Account, Exchange, Instrument, OrderbookLevel, Side
+from ...event import TopOfBookUpdate, Trade, Fill, PlaceAck
+
+# Construction cost, memory per object and allocation rate of the objects the
+# market data path creates, for the slotted classes and for copies of them
+# built from the same constructor with a __dict__ (the previous layout).
+# usage: python -m singular.utilities.benchmark.MarketdataAllocation
+
+def get_unslotted(cls):
+    return type(cls.__name__, (), {"__init__": cls.__init__})
+
+def get_cases(level_type, top_of_book_type, trade_type, fill_type, place_ack_type):
+    account = Account(Exchange.BINANCEUSDM, "main")
+    instrument = Instrument(Exchange.BINANCEUSDM, "BTCUSDT", "BTCUSDT", "BTC", "USDT",
+                            0.1, 0.001, 0.001, 5, None)
+    now = dt.datetime.now()
+
+    return [
+        ("OrderbookLevel", 1,
+         lambda: level_type(instrument, Side.BUY, 29000.1, 1.5)),
+        ("TopOfBookUpdate + 2 levels", 3,
+         lambda: top_of_book_type(instrument, now,
+                                  level_type(instrument, Side.BUY, 29000.1, 1.5),
+                                  level_type(instrument, Side.SELL, 29000.2, 0.7))),
+        ("Trade", 1,
+         lambda: trade_type(instrument, Side.SELL, 29000.1, 0.01)),
+        ("Fill", 1,
+         lambda: fill_type(1690000000000, None, 42, account, instrument, Side.BUY,
+                           29000.1, 0.01, 0.0001, "USDT")),
+        ("PlaceAck", 1,
+         lambda: place_ack_type(42, account, instrument, Side.BUY, 29000.1, 0.01)),
+    ]
+
+def measure_construction(factory, count, repeat=5):
+    # best of repeat runs
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter_ns()
+        for _ in range(count):
+            factory()
+        timings.append((time.perf_counter_ns() - start) / count)
+    return min(timings)
+
+def measure_memory(factory, count):
+    gc.collect()
+    tracemalloc.start()
+    objects = [factory() for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - sys.getsizeof(objects)
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+def run(count=200000):
+    classes = (OrderbookLevel, TopOfBookUpdate, Trade, Fill, PlaceAck)
+    variants = [
+        ("dict", get_cases(*[get_unslotted(cls) for cls in classes])),
+        ("slots", get_cases(*classes)),
+    ]
+
+    print(f"{'case':<28}{'layout':<8}{'objects':>8}{'ns/event':>10}{'bytes/event':>13}"
+          f"{'events/s':>12}{'MB/s':>8}")
+    for index in range(len(variants[0][1])):
+        for layout, cases in variants:
+            name, objects, factory = cases[index]
+            construction_ns = measure_construction(factory, count)
+            size = measure_memory(factory, count)
+            rate = 1e9 / construction_ns
+            print(f"{name:<28}{layout:<8}{objects:>8}{construction_ns:>10.0f}{size:>13.0f}"
+                  f"{rate:>12.0f}{size * rate / 1e6:>8.0f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,31 @@
+# Routes events to handlers with one dict lookup on the exact event type,
+# replacing chains of type(event) == ... comparisons. Subclasses are not
+# matched, the same as the comparisons they replace.
+
+class HandlerTable:
+    def __init__(self, default=None):
+        self.handlers = {}
+        self.default = default
+
+    ### Interface ###
+
+    def register(self, event_type, handler):
+        self.handlers[event_type] = handler
+
+    def register_all(self, event_types, handler):
+        for event_type in event_types:
+            self.register(event_type, handler)
+
+    def unregister(self, event_type):
+        self.handlers.pop(event_type, None)
+
+    def has_handler(self, event_type):
+        return event_type in self.handlers
+
+    def get_handler(self, event_type):
+        return self.handlers.get(event_type, self.default)
+
+    def dispatch(self, event):
+        handler = self.handlers.get(type(event), self.default)
+        if handler is not None:
+            return handler(event)
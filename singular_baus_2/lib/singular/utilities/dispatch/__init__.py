@@ -0,0 +1 @@
+from .HandlerTable import HandlerTable
\ No newline at end of file
@@ -0,0 +1,81 @@
+
+# Log-linear histogram in the style of HdrHistogram: every power of two is
+# split into 8 sub-buckets, so any recorded value is resolved to within 12.5%
+# while the whole 64 bit range fits in a fixed 512 entry table.
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+BUCKET_COUNT = 64 * SUB_BUCKET_COUNT
+
+def get_bucket_index(value):
+    if value < 2 * SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKET_COUNT + (value >> shift) - SUB_BUCKET_COUNT
+
+def get_bucket_value(index):
+    if index < 2 * SUB_BUCKET_COUNT:
+        return index
+    shift = index // SUB_BUCKET_COUNT - 1
+    return (index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT) << shift
+
+class LatencyHistogram:
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    ### Interface ###
+
+    def get_name(self):
+        return self.name
+
+    def get_count(self):
+        return self.count
+
+    def get_max(self):
+        return self.max
+
+    def get_mean(self):
+        return self.total / self.count if self.count else 0
+
+    def get_percentile(self, percentile):
+        if self.count == 0:
+            return 0
+        threshold = self.count * percentile / 100
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if count and running >= threshold:
+                return min(get_bucket_value(index), self.max)
+        return self.max
+
+    def get_summary(self, unit=1000):
+        # unit=1000 reports nanosecond samples in microseconds
+        return (f"{self.name}: count={self.count} "
+                f"mean={self.get_mean() / unit:.1f} "
+                f"p50={self.get_percentile(50) / unit:.1f} "
+                f"p90={self.get_percentile(90) / unit:.1f} "
+                f"p99={self.get_percentile(99) / unit:.1f} "
+                f"p99.9={self.get_percentile(99.9) / unit:.1f} "
+                f"max={self.max / unit:.1f}")
+
+    def record(self, value):
+        value = int(value) if value > 0 else 0
+        self.counts[get_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
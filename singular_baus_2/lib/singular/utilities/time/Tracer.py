@@ -0,0 +1,117 @@
+import time
+
+from .LatencyHistogram import LatencyHistogram
+
+# Tick-to-trade tracing. A traced market data event carries a list of
+# time.monotonic_ns() stamps, one per stage, 0 for stages not reached:
+#
+#   receive   websocket frame returned by recv in the gateway process
+#   parse     event handed to the gateway callbacks
+#   enqueue   event handed to the transport to the main process
+#   dequeue   event taken off the transport in the main process
+#   handle    first update of a strategy the event was for
+#   send      order from that update handed to the gateway in its process
+#
+# CLOCK_MONOTONIC is system wide, so stamps from the gateway and main
+# processes compare directly. Every process has its own tracer; gateway
+# processes are forked and inherit whether tracing is enabled. When disabled
+# the only costs are None traces on events and a few flag checks.
+
+RECEIVE = 0
+PARSE = 1
+ENQUEUE = 2
+DEQUEUE = 3
+HANDLE = 4
+SEND = 5
+
+STAGES = ["receive", "parse", "enqueue", "dequeue", "handle", "send"]
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.receive_ns = 0
+        # trace of the tick the running strategy update handles, orders it
+        # places are attributed to it; None outside such an update
+        self.current = None
+
+        self.stage_histograms = [LatencyHistogram(f"{STAGES[stage - 1]}_to_{STAGES[stage]}_us")
+                                 for stage in range(1, len(STAGES))]
+        self.tick_to_trade_histogram = LatencyHistogram("tick_to_trade_us")
+
+    ### Interface ###
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.current = None
+
+    def is_enabled(self):
+        return self.enabled
+
+    def get_histograms(self):
+        return self.stage_histograms + [self.tick_to_trade_histogram]
+
+    def get_summary(self):
+        return [histogram.get_summary() for histogram in self.get_histograms()
+                if histogram.get_count()]
+
+    def report(self, prefix="Tracer:"):
+        for summary in self.get_summary():
+            print(prefix, summary)
+
+    def reset(self):
+        for histogram in self.get_histograms():
+            histogram.reset()
+
+    ### Stage Interface ###
+
+    def mark_receive(self):
+        self.receive_ns = time.monotonic_ns()
+
+    def end_receive(self):
+        # events started after the frame is handled (REST responses, other
+        # sessions) did not come from it and start at parse
+        self.receive_ns = 0
+
+    def start(self):
+        now = time.monotonic_ns()
+        return [self.receive_ns if self.receive_ns else now, now, 0, 0, 0, 0]
+
+    def mark_enqueue(self, trace):
+        trace[ENQUEUE] = time.monotonic_ns()
+
+    def mark_dequeue(self, trace):
+        trace[DEQUEUE] = time.monotonic_ns()
+        self.record(trace, RECEIVE, DEQUEUE)
+
+    def mark_handle(self, trace):
+        # start of a strategy update for the tick of trace (None for updates
+        # woken by anything else), ended by end_handle
+        self.current = trace
+        if trace is not None and trace[HANDLE] == 0:
+            trace[HANDLE] = time.monotonic_ns()
+            self.record(trace, DEQUEUE, HANDLE)
+
+    def end_handle(self):
+        self.current = None
+
+    def get_order_trace(self):
+        # copied so later stamps on the tick do not leak into the order
+        if self.current is None:
+            return None
+        return list(self.current)
+
+    def mark_send(self, trace):
+        trace[SEND] = time.monotonic_ns()
+        self.record(trace, HANDLE, SEND)
+        if trace[RECEIVE]:
+            self.tick_to_trade_histogram.record(trace[SEND] - trace[RECEIVE])
+
+    def record(self, trace, first_stage, last_stage):
+        for stage in range(first_stage + 1, last_stage + 1):
+            if trace[stage - 1] and trace[stage]:
+                self.stage_histograms[stage - 1].record(trace[stage] - trace[stage - 1])
+
+tracer = Tracer()
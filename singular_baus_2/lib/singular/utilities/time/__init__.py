@@ -0,0 +1,2 @@
+from .LatencyHistogram import LatencyHistogram
+from .Tracer import Tracer, tracer
\ No newline at end of file
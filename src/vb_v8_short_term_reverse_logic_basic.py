@@ -11,6 +11,11 @@
 # In[284]:
 
 
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numba
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -35,6 +40,16 @@ config = {
     "data": {
         "vbar_file": '../hist_data/vb/volume_bar_btcusdt_20220101_20230630_3880.csv',
         #"vbar_file": '../hist_data/vb/volume_bar_btcusdt_20210101_20211231_3880.csv',
+        # load the bars from the Parquet store of the bar builders instead of vbar_file,
+        # only the dates in range are read (see bar_store.py)
+        "vbar_store": None,
+        #"vbar_store": {"root": '../hist_data/store', "symbol": "BTCUSDT", "bar_size": 3880},
+        # the derived bar columns of load_data are cached here and reused while the bars, the
+        # range, the split and the code of read_data/load_data stay the same (see feature_cache.py,
+        # in files/ like bar_store.py, so it has to be on the python path), None to derive them
+        # on every run
+        "feature_cache": None,
+        #"feature_cache": '../hist_data/features',
         "split_cnt": 1,  # 1 means no split
         "use_range_filter": True,
         "start_date": "2022-01-01", 
@@ -44,6 +59,16 @@ config = {
         "show_plots": False,
         "save_plots": True,
     },
+    # --evaluate: walk_forward/anchored test windows of test_days after train_days (all days
+    # before, anchored) of bars, or kfold with folds equal parts
+    "evaluation": {
+        "train_days": 120,
+        "test_days": 60,
+        "folds": 4,
+    },
+    # processes evaluating the models (or the model runs of --evaluate), None: one per model
+    # up to the CPU count (at most 8)
+    "workers": None,
     "verbose": False
 }
 
@@ -77,10 +102,8 @@ def max_drawdown(return_series):
 # In[287]:
 
 
-df_vb = None
-df_order = None
-df_full_vb = None
-df_full_order = None
+# the bars of every split with their signals, set in the worker processes of run_models
+split_vbs = None
 
 def get_model_str(model):
     short_key_map={
@@ -90,14 +113,20 @@ def get_model_str(model):
 
     return "".join(["_" + short_key_map[key] + "_" + str(model[key]) if short_key_map[key] is not None else "" for key in model])
 
-def load_data(split_idx, model):
-    global df_vb
-    
-    #in sample
-    df_vb = pd.read_csv(config['data']['vbar_file'])
+def read_data():
+    # the bars of all splits and models, read once
+    d_store = config['data'].get('vbar_store')
+    if d_store is not None:
+        from bar_store import load_bars
+        b_range = config['data']['use_range_filter']
+        df_bars = load_bars(d_store['root'], 'vb', d_store['symbol'], d_store['bar_size'],
+                            config['data']['start_date'] if b_range else None,
+                            config['data']['end_date'] if b_range else None)
+    else:
+        df_bars = pd.read_csv(config['data']['vbar_file'])
 
     # Convert timestamp to datetime type
-    df_vb['ts_local'] = pd.to_datetime(df_vb['localTimestamp'])
+    df_bars['ts_local'] = pd.to_datetime(df_bars['localTimestamp'])
     
     # If range filter is used, limit data to the range
     if config['data']['use_range_filter']:
@@ -105,14 +134,17 @@ def load_data(split_idx, model):
         end_date = pd.to_datetime(config['data']['end_date'])
    
         print(f"Using date in range [{start_date}, {end_date})")
-        df_vb = df_vb[df_vb['ts_local'] >= start_date]
-        df_vb = df_vb[df_vb['ts_local'] < end_date]
-        
-       
-    data_len = len(df_vb) 
-    split_cnt = config['data']['split_cnt']
+        df_bars = df_bars[df_bars['ts_local'] >= start_date]
+        df_bars = df_bars[df_bars['ts_local'] < end_date]
+    return df_bars
+
+def load_data(df_bars, split_idx, split_cnt=None):
+    #in sample
+    data_len = len(df_bars) 
+    if split_cnt is None:
+        split_cnt = config['data']['split_cnt']
     split_len = data_len // split_cnt
-    df_vb = df_vb[split_idx * split_len: (split_idx+1) * split_len]
+    df_vb = df_bars[split_idx * split_len: (split_idx+1) * split_len].copy()
     
 
     #df_vb.set_index('ts_local')
@@ -153,13 +185,38 @@ def load_data(split_idx, model):
         pd.set_option('display.max_rows', 20)
         print(df_vb)
         len(df_vb)
+    return df_vb
+
+def get_source_files():
+    d_store = config['data'].get('vbar_store')
+    if d_store is None:
+        return [config['data']['vbar_file']]
+    from bar_store import get_bar_files
+    b_range = config['data']['use_range_filter']
+    return get_bar_files(d_store['root'], 'vb', d_store['symbol'], d_store['bar_size'],
+                         config['data']['start_date'] if b_range else None,
+                         config['data']['end_date'] if b_range else None)
+
+def get_features(split_idx, f_bars, split_cnt=None):
+    # load_data of a split, from the feature cache if it is there; f_bars() returns read_data()
+    if split_cnt is None:
+        split_cnt = config['data']['split_cnt']
+    s_cache_dir = config['data'].get('feature_cache')
+    if s_cache_dir is None:
+        return load_data(f_bars(), split_idx, split_cnt)
+    from feature_cache import load_features
+    d_params = {key: config['data'].get(key) for key in ['vbar_file', 'vbar_store', 'use_range_filter',
+                                                         'start_date', 'end_date']}
+    d_params.update(split_cnt=split_cnt, split_idx=split_idx)
+    return load_features(s_cache_dir, get_source_files(), [read_data, load_data], d_params,
+                         lambda: load_data(f_bars(), split_idx, split_cnt))
 
 # ### Generate the VB signals
 
 # In[289]:
 
-#@numba.njit
-def process_orders(b, ts_close, model):
+# the original per-bar loop, process_orders must give the same orders (see check_process_orders)
+def process_orders_reference(b, ts_close, model):
     n = len(b)
     
     entry_id = 1
@@ -442,9 +499,279 @@ def process_orders(b, ts_close, model):
             
     return ret
 
-def calculate_signal(model):
-    global df_vb
-    global df_order
+# an order row of process_orders_kernel, ts_* are bar indexes (-1 for none) and
+# entry_exit_type/exit_condition codes into ENTRY_EXIT_TYPES/EXIT_CONDITIONS
+ORDER_DTYPE = np.dtype([('bar_seq', np.int64), ('entry_id', np.int64), ('order_side', np.float64),
+                        ('entry_exit_type', np.int8), ('entry_price', np.float64), ('exit_price', np.float64),
+                        ('target_tp_px', np.float64), ('target_sl_px', np.float64), ('ts_entry', np.int64),
+                        ('ts_exit', np.int64), ('ts_close', np.int64), ('qty', np.float64),
+                        ('exit_condition', np.int8), ('tp6_greater', np.bool_), ('tp6_aggr_more_buy', np.bool_),
+                        ('bwd6_open', np.float64), ('bwd7_open', np.float64), ('bwd8_open', np.float64)])
+
+ENTRY_ORDER = 0
+TAKE_PROFIT = 1
+STOP_LOSS = 2
+
+NO_CONDITION = 0
+STOPLOSS_REVERSE = 1
+
+EXIT_CONDITIONS = [None, "stoploss reverse"]
+# [entry_exit_type][exit_condition]
+ENTRY_EXIT_TYPES = [['entry order'] * 2, ['take profit'] * 2,
+                    [f'condition: {exit_condition}: basic stop loss' for exit_condition in EXIT_CONDITIONS]]
+
+
+@numba.njit(cache=True)
+def py_min(x, y):
+    # min(x, y) of python: x unless y is smaller
+    return y if y < x else x
+
+
+@numba.njit(cache=True)
+def py_max(x, y):
+    return y if y > x else x
+
+
+@numba.njit(cache=True)
+def set_order_row(o_rows, k, bar_seq, entry_id, side, entry_exit_type, entry_price, exit_price, target_tp_px,
+                  target_sl_px, i_entry, i_exit, i, qty, exit_condition, tp6_greater, tp6_aggr_more_buy,
+                  bwd6_open, bwd7_open, bwd8_open):
+    o_row = o_rows[k]
+    o_row.bar_seq = bar_seq
+    o_row.entry_id = entry_id
+    o_row.order_side = side
+    o_row.entry_exit_type = entry_exit_type
+    o_row.entry_price = entry_price
+    o_row.exit_price = exit_price
+    o_row.target_tp_px = target_tp_px
+    o_row.target_sl_px = target_sl_px
+    o_row.ts_entry = i_entry
+    o_row.ts_exit = i_exit
+    o_row.ts_close = i
+    o_row.qty = qty
+    o_row.exit_condition = exit_condition
+    o_row.tp6_greater = tp6_greater
+    o_row.tp6_aggr_more_buy = tp6_aggr_more_buy
+    o_row.bwd6_open = bwd6_open
+    o_row.bwd7_open = bwd7_open
+    o_row.bwd8_open = bwd8_open
+
+
+@numba.njit(cache=True)
+def process_orders_kernel(a_signal, a_close, a_tp6, a_tp30, a_tp6_aggr, a_open, a_high, a_low, a_bwd6_open,
+                          a_bwd7_open, a_bwd8_open, b_implementation_1a, sl_multiples, b_abs_tp6_tp30_cmp,
+                          b_tp_sl_cap, b_stop_loss_after_3_bars, o_rows):
+    '''
+    process_orders_reference step for step, writing the orders into o_rows (ORDER_DTYPE, room for
+    every order) and returning their count. tp6_greater/tp6_aggr_more_buy are carried like the
+    variables of the reference, so a stop loss row gets the values of the last pending order
+    looked at for take profit.
+    '''
+    n = len(a_signal)
+    a_pending = np.empty(len(o_rows), np.int64)
+    i_pending = 0
+    a_reverse = np.empty((len(o_rows), 3))
+    k = 0
+    entry_id = 1
+    tp6_greater = False
+    tp6_aggr_more_buy = False
+
+    for i in range(8, n):
+        current_price = a_close[i]
+        open_px = a_open[i]
+        high = a_high[i]
+        low = a_low[i]
+        bwd6_open = a_bwd6_open[i]
+        bwd7_open = a_bwd7_open[i]
+        bwd8_open = a_bwd8_open[i]
+        bar_seq = i + 1
+
+        # take profit
+        for po_idx in range(i_pending):
+            row_idx = a_pending[po_idx]
+            o_row = o_rows[row_idx]
+            tp6_greater = o_row.tp6_greater
+            tp6_aggr_more_buy = o_row.tp6_aggr_more_buy
+            side = o_row.order_side
+            tp_px = o_row.target_tp_px
+            if (side == 1 and high >= tp_px) or (side == -1 and low <= tp_px):
+                set_order_row(o_rows, k, bar_seq, o_row.entry_id, -side, TAKE_PROFIT, o_row.entry_price, tp_px,
+                              np.nan, np.nan, o_row.ts_close, i, i, 1.0, o_row.exit_condition, tp6_greater,
+                              tp6_aggr_more_buy, bwd6_open, bwd7_open, bwd8_open)
+                k += 1
+                a_pending[po_idx] = -1
+
+        # exit by stop loss
+        i_reverse = 0
+        for po_idx in range(i_pending):
+            row_idx = a_pending[po_idx]
+            if row_idx < 0:
+                continue
+            o_row = o_rows[row_idx]
+            side = o_row.order_side
+            sl_px = o_row.target_sl_px
+            if b_stop_loss_after_3_bars:
+                if bar_seq <= o_row.bar_seq + 1:
+                    continue
+                if -side == 1:
+                    if open_px > sl_px:
+                        sl_px = open_px
+                else:
+                    if open_px < sl_px:
+                        sl_px = open_px
+
+            if (side == 1 and low < sl_px) or (side == -1 and high > sl_px):
+                set_order_row(o_rows, k, bar_seq, o_row.entry_id, -side, STOP_LOSS, o_row.entry_price, sl_px,
+                              np.nan, np.nan, o_row.ts_close, i, i, o_row.qty, o_row.exit_condition, tp6_greater,
+                              tp6_aggr_more_buy, bwd6_open, bwd7_open, bwd8_open)
+                k += 1
+                a_pending[po_idx] = -1
+                if o_row.exit_condition != STOPLOSS_REVERSE:
+                    a_reverse[i_reverse, 0] = -side
+                    a_reverse[i_reverse, 1] = sl_px
+                    a_reverse[i_reverse, 2] = abs(sl_px - o_row.entry_price)
+                    i_reverse += 1
+
+        i_kept = 0
+        for po_idx in range(i_pending):
+            if a_pending[po_idx] >= 0:
+                a_pending[i_kept] = a_pending[po_idx]
+                i_kept += 1
+        i_pending = i_kept
+
+        if b_abs_tp6_tp30_cmp:
+            bar_tp6_greater = abs(a_tp6[i]) > abs(a_tp30[i])
+        else:
+            bar_tp6_greater = a_tp6[i] > a_tp30[i]
+        bar_tp6_aggr_more_buy = a_tp6_aggr[i] > 0
+
+        # book stop loss/reverse order
+        for i_order in range(i_reverse):
+            side = a_reverse[i_order, 0]
+            entry_price = a_reverse[i_order, 1]
+            tp_amount = a_reverse[i_order, 2]
+            tp6_greater = bar_tp6_greater
+            tp6_aggr_more_buy = bar_tp6_aggr_more_buy
+
+            target_tp_px = entry_price + side * tp_amount
+            target_sl_px = entry_price - side * tp_amount
+            # (the sell side caps are on the bar close, as in the reference)
+            if side == 1:
+                if b_tp_sl_cap:
+                    target_tp_px = py_min(target_tp_px, entry_price * (1 + 0.0025))
+                    target_sl_px = py_max(target_sl_px, entry_price * (1 - 0.0030 * sl_multiples))
+                target_tp_px = py_max(target_tp_px, entry_price * (1 + 0.0020))
+                target_sl_px = py_min(target_sl_px, entry_price * (1 - 0.0010 * sl_multiples))
+            else:
+                if b_tp_sl_cap:
+                    target_tp_px = py_max(target_tp_px, current_price * (1 - 0.0025))
+                    target_sl_px = py_min(target_sl_px, current_price * (1 + 0.0030 * sl_multiples))
+                target_tp_px = py_min(target_tp_px, current_price * (1 - 0.0020))
+                target_sl_px = py_max(target_sl_px, current_price * (1 + 0.0010 * sl_multiples))
+
+            set_order_row(o_rows, k, bar_seq, entry_id, side, ENTRY_ORDER, entry_price, np.nan, target_tp_px,
+                          target_sl_px, i, -1, i, 1.0, STOPLOSS_REVERSE, tp6_greater, tp6_aggr_more_buy,
+                          bwd6_open, bwd7_open, bwd8_open)
+            entry_id += 1
+            a_pending[i_pending] = k
+            i_pending += 1
+            k += 1
+
+        # book entry order
+        side = a_signal[i]
+        if side != 0:
+            X_tp = abs(current_price - open_px)
+            Y_tp = X_tp / 2
+            if side == 1:
+                X_sl = current_price - low
+                if b_implementation_1a:
+                    target_tp_px = current_price + Y_tp
+                else:
+                    target_tp_px = current_price + X_tp
+                target_sl_px = py_min(low, current_price - X_sl * sl_multiples)
+                if b_tp_sl_cap:
+                    target_tp_px = py_min(target_tp_px, current_price * (1 + 0.0025))
+                    target_sl_px = py_max(target_sl_px, current_price * (1 - 0.0030 * sl_multiples))
+                target_tp_px = py_max(target_tp_px, current_price * (1 + 0.0020))
+                target_sl_px = py_min(target_sl_px, current_price * (1 - 0.0010 * sl_multiples))
+            else:
+                X_sl = high - current_price
+                if b_implementation_1a:
+                    target_tp_px = current_price - Y_tp
+                else:
+                    target_tp_px = current_price - X_tp
+                target_sl_px = py_max(high, current_price + X_sl * sl_multiples)
+                if b_tp_sl_cap:
+                    target_tp_px = py_max(target_tp_px, current_price * (1 - 0.0025))
+                    target_sl_px = py_min(target_sl_px, current_price * (1 + 0.0030 * sl_multiples))
+                target_tp_px = py_min(target_tp_px, current_price * (1 - 0.0020))
+                target_sl_px = py_max(target_sl_px, current_price * (1 + 0.0010 * sl_multiples))
+
+            tp6_greater = bar_tp6_greater
+            tp6_aggr_more_buy = bar_tp6_aggr_more_buy
+            set_order_row(o_rows, k, bar_seq, entry_id, side, ENTRY_ORDER, current_price, np.nan, target_tp_px,
+                          target_sl_px, i, -1, i, 1.0, NO_CONDITION, tp6_greater, tp6_aggr_more_buy,
+                          bwd6_open, bwd7_open, bwd8_open)
+            entry_id += 1
+            a_pending[i_pending] = k
+            i_pending += 1
+            k += 1
+
+    return k
+
+
+def get_order_frame_columns(o_orders, b, ts_close):
+    # the columns pd.DataFrame makes of the lists of process_orders_reference
+    d_columns = {s_name: o_orders[s_name] for s_name in ORDER_DTYPE.names}
+
+    # the side is the signal as is (int or float)
+    d_columns['order_side'] = o_orders['order_side'].astype(np.array(b[:1, 0].tolist()).dtype)
+    a_exit_condition = o_orders['exit_condition'].astype(np.intp)
+    d_columns['entry_exit_type'] = np.array(ENTRY_EXIT_TYPES, dtype=object)[o_orders['entry_exit_type'].astype(np.intp),
+                                                                             a_exit_condition]
+    d_columns['exit_condition'] = np.array(EXIT_CONDITIONS, dtype=object)[a_exit_condition]
+
+    a_ts_close = np.asarray(ts_close)
+    a_is_exit = o_orders['ts_exit'] >= 0
+    for s_name in ['ts_entry', 'ts_close']:
+        d_columns[s_name] = a_ts_close[o_orders[s_name]]
+    # a column of None only (no exit yet) stays object
+    if a_is_exit.any():
+        d_columns['ts_exit'] = a_ts_close[o_orders['ts_exit']]
+        d_columns['ts_exit'][~a_is_exit] = np.datetime64('NaT')
+    else:
+        d_columns['exit_price'] = np.full(len(o_orders), None, dtype=object)
+        d_columns['ts_exit'] = np.full(len(o_orders), None, dtype=object)
+
+    # the reference overwrites its duration_ratio list with the value of the bar of the last order
+    d_columns['duration_ratio'] = b[o_orders['ts_close'][-1], 12]
+    return d_columns
+
+
+def process_orders(b, ts_close, model):
+    '''
+    The orders of process_orders_reference, computed by process_orders_kernel: same columns,
+    values and dtypes once made a DataFrame. b is the 13 columns of the reference (signal, close,
+    tp6, tp30, tp6_aggr, open, high, low, vol_imb, bwd6_open, bwd7_open, bwd8_open, duration_ratio).
+    '''
+    implementation = model["implementation"]
+    if implementation not in ("1a", "1b"):
+        raise ValueError(f"unknown implementation {implementation}")
+
+    la_columns = [np.asarray(b[:, i_col], dtype=np.float64) for i_col in (0, 1, 2, 3, 4, 5, 6, 7, 9, 10, 11)]
+    # every signal opens an order and may get a reverse one, every order exits once
+    i_rows = 4 * int(np.count_nonzero(la_columns[0][8:]))
+    o_rows = np.empty(i_rows, dtype=ORDER_DTYPE)
+    k = process_orders_kernel(*la_columns, implementation == "1a", float(model["sl_multiples"]),
+                              use_abs_tp6_tp30_cmp_for_category, enable_tp_sl_cap, stop_loss_start_after_3_bars,
+                              o_rows)
+    if k == 0:
+        return {s_name: [] for s_name in ORDER_DTYPE.names + ('duration_ratio',)}
+    return get_order_frame_columns(o_rows[:k], b, ts_close)
+
+
+def calculate_signal(df_vb):
+    # the signals do not depend on the model, only the orders do
     df_vb['signal'] = 0
     
     #mean reversion only
@@ -501,18 +828,26 @@ def calculate_signal(model):
     else:
         df_vb['tp6_greater'] = df_vb['tp6'] > df_vb['tp30']
     df_vb['tp6_aggr_more_buy'] = df_vb['tp6_aggr'] > 0
-    
-    df_order = pd.DataFrame(process_orders(df_vb[['signal', 'close', 'tp6', 'tp30', 'tp6_aggr','open','high','low', 'vol_imb', 'bwd6_open', 'bwd7_open', 'bwd8_open', 'duration_ratio']].to_numpy(), df_vb['ts_close'].to_numpy(), model))
+
+def get_order_inputs(df_vb):
+    # the b and ts_close of process_orders
+    return (df_vb[['signal', 'close', 'tp6', 'tp30', 'tp6_aggr','open','high','low', 'vol_imb', 'bwd6_open', 'bwd7_open', 'bwd8_open', 'duration_ratio']].to_numpy(), df_vb['ts_close'].to_numpy())
+
+def calculate_orders(df_vb, model):
+    return get_orders(*get_order_inputs(df_vb), model)
+
+def get_orders(b, ts_close, model):
+    df_order = pd.DataFrame(process_orders(b, ts_close, model))
     
     df_order['bwd8_open-bwd6_open'] = df_order['bwd8_open'] - df_order['bwd6_open'] 
     df_order['bwd7_open-bwd6_open'] = df_order['bwd7_open'] - df_order['bwd6_open'] 
     df_order['bwd6_open-entry_price'] = df_order['bwd6_open'] - df_order['entry_price'] 
+    return df_order
 
 # In[291]:
 
 
-def calculate_return(model):
-    global df_order
+def calculate_return(df_order):
     # the market returns during the execution of the strategy.
     
     taker_rate = config['common']['taker_rate']
@@ -526,10 +861,7 @@ def calculate_return(model):
 # In[ ]:
 # ### Plot the cumulative returns of the strategy
 
-def plot_cumulative_return(model):
-    global df_full_order
-    global df_full_vb
-
+def plot_cumulative_return(model, df_full_order, df_full_vb):
     if config['plots']['show_plots'] or config['plots']['save_plots']:
         plt.figure(figsize=(10, 7))
         
@@ -569,102 +901,419 @@ def get_monthly_risk_free_return():
     return ((1+3.1975/100)**(1/12))-1
 
 
+# In[ ]:
+# ### Golden check and benchmark of process_orders against process_orders_reference
+#     python vb_v8_short_term_reverse_logic_basic.py --check
+#     python vb_v8_short_term_reverse_logic_basic.py --benchmark [bars]
+
+def get_synthetic_order_inputs(n, signal_rate, seed):
+    # bars like load_data's, random signals, as calculate_signal passes them to process_orders
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'ts_close': pd.Timestamp('2022-01-01') + pd.to_timedelta(np.cumsum(rng.integers(1, 600, n)), unit='s')})
+    df['close'] = 20000 * np.exp(np.cumsum(rng.normal(0, 0.003, n)))
+    df['open'] = df['close'].shift(1).fillna(20000) * np.exp(rng.normal(0, 0.0005, n))
+    df['high'] = np.maximum(df['open'], df['close']) * np.exp(np.abs(rng.normal(0, 0.002, n)))
+    df['low'] = np.minimum(df['open'], df['close']) * np.exp(-np.abs(rng.normal(0, 0.002, n)))
+    df['vol_imb'] = rng.normal(0, 100, n)
+    df['tp6_aggr'] = df['vol_imb'].rolling(6).sum()
+    for i_shift in (6, 7, 8):
+        df[f'bwd{i_shift}_open'] = df['open'].shift(i_shift)
+    df['tp6'] = df['close'] - df['bwd6_open']
+    df['tp30'] = df['close'] - df['open'].shift(30)
+    df['duration_ratio'] = rng.random(n) < 0.05
+    df['signal'] = np.where(rng.random(n) < signal_rate, rng.choice([-1, 1], n), 0)
+    b = df[['signal', 'close', 'tp6', 'tp30', 'tp6_aggr', 'open', 'high', 'low', 'vol_imb', 'bwd6_open', 'bwd7_open',
+            'bwd8_open', 'duration_ratio']].to_numpy()
+    return b, df['ts_close'].to_numpy()
+
+
+def check_process_orders(n=5000):
+    global use_abs_tp6_tp30_cmp_for_category, enable_tp_sl_cap, stop_loss_start_after_3_bars
+    ta_flags = (use_abs_tp6_tp30_cmp_for_category, enable_tp_sl_cap, stop_loss_start_after_3_bars)
+    check_models = [{'implementation': implementation, 'sl_multiples': sl_multiples}
+                    for implementation in ['1a', '1b'] for sl_multiples in [0.1, 0.3, 0.8, 2]]
+    try:
+        for seed, signal_rate in [(0, 0.0), (1, 0.05), (2, 0.3), (3, 1.0)]:
+            b, ts_close = get_synthetic_order_inputs(n, signal_rate, seed)
+            for use_abs_tp6_tp30_cmp_for_category in (False, True):
+                for enable_tp_sl_cap in (False, True):
+                    for stop_loss_start_after_3_bars in (False, True):
+                        for check_model in check_models:
+                            df_reference = pd.DataFrame(process_orders_reference(b, ts_close, check_model))
+                            pd.testing.assert_frame_equal(pd.DataFrame(process_orders(b, ts_close, check_model)),
+                                                          df_reference, check_exact=True)
+            print(f"signal rate {signal_rate}: {len(df_reference)} orders, same as the reference")
+    finally:
+        use_abs_tp6_tp30_cmp_for_category, enable_tp_sl_cap, stop_loss_start_after_3_bars = ta_flags
+
+    # and the configured data, if it is here
+    if config['data'].get('vbar_store') is None and not os.path.exists(config['data']['vbar_file']):
+        print(f"{config['data']['vbar_file']} not found, only synthetic bars checked")
+        return
+    df_vb = load_data(read_data(), 0)
+    calculate_signal(df_vb)
+    b, ts_close = get_order_inputs(df_vb)
+    for check_model in models:
+        df_reference = pd.DataFrame(process_orders_reference(b, ts_close, check_model))
+        pd.testing.assert_frame_equal(pd.DataFrame(process_orders(b, ts_close, check_model)),
+                                      df_reference, check_exact=True)
+        print(f"model={check_model}: {len(df_reference)} orders, same as the reference")
+
+
+def benchmark_process_orders(n=200000, signal_rate=0.05):
+    b, ts_close = get_synthetic_order_inputs(n, signal_rate, 0)
+    bench_model = {'implementation': '1a', 'sl_multiples': 0.3}
+    process_orders(b[:100], ts_close[:100], bench_model)  # compile
+    for s_name, f_process in (('reference', process_orders_reference), ('kernel', process_orders)):
+        f_time = time.perf_counter()
+        df = pd.DataFrame(f_process(b, ts_close, bench_model))
+        f_time = time.perf_counter() - f_time
+        print(f"{s_name}: {n} bars, {len(df)} orders in {f_time:.3f}s ({n / f_time:,.0f} bars/s)")
+
+
 # In[294]:
 
+def get_order_metrics(df_full_order, date_ranges, daily=False):
+    # the summary metrics of the orders over the days of date_ranges, [(start, end)] with both ends included;
+    # sharpe and sortino of the daily returns when daily (a split is too few months), else of the monthly
+    all_dates=pd.concat([pd.DataFrame(pd.date_range(start=start_date, end=end_date), columns=["date"])
+                         for start_date, end_date in date_ranges], ignore_index=True).drop_duplicates()
+    all_dates['month'] = all_dates['date'].dt.year * 100 + all_dates['date'].dt.month
+    
+    all_dates['date'] = pd.to_datetime(all_dates['date']).dt.date
+    df_full_order = df_full_order.assign(date=pd.to_datetime(df_full_order['ts_close']).dt.date)
 
-model={}
+    df_full_trades = df_full_order[df_full_order.entry_exit_type != 'entry order']
 
-models = [{
-          'implementation': implementation,
-          "sl_multiples": sl_multiples
-          }
-          for implementation in config['model']['implementation']
-          for sl_multiples in config['model']['sl_multiples']
-        ]
+    merged_left = pd.merge(left=all_dates, right=df_full_trades, how='left', left_on='date',right_on='date')
+    merged_left['return'] = merged_left['return'].fillna(0)
+    
+    daily_df = merged_left[["date", "return"]].groupby("date", group_keys=True).sum()
+    
+    monthly_df = merged_left[["month", "return"]].groupby("month", group_keys=True).sum()
+    
+    if daily:
+        rf = get_daily_risk_free_return()
+        sharpe = sharpe_ratio(daily_df['return'], 365, rf)
+        sortino = sortino_ratio(daily_df['return'], 365, rf)
+    else:
+        rf_montly = get_monthly_risk_free_return()
+        sharpe = sharpe_ratio(monthly_df['return'], 12, rf_montly)    
+        sortino = sortino_ratio(monthly_df['return'], 12, rf_montly)
+    max_dd = max_drawdown(daily_df['return'])    
+    
+    #daily_df.to_csv("daily_return_vb_v6_3880_%s.csv" % get_model_str(model), index=False) 
 
-summary_items = []
 
-for model in models:
-    #for option in (False, True):
-    for option in (False,):
-        print(f"model={model}")
-        df_full_order = pd.DataFrame()
-        df_full_vb = pd.DataFrame()
+    total_dollar_pnl = df_full_trades["dollar_return"].sum()
+    
+    df_trades_by_entry = df_full_trades[["entry_id", "return"]].groupby("entry_id", group_keys=True).sum()
+    
+    win_trades = len(df_trades_by_entry[df_trades_by_entry["return"]>0])        
+    loss_trades = len(df_trades_by_entry[df_trades_by_entry["return"]<0])
+    
+    #df_trades_by_entry.to_csv("trade_by_entry_vb_v6_3880_%s.csv" % get_model_str(model), index=False)
 
-        for split_idx in range(config['data']['split_cnt']):
-            load_data(split_idx, model)
-            calculate_signal(model)
-            calculate_return(model)
+    return {"win_trades": win_trades, "loss_trades": loss_trades, "total_dollar_pnl": total_dollar_pnl,
+            "sharpe": sharpe, "sortino": sortino, "max_dd": max_dd}
 
-            df_full_order = pd.concat([df_full_order, df_order], ignore_index=True)
-            df_full_vb = pd.concat([df_full_vb, df_vb], ignore_index=True)
 
-        start_date = config["data"]["start_date"]
-        end_date = config["data"]["end_date"]
-        all_dates=pd.DataFrame(pd.date_range(start=start_date, end=end_date), columns=["date"])
-        all_dates['month'] = all_dates['date'].dt.year * 100 + all_dates['date'].dt.month
-        
-        all_dates['date'] = pd.to_datetime(all_dates['date']).dt.date
-        df_full_order['date'] = pd.to_datetime(df_full_order['ts_close']).dt.date
+def evaluate_model(model, ls_split_vb):
+    # the summary row of a model over the splits, writes its order and signal files and plot
+    print(f"model={model}")
+    df_full_order = pd.DataFrame()
+    df_full_vb = pd.DataFrame()
 
-        df_full_trades = df_full_order[df_full_order.entry_exit_type != 'entry order']
+    for df_vb in ls_split_vb:
+        df_order = calculate_orders(df_vb, model)
+        calculate_return(df_order)
 
-        merged_left = pd.merge(left=all_dates, right=df_full_trades, how='left', left_on='date',right_on='date')
-        merged_left['return'] = merged_left['return'].fillna(0)
-        
-        daily_df = merged_left[["date", "return"]].groupby("date", group_keys=True).sum()
-        n_days = len(daily_df)
-        
-        monthly_df = merged_left[["month", "return"]].groupby("month", group_keys=True).sum()
-        
-        rf = get_daily_risk_free_return()
-        
-        rf_montly = get_monthly_risk_free_return()
-        
-        sharpe = sharpe_ratio(monthly_df['return'], 12, rf_montly)    
-        sortino = sortino_ratio(monthly_df['return'], 12, rf_montly)
-        max_dd = max_drawdown(daily_df['return'])    
-        
-        #daily_df.to_csv("daily_return_vb_v6_3880_%s.csv" % get_model_str(model), index=False) 
+        df_full_order = pd.concat([df_full_order, df_order], ignore_index=True)
+        df_full_vb = pd.concat([df_full_vb, df_vb], ignore_index=True)
+
+    start_date = config["data"]["start_date"]
+    end_date = config["data"]["end_date"]
+    metrics = get_order_metrics(df_full_order, [(start_date, end_date)])
+    
+    plot_cumulative_return(model, df_full_order, df_full_vb)
 
+    df_full_order.to_csv("order_vb_v6_3880_%s.csv" % get_model_str(model), index=False)    
+    df_full_vb.to_csv("signal_vb_v6_3880_%s.csv" % get_model_str(model), index=False)
+    
+    summary_item_values={k: v for k, v in model.items() if v is not None}
+    summary_item_values["start_date"] = start_date
+    summary_item_values["end_date"] = end_date
+    summary_item_values.update(metrics)
+    return summary_item_values
 
-        total_pnl = df_full_trades["return"].sum()
-        total_dollar_pnl = df_full_trades["dollar_return"].sum()
-        
-        df_trades_by_entry = df_full_trades[["entry_id", "return"]].groupby("entry_id", group_keys=True).sum()
-        
-        win_trades = len(df_trades_by_entry[df_trades_by_entry["return"]>0])        
-        loss_trades = len(df_trades_by_entry[df_trades_by_entry["return"]<0])
-        
-        #df_trades_by_entry.to_csv("trade_by_entry_vb_v6_3880_%s.csv" % get_model_str(model), index=False)
-        
-        plot_cumulative_return(model)
 
-        df_full_order = df_full_order.drop(['date'], axis=1) 
-        df_full_order.to_csv("order_vb_v6_3880_%s.csv" % get_model_str(model), index=False)    
-        df_full_vb.to_csv("signal_vb_v6_3880_%s.csv" % get_model_str(model), index=False)
-        
-        summary_item_values={k: v for k, v in model.items() if v is not None}
-        summary_item_values["start_date"] = start_date
-        summary_item_values["end_date"] = end_date
-        summary_item_values["win_trades"] = win_trades
-        summary_item_values["loss_trades"] = loss_trades
-        summary_item_values["total_dollar_pnl"] = total_dollar_pnl
-        summary_item_values["sharpe"] = sharpe
-        summary_item_values["sortino"] = sortino
-        summary_item_values["max_dd"] = max_dd
-        summary_items.append(summary_item_values)
+def init_worker(ls_split_vb):
+    # forked workers get the splits as they are in the parent, without a copy
+    global split_vbs
+    split_vbs = ls_split_vb
+
+
+def evaluate_model_worker(model):
+    return evaluate_model(model, split_vbs)
+
+
+def run_models(models, ls_split_vb, workers=None):
+    # the summary rows of the models in their order, evaluated in parallel
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(models), 8)
+    if config['plots']['show_plots']:
+        # figures only show in this process
+        workers = 1
+    if workers <= 1:
+        return [evaluate_model(model, ls_split_vb) for model in models]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(ls_split_vb,)) as executor:
+        return list(executor.map(evaluate_model_worker, models))
+
 
+models = [{
+          'implementation': implementation,
+          "sl_multiples": sl_multiples
+          }
+          for implementation in config['model']['implementation']
+          for sl_multiples in config['model']['sl_multiples']
+        ]
+
+
+# In[ ]:
+# ### Walk-forward, anchored and k-fold evaluation
+#     python vb_v8_short_term_reverse_logic_basic.py --evaluate [walk_forward|anchored|kfold]
+# The features and signals are derived once over the whole range and a split is index ranges
+# into them, so the rolling windows are the same in every split. Every model runs once over
+# all bars, in parallel, and a range gets the trades entered on its bars, so positions carry
+# over range ends as they would live. A split picks the model with the best (daily) sharpe on
+# its train ranges, and the out-of-sample result is the test trades of the picks of all splits
+# together.
+
+# (b, ts_close) of process_orders over the whole range, set in the worker processes of run_evaluation
+order_inputs = None
+
+
+def get_bar_days(ts_close):
+    # the day of every bar, never going back (a bar can close on a late trade)
+    return np.maximum.accumulate(np.asarray(ts_close).astype('datetime64[D]'))
+
+
+def get_walk_forward_splits(ts_close, train_days, test_days, anchored):
+    # [([train ranges], test range)], ranges are (start, end) bar indexes; test windows of
+    # test_days one after the other, after train_days of bars (or all bars before, anchored)
+    a_day = get_bar_days(ts_close)
+    splits = []
+    test_day = a_day[0] + np.timedelta64(train_days, 'D')
+    while True:
+        i_test_start = int(np.searchsorted(a_day, test_day))
+        if i_test_start >= len(a_day):
+            break
+        i_test_end = int(np.searchsorted(a_day, test_day + np.timedelta64(test_days, 'D')))
+        i_train_start = 0 if anchored else int(np.searchsorted(a_day, test_day - np.timedelta64(train_days, 'D')))
+        splits.append(([(i_train_start, i_test_start)], (i_test_start, i_test_end)))
+        test_day += np.timedelta64(test_days, 'D')
+    return splits
+
+
+def get_kfold_splits(n, folds):
+    # every fold is the test range once, the others are the train ranges
+    bounds = [n * k // folds for k in range(folds + 1)]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    return [([train for train in ranges if train != test], test) for test in ranges]
+
+
+def get_model_orders(b, ts_close, model):
+    df_order = get_orders(b, ts_close, model)
+    calculate_return(df_order)
+    # the bar index of the entry (of ts_entry) on every row of the entry
+    s_entry_bar = df_order[df_order.entry_exit_type == 'entry order'].groupby('entry_id')['bar_seq'].first() - 1
+    df_order['entry_bar'] = df_order['entry_id'].map(s_entry_bar)
+    return df_order
+
+
+def init_evaluation_worker(t_order_inputs):
+    global order_inputs
+    order_inputs = t_order_inputs
+
+
+def model_orders_worker(model_idx):
+    return get_model_orders(*order_inputs, models[model_idx])
+
+
+def get_range_orders(df_order, ranges):
+    # the orders of the trades entered on the bars of ranges, exits after the range included
+    a_in_range = np.zeros(len(df_order), dtype=bool)
+    for start, end in ranges:
+        a_in_range |= (df_order['entry_bar'] >= start).to_numpy() & (df_order['entry_bar'] < end).to_numpy()
+    return df_order[a_in_range]
+
+
+def concat_orders(ls_orders):
+    # entry ids of different models overlap, offset so that their trades stay apart
+    ls_offset_orders = []
+    i_offset = 0
+    for df_order in ls_orders:
+        ls_offset_orders.append(df_order.assign(entry_id=df_order['entry_id'] + i_offset))
+        if len(df_order):
+            i_offset += int(df_order['entry_id'].max())
+    return pd.concat(ls_offset_orders, ignore_index=True)
+
+
+def get_range_dates(ts_close, ranges, df_order=None):
+    # the days of the bars of ranges, to the last exit of the trades entered on them
+    a_day = get_bar_days(ts_close)
+    range_dates = []
+    for start, end in ranges:
+        if end <= start:
+            continue
+        end_day = a_day[end - 1]
+        if df_order is not None:
+            df_range_order = get_range_orders(df_order, [(start, end)])
+            if len(df_range_order):
+                end_day = max(end_day, pd.to_datetime(df_range_order['ts_close']).max().to_datetime64().astype('datetime64[D]'))
+        range_dates.append((a_day[start], end_day))
+    return range_dates
+
+
+def run_evaluation(scheme, workers=None):
+    d_evaluation = config['evaluation']
+    if scheme not in ('kfold', 'walk_forward', 'anchored'):
+        raise ValueError(f"unknown evaluation scheme {scheme}")
+    if scheme == 'kfold' and d_evaluation['folds'] < 2:
+        raise ValueError(f"kfold needs at least 2 folds, not {d_evaluation['folds']}")
+    ls_bars = []
+
+    def f_bars():
+        if not ls_bars:
+            ls_bars.append(read_data())
+        return ls_bars[0]
+
+    df_vb = get_features(0, f_bars, 1)
+    calculate_signal(df_vb)
+    b, ts_close = get_order_inputs(df_vb)
+
+    if scheme == 'kfold':
+        splits = get_kfold_splits(len(b), d_evaluation['folds'])
+    else:
+        splits = get_walk_forward_splits(ts_close, d_evaluation['train_days'], d_evaluation['test_days'],
+                                         scheme == 'anchored')
+    # a gap in the bars (or more folds than bars) can leave ranges empty, a split needs bars
+    # to train and to test on
+    i_splits = len(splits)
+    splits = [([(start, end) for start, end in train_ranges if end > start], test_range)
+              for train_ranges, test_range in splits]
+    splits = [(train_ranges, test_range) for train_ranges, test_range in splits
+              if train_ranges and test_range[1] > test_range[0]]
+    if len(splits) < i_splits:
+        print(f"{scheme}: skipped {i_splits - len(splits)} splits without train or test bars")
+    if not splits:
+        raise ValueError(f"no {scheme} split fits in {len(b)} bars")
+
+    # every model runs once over all bars, the splits take their ranges of its orders
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(models), 8)
+    print(f"{scheme}: {len(splits)} splits, {len(models)} model runs in {workers} processes")
+    if workers <= 1:
+        ls_model_orders = [get_model_orders(b, ts_close, model) for model in models]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_evaluation_worker,
+                                 initargs=((b, ts_close),)) as executor:
+            ls_model_orders = list(executor.map(model_orders_worker, range(len(models))))
+
+    split_items = []
+    ls_picked_orders = []
+    ls_picked_dates = []
+    for split_idx, (train_ranges, test_range) in enumerate(splits):
+        train_dates = get_range_dates(ts_close, train_ranges)
+        test_dates = get_range_dates(ts_close, [test_range])
+        ls_split_items = []
+        ls_test_dates = []
+        for model_idx, model in enumerate(models):
+            df_model_order = ls_model_orders[model_idx]
+            train_metrics = get_order_metrics(get_range_orders(df_model_order, train_ranges),
+                                              get_range_dates(ts_close, train_ranges, df_model_order), True)
+            ls_test_dates.append(get_range_dates(ts_close, [test_range], df_model_order))
+            test_metrics = get_order_metrics(get_range_orders(df_model_order, [test_range]), ls_test_dates[-1], True)
+            split_item_values = {"split": split_idx,
+                                 "train_start": min(start for start, end in train_dates),
+                                 "train_end": max(end for start, end in train_dates),
+                                 "test_start": test_dates[0][0], "test_end": test_dates[0][1]}
+            split_item_values.update({k: v for k, v in model.items() if v is not None})
+            split_item_values["train_sharpe"] = train_metrics["sharpe"]
+            split_item_values.update(test_metrics)
+            ls_split_items.append(split_item_values)
+
+        # a nan sharpe (no trades) is never picked over a number
+        picked_idx = max(range(len(models)), key=lambda model_idx: (not np.isnan(ls_split_items[model_idx]["train_sharpe"]),
+                                                                    ls_split_items[model_idx]["train_sharpe"]))
+        for model_idx, split_item_values in enumerate(ls_split_items):
+            split_item_values["picked"] = model_idx == picked_idx
+        ls_picked_orders.append(get_range_orders(ls_model_orders[picked_idx], [test_range]))
+        ls_picked_dates += ls_test_dates[picked_idx]
+        split_items += ls_split_items
+        print(f"split {split_idx}: test {test_dates[0][0]} - {test_dates[0][1]}, picked {models[picked_idx]}, "
+              f"test sharpe {ls_split_items[picked_idx]['sharpe']:.3f}")
+
+    split_df = pd.DataFrame(split_items)
+
+    # per model over the test ranges of all splits, and the picks out of sample
+    model_keys = list(models[0].keys())
+    aggregate_df = split_df.groupby(model_keys, sort=False).agg(
+        splits=("split", "count"), picked=("picked", "sum"), mean_sharpe=("sharpe", "mean"),
+        std_sharpe=("sharpe", "std"), mean_sortino=("sortino", "mean"), worst_max_dd=("max_dd", "min"),
+        win_trades=("win_trades", "sum"), loss_trades=("loss_trades", "sum"),
+        total_dollar_pnl=("total_dollar_pnl", "sum")).reset_index()
+    picked_metrics = get_order_metrics(concat_orders(ls_picked_orders), ls_picked_dates, True)
+    print(aggregate_df)
+    print(f"out of sample, picked model per split: {picked_metrics}")
+
+    start_date = pd.to_datetime(config['data']['start_date']).strftime('%Y%m%d')
+    end_date = pd.to_datetime(config['data']['end_date']).strftime('%Y%m%d')
+    split_df.to_csv(f"evaluation_{scheme}_vb_v6_3880_{start_date}_{end_date}.csv", index=False)
+    aggregate_df = pd.concat([aggregate_df, pd.DataFrame([dict({key: "picked" for key in model_keys},
+                                                                splits=len(splits), **picked_metrics)])],
+                             ignore_index=True)
+    aggregate_df.to_csv(f"evaluation_{scheme}_summary_vb_v6_3880_{start_date}_{end_date}.csv", index=False)
+    return split_df, aggregate_df
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--check':
+        check_process_orders()
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        benchmark_process_orders(*[int(arg) for arg in sys.argv[2:3]])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--evaluate':
+        run_evaluation(sys.argv[2] if len(sys.argv) > 2 else 'walk_forward', config['workers'])
+        return
+
+    # bars and signals are the same for every model, derived once
+    ls_bars = []
+
+    def f_bars():
+        if not ls_bars:
+            ls_bars.append(read_data())
+        return ls_bars[0]
+
+    ls_split_vb = []
+    for split_idx in range(config['data']['split_cnt']):
+        df_vb = get_features(split_idx, f_bars)
+        calculate_signal(df_vb)
+        ls_split_vb.append(df_vb)
+
+    summary_items = run_models(models, ls_split_vb, config['workers'])
       
-summary_df = pd.DataFrame(summary_items)
+    summary_df = pd.DataFrame(summary_items)
 
-print(summary_df)
+    print(summary_df)
 
+    start_date = pd.to_datetime(config['data']['start_date']).strftime('%Y%m%d')
+    end_date = pd.to_datetime(config['data']['end_date']).strftime('%Y%m%d')
 
-# In[295]:
+    summary_df = summary_df.sort_values(by=['sharpe'], ascending=False)
+    summary_df.to_csv(f"summary_vb_v6_3880_{start_date}_{end_date}.csv", index=False)
 
-start_date = pd.to_datetime(config['data']['start_date']).strftime('%Y%m%d')
-end_date = pd.to_datetime(config['data']['end_date']).strftime('%Y%m%d')
 
-summary_df = summary_df.sort_values(by=['sharpe'], ascending=False)
-summary_df.to_csv(f"summary_vb_v6_3880_{start_date}_{end_date}.csv", index=False)
+if __name__ == '__main__':
+    main()